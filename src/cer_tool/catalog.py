@@ -0,0 +1,186 @@
+import hashlib
+import io
+import os
+import sqlite3
+import unicodedata
+import zipfile
+from collections import defaultdict
+from datetime import datetime
+from os import PathLike
+from pathlib import Path, PurePosixPath
+from typing import Dict, Iterable, List, Tuple
+
+from platformdirs import user_data_path
+
+from cer_tool import util, config
+
+
+_DB_PATH: Path = user_data_path("cer-tool", ensure_exists=True) / "catalog.sqlite3"
+
+_SCHEMA: str = """
+CREATE TABLE IF NOT EXISTS exports (
+    export TEXT PRIMARY KEY,
+    fingerprint TEXT NOT NULL,
+    content_hash TEXT NOT NULL,
+    indexed TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS submissions (
+    export TEXT NOT NULL REFERENCES exports(export) ON DELETE CASCADE,
+    folder TEXT NOT NULL,
+    moodle_id TEXT NOT NULL,
+    name TEXT NOT NULL,
+    PRIMARY KEY (export, folder)
+);
+CREATE TABLE IF NOT EXISTS notebooks (
+    export TEXT NOT NULL REFERENCES exports(export) ON DELETE CASCADE,
+    folder TEXT NOT NULL,
+    notebook TEXT NOT NULL,
+    PRIMARY KEY (export, folder, notebook)
+);
+"""
+
+# same limit as for extracting nested archives
+_MAX_NESTING: int = 10
+
+
+def normalize_name(name: str) -> str:
+    # "Max  Müller" → "max muller", s.t. names from groups files match the folder names of the export
+    ascii_name = unicodedata.normalize("NFKD", name).encode("ascii", "ignore").decode()
+    return " ".join(ascii_name.lower().split())
+
+
+def _connect() -> sqlite3.Connection:
+    connection = sqlite3.connect(_DB_PATH)
+    connection.execute("PRAGMA foreign_keys = ON")
+    connection.executescript(_SCHEMA)
+    return connection
+
+
+def _fingerprint(export: Path) -> str:
+    stat = export.stat()
+    if export.is_dir():
+        # new or replaced submission folders change the modification times of the top level
+        entries = list(os.scandir(export))
+        latest = max([stat.st_mtime_ns] + [entry.stat().st_mtime_ns for entry in entries])
+        return f"dir:{len(entries)}:{latest}"
+    return f"file:{stat.st_size}:{stat.st_mtime_ns}"
+
+
+def _content_hash(export: Path) -> str:
+    if export.is_dir():
+        return ""
+    with open(export, "rb") as f:
+        return hashlib.file_digest(f, "sha256").hexdigest()
+
+
+def _list_zip(zip: zipfile.ZipFile, prefix: PurePosixPath, level: int = 0) -> Iterable[PurePosixPath]:
+    for name in zip.namelist():
+        member = prefix / name
+        yield member
+        # nested zip archives are extracted next to themselves by 'extract_all_within'
+        if member.suffix == ".zip" and level < _MAX_NESTING:
+            try:
+                with zipfile.ZipFile(io.BytesIO(zip.read(name))) as nested:
+                    yield from _list_zip(nested, member.with_suffix(""), level + 1)
+            except zipfile.BadZipFile:
+                util.warning(f"Nested archive '{member}' could not be read.", "Its content will not be indexed.")
+
+
+def _list_export(export: Path) -> Iterable[PurePosixPath]:
+    if export.is_dir():
+        for folder, _, files in os.walk(export):
+            relative = PurePosixPath(Path(folder).relative_to(export).as_posix())
+            yield from (relative / file for file in files)
+    elif zipfile.is_zipfile(export):
+        with zipfile.ZipFile(export) as zip:
+            yield from _list_zip(zip, PurePosixPath("."))
+    else:
+        util.warning(f"Submissions '{export}' cannot be indexed (only folders and zip files are supported).",
+                     "Submissions will be searched on each use instead.")
+
+
+def _scan(export: Path) -> Tuple[Dict[str, Tuple[str, str]], Dict[str, List[str]]]:
+    submission_keyword = config.snapshot().moodle.submission_keyword
+    # folder → (moodle id, normalized name) and folder → notebooks
+    submissions: Dict[str, Tuple[str, str]] = {}
+    notebooks: Dict[str, List[str]] = defaultdict(list)
+
+    for member in _list_export(export):
+        parts = member.parts
+        # submission folders are named "<name>_<id>_assignsubmission_file"
+        index = next((i for i, part in enumerate(parts[:-1]) if submission_keyword in part), None)
+        if index is None:
+            continue
+        folder = PurePosixPath(*parts[:index + 1]).as_posix()
+        if folder not in submissions:
+            name_split = parts[index].split("_")
+            if len(name_split) < 3:
+                continue
+            submissions[folder] = (name_split[1], normalize_name(name_split[0]))
+        if member.suffix == ".ipynb" and not member.name.endswith("-checkpoint.ipynb") \
+                and not member.name.startswith("._"):
+            notebooks[folder].append(PurePosixPath(*parts[index + 1:]).as_posix())
+
+    return submissions, notebooks
+
+
+class Catalog:
+    """Submission folders of a Moodle export by Moodle id and name, kept on disk until the export changes."""
+
+    def __init__(self, export: str | PathLike[str], rebuild: bool = False) -> None:
+        self.export = Path(export).resolve()
+        self.by_id: Dict[str, List[str]] = defaultdict(list)
+        self.by_name: Dict[str, List[str]] = defaultdict(list)
+        self.notebooks: Dict[str, List[str]] = defaultdict(list)
+
+        connection = _connect()
+        key = str(self.export)
+        fingerprint = _fingerprint(self.export)
+        row = connection.execute("SELECT fingerprint, content_hash FROM exports WHERE export = ?", (key,)).fetchone()
+
+        if row is not None and not rebuild and row[0] != fingerprint:
+            # e.g. a copied or re-downloaded archive with the same content
+            content_hash = _content_hash(self.export)
+            if content_hash and content_hash == row[1]:
+                connection.execute("UPDATE exports SET fingerprint = ? WHERE export = ?", (fingerprint, key))
+                row = (fingerprint, content_hash)
+
+        if row is None or rebuild or row[0] != fingerprint:
+            self._build(connection, key, fingerprint)
+        else:
+            util.info(f" CATALOG: using index of '{self.export}'")
+
+        for folder, moodle_id, name in connection.execute(
+                "SELECT folder, moodle_id, name FROM submissions WHERE export = ?", (key,)):
+            self.by_id[moodle_id].append(folder)
+            self.by_name[name].append(folder)
+        for folder, notebook in connection.execute(
+                "SELECT folder, notebook FROM notebooks WHERE export = ? ORDER BY notebook", (key,)):
+            self.notebooks[folder].append(notebook)
+        connection.commit()
+        connection.close()
+
+    def _build(self, connection: sqlite3.Connection, key: str, fingerprint: str) -> None:
+        submissions, notebooks = _scan(self.export)
+
+        connection.execute("DELETE FROM exports WHERE export = ?", (key,))
+        connection.execute("INSERT INTO exports VALUES (?, ?, ?, ?)",
+                           (key, fingerprint, _content_hash(self.export), datetime.now().isoformat(timespec="seconds")))
+        connection.executemany("INSERT INTO submissions VALUES (?, ?, ?, ?)",
+                               [(key, folder, moodle_id, name) for folder, (moodle_id, name) in submissions.items()])
+        connection.executemany("INSERT INTO notebooks VALUES (?, ?, ?)",
+                               [(key, folder, notebook) for folder, files in notebooks.items() for notebook in files])
+        util.info(f" CATALOG: indexed {len(submissions)} submissions of '{self.export}'")
+
+    def __len__(self) -> int:
+        return sum(map(len, self.by_id.values()))
+
+    def folders_by_name(self, name: str, root: str | PathLike[str]) -> List[Path]:
+        return [Path(root) / folder for folder in self.by_name.get(normalize_name(name), [])]
+
+    def folders_by_id(self, id: int | str, root: str | PathLike[str]) -> List[Path]:
+        return [Path(root) / folder for folder in self.by_id.get(str(id), [])]
+
+    def notebooks_of(self, folder: Path, root: str | PathLike[str]) -> List[Path]:
+        relative = folder.relative_to(root).as_posix()
+        return [folder / notebook for notebook in self.notebooks.get(relative, [])]
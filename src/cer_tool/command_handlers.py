@@ -1,9 +1,17 @@
 import itertools
+import re
+import subprocess
+import sys
+import time
 from argparse import Namespace
 from functools import reduce
 from pathlib import Path
+from typing import Dict, List
 
-from cer_tool import config, file_mgmt, grading_sheet, util, pex_grading
+from cer_tool import config, daemon_client, file_mgmt, grading_sheet, util, pdf_optimizer, pex_grading, progress, results_db, roster, similarity, upload_guard
+from cer_tool import pex_report as report_mod
+from cer_tool.catalog import Catalog
+from cer_tool.job_queue import JobQueue
 
 
 def prepare(args: Namespace) -> None:
@@ -13,28 +21,50 @@ def prepare(args: Namespace) -> None:
 
     file_mgmt.check_path(path_groups)
     file_mgmt.check_path(path_submissions)
+    file_mgmt.register_cleanup()
 
-    # extract if needed
-    extracted_submissions = file_mgmt.unzip_if_not_folder(path_submissions)
+    # look up submission folders without searching the export
+    catalog = Catalog(path_submissions)
+
+    # extract if needed, oversized or irrelevant files are not extracted
+    guarded = []
+    extracted_submissions = file_mgmt.unzip_if_not_folder(path_submissions, guarded)
 
     # parse groups
     groups = file_mgmt.parse_groups_file(path_groups)
 
-    # copy
-    extracted = file_mgmt.extract_theoretical_submissions(groups, extracted_submissions, path_out)
+    # copy, students resolved in earlier exercises are looked up by their id
+    known_ids = roster.load(path_groups)
+    extracted, unchanged, held_back = file_mgmt.extract_theoretical_submissions(groups, extracted_submissions, path_out, catalog,
+                                                                     args.jobs, guarded, known_ids)
+    roster.save(path_groups, known_ids)
     file_mgmt.cleanup()
-    util.info(f"Successfully extracted {len(extracted)} of {reduce(lambda acc, group: acc + len(group), groups, 0)} submissions to '{path_out}'", always_display=True)
+    util.info(f"Successfully extracted {len(extracted)} of {reduce(lambda acc, group: acc + len(group), groups, 0)} submissions to '{path_out}'"
+              + (f" ({len(unchanged)} unchanged since the last run)" if unchanged else ""), always_display=True)
+    if (rate := progress.throughput("extracted_bytes")) is not None:
+        util.info(f"Extracted archives at {rate / 1e6:.1f} MB/s.", always_display=True)
+    if held_back:
+        util.warning(f"All files of {len(held_back)} student/s were held back by the upload guard: {', '.join(held_back)}",
+                     "Their files are listed above, please check whether they have to be graded")
 
 
 def edit_feedback(args: Namespace) -> None:
     path_grading_sheet: str = args.grading_sheet
+    path_groups: str | None = args.groups
     keyword: str = ' '.join(args.student_name)
     out: str = args.out or args.grading_sheet
 
+    if not keyword and not path_groups:
+        util.error("Please specify the name of a student or a groups file (-g)")
+
     file_mgmt.check_path(path_grading_sheet)
 
     gs = grading_sheet.GradingSheet(path_grading_sheet)
 
+    if path_groups or args.all:
+        _edit_feedback_batch(gs, path_groups, keyword, out)
+        return
+
     # find/select student
     id = gs.select_participant(keyword)
 
@@ -44,8 +74,7 @@ def edit_feedback(args: Namespace) -> None:
     file_mgmt.create_file(config.get("filenames.edit_feedback_file"), [info_line] + feedback_current)
 
     # open text editor to edit feedback
-    file_mgmt.open_file(config.get("filenames.edit_feedback_file"))
-    file_mgmt.open_file(config.get("filenames.edit_feedback_file"))
+    util.open_file(config.get("filenames.edit_feedback_file"))
 
     # wait until the user has finished
     util.wait_for_user("Please edit the comment, save the file and press ENTER to continue...")
@@ -63,6 +92,60 @@ def edit_feedback(args: Namespace) -> None:
     gs.save(out)
 
 
+# header of each student's section in the batch feedback file, the id is used to map the section back
+_SECTION_HEADER = re.compile(r"^# === .* \(id: (\d+)[,)].* ===$")
+
+
+def _edit_feedback_batch(gs: grading_sheet.GradingSheet, path_groups: str | None, keyword: str, out: str) -> None:
+    if path_groups:
+        file_mgmt.check_path(path_groups)
+        members = itertools.chain(*file_mgmt.parse_groups_file(path_groups))
+        member_ids = roster.resolve(path_groups, [member for member in members if keyword.lower() in member.lower()], gs)
+        ids = list(member_ids.values())
+    else:
+        ids = [int(participant[0]) for participant in gs.find_participants(keyword)]
+    if not ids:
+        util.error(f"No participant named '*{keyword}*' found")
+
+    # write all comments into a single file, one section per student
+    feedback_current = {id: gs.get_comment(id) for id in ids}
+    lines = [f"# Editing comments for {len(ids)} students. Lines starting with '#' are ignored, "
+             f"please do not change the '# ===' lines."]
+    for id, comment in feedback_current.items():
+        lines += ["", f"# === {gs.get_name(id)} (id: {id}, {gs.get_points(id) or 'N/A'} points) ==="] + comment
+    file_mgmt.create_file(config.get("filenames.edit_feedback_file"), lines)
+
+    util.open_file(config.get("filenames.edit_feedback_file"))
+    util.wait_for_user("Please edit the comments, save the file and press ENTER to continue...")
+
+    # parse all sections in a single pass
+    feedback_new: Dict[int, List[str]] = {}
+    current_id = None
+    for line in file_mgmt.read_file(config.get("filenames.edit_feedback_file")):
+        if match := _SECTION_HEADER.match(line):
+            current_id = int(match.group(1))
+            feedback_new[current_id] = []
+        elif current_id is not None and len(line) > 0 and not line.startswith('#'):
+            feedback_new[current_id].append(line)
+    file_mgmt.delete_file(config.get("filenames.edit_feedback_file"))
+
+    # apply changed comments only and save once
+    updates: Dict[int, grading_sheet.Update] = {}
+    for id, feedback in feedback_new.items():
+        if id not in feedback_current:
+            util.warning(f"Section for unknown id {id} in the feedback file.", "Section will be ignored.")
+            continue
+        if grading_sheet.encode_comment(feedback) != grading_sheet.encode_comment(feedback_current[id]):
+            updates[id] = grading_sheet.Update(comment=feedback)
+
+    if not updates:
+        util.warning("No changes to the comments.")
+        return
+    gs.apply_updates(updates)
+    gs.save(out)
+    util.info(f"Updated comments of {len(updates)} of {len(ids)} students.", always_display=True)
+
+
 def finish(args: Namespace) -> None:
     path_groups: str = args.groups
     path_grading_sheet: str = args.grading_sheet
@@ -77,54 +160,71 @@ def finish(args: Namespace) -> None:
     file_mgmt.check_path(path_groups)
     file_mgmt.check_path(path_grading_sheet)
     file_mgmt.check_path(path_feedback)
+    file_mgmt.register_cleanup()
 
     gs = grading_sheet.GradingSheet(path_grading_sheet)
     groups = file_mgmt.parse_groups_file(path_groups)
     members = list(itertools.chain(*groups))
-
-    # create a temporary folder for feedback files
-    feedback_folder = file_mgmt.create_temporary_folder()
+    member_ids = roster.resolve(path_groups, members, gs)
+    # files submitted identically by several students, created by 'prepare'
+    duplicates = file_mgmt.load_duplicates(path_feedback)
+    # scan the feedback folder once, points and files of each student are looked up afterwards
+    feedback = file_mgmt.find_all_feedback_files(path_feedback, duplicates, submission_name)
+    points_per_student = feedback.groupby("student_id")["points"].sum().to_dict()
+    files_per_student = {student_id: list(zip(files["path"], files["filename"]))
+                         for student_id, files in feedback.groupby("student_id")}
+    # annotated PDFs are optimized in the background, if enabled
+    optimized = pdf_optimizer.optimize_all([Path(file) for files in files_per_student.values() for file, _ in files],
+                                           args.jobs)
 
     processed_successfully = 0
-    updated_ids = []
-    for member in members:
-        # get member's id
-        id = gs.select_participant(member)
-
-        # process member's points
-        points = file_mgmt.get_points_from_path(str(id), path_feedback)
-        if points is None:
-            util.warning(f"Got not points for student '{member}' (id: {id}).", "Student will be skipped.")
-            continue
-
-        # process feedback file/s
-        files_copied = file_mgmt.copy_feedback_files(str(id), path_feedback, feedback_folder, submission_name)
-        if files_copied == 0:
-            util.warning(f"No feedback files copied for student '{member}' (id: {id}).", "Student will be skipped.")
-            continue
-
-        # insert points and feedback into the grading sheet
-        gs.set_points(id, points)
-        feedback_footer = config.get("moodle.feedback_footer")
-        feedback_footer_with_initials = list(map(lambda s: s.format(config.get("initials")), feedback_footer))
-        gs.append_comment(id, feedback_footer_with_initials)
-
-        processed_successfully += 1
-        updated_ids.append(id)
-        util.info(f"Successfully processed student {member:>25} (id: {id}): Found {points:6.2f} points, copied {files_copied} file/s.", True)
-
-    util.info("", True)
-    util.info(f"{processed_successfully} of {len(members)} students processed successfully.", True)
-
-    # save changes to the grading sheet
-    gs.filter(updated_ids)
-    gs.save(out_grading_sheet)
+    updates: Dict[int, grading_sheet.Update] = {}
+    progress.start("finish", len(members))
+    # feedback files are zipped in the background while the remaining students are processed
+    with file_mgmt.ZipPartWriter(out_feedback) as feedback_zip:
+        for member in members:
+            id = member_ids[member]
+
+            # process member's points
+            points = points_per_student.get(str(id))
+            if points is None:
+                util.warning(f"Got not points for student '{member}' (id: {id}).", "Student will be skipped.")
+                progress.advance("finish")
+                continue
+
+            # process feedback file/s
+            feedback_files = files_per_student.get(str(id), [])
+            if not feedback_files:
+                util.warning(f"No feedback files found for student '{member}' (id: {id}).", "Student will be skipped.")
+                progress.advance("finish")
+                continue
+            for file, filename in feedback_files:
+                future = optimized.get(Path(file))
+                feedback_zip.add(future.result() if future else file, filename)
+
+            # points and feedback are inserted into the grading sheet at once
+            updates[id] = grading_sheet.Update(points, append=list(config.snapshot().moodle.feedback_footer_with_initials))
+
+            processed_successfully += 1
+            # after waiting for the optimized files, s.t. the rate includes the time spent on the student
+            progress.advance("finish")
+            util.info(f"Successfully processed student {member:>25} (id: {id}): Found {points:6.2f} points, copied {len(feedback_files)} file/s ({progress.summary('finish', 'students')}).", True)
+
+        util.info("", True)
+        util.info(f"{processed_successfully} of {len(members)} students processed successfully.", True)
+
+        # save changes to the grading sheet
+        gs.apply_updates(updates)
+        gs.filter(list(updates))
+        gs.save(out_grading_sheet)
 
-    # create a zip file with feedback files and cleanup
-    util.info("", True)
-    util.info("Creating zip file/s...", True)
-    created_zips = file_mgmt.zip_folder_with_limit(feedback_folder, out_feedback)
-    util.info(f"{created_zips} zip files created.", True)
+        # finish the zip file/s with feedback files
+        util.info("", True)
+        util.info("Finishing zip file/s...", True)
+        created_zips = feedback_zip.close()
+        util.info(f"{created_zips} zip files created.", True)
+        if (rate := progress.throughput("zipped_bytes")) is not None:
+            util.info(f"Compressed feedback files at {rate / 1e6:.1f} MB/s.", True)
     file_mgmt.cleanup()
 
 
@@ -137,31 +237,68 @@ def grade_pex(args: Namespace) -> None:
         out_grading_sheet: Path = Path(args.out_grading_sheet)
     else:
         out_grading_sheet: Path = path_grading_sheet
+    file_mgmt.register_cleanup()
 
-    grader = pex_grading.PexGrader(path_grading_package)
+    if args.queue is not None:
+        grader = pex_grading.QueuedGrader(path_grading_package, JobQueue(args.queue))
+    elif args.look_ahead > 0:
+        grader = pex_grading.LookAheadGrader(pex_grading.PexGrader(path_grading_package), args.look_ahead)
+    else:
+        grader = pex_grading.PexGrader(path_grading_package)
     gs = grading_sheet.GradingSheet(path_grading_sheet)
     groups = file_mgmt.parse_groups_file(path_groups)
-    member_ids = dict(map(lambda name: (name, gs.select_participant(name)), list(itertools.chain(*groups)) ))
+    member_ids = roster.resolve(path_groups, list(itertools.chain(*groups)), gs)
     gs.filter(list(member_ids.values()))
 
     # extract submissions
-    path_submissions = file_mgmt.unzip_if_not_folder(path_submissions)
-    file_mgmt.extract_all_within(path_submissions)
+    catalog = Catalog(path_submissions)
+    # notebooks are extracted regardless of their size
+    guarded = []
+    path_submissions = file_mgmt.unzip_if_not_folder(path_submissions, guarded, keep_patterns=("*.ipynb",))
+    file_mgmt.extract_all_within(path_submissions, guarded=guarded, keep_patterns=("*.ipynb",))
+    upload_guard.report(guarded, "Files were not extracted")
 
-    updated_grades = 0
-    for i, group in enumerate(groups):
-        title = f"Grading group {i + 1} of {len(groups)} ({i / len(groups) * 100:.0f} % done)"
-        updated_grades += pex_grading.grade_pex_group(group,
-                                                      list(map(lambda name: member_ids[name], group)),
-                                                      path_submissions, grader, gs,
-                                                      console_header=f"{title}\n{len(title) * '─'}")
+    group_ids = list(map(lambda group: list(map(lambda name: member_ids[name], group)), groups))
+    submissions = list(map(lambda ids: file_mgmt.find_pex_submission(ids[0], path_submissions, catalog), group_ids))
 
-        gs.save(out_grading_sheet)
-        if i != len(groups) - 1:
-            util.info("", always_display=True)
-            answer = util.choose_option({"y", "n"}, "y", "Continue with the next group?")
-            if answer != "y":
-                break
+    # let the workers grade all groups in advance
+    if isinstance(grader, pex_grading.QueuedGrader):
+        for submission in submissions:
+            grader.submit(submission)
+
+    course = results_db.course_key(gs.path)
+    pex_grading.record_max_points(grader, course)
+
+    updated_grades = 0
+    # loaded once, the ids of the groups graded below are added
+    graded_ids = results_db.load_graded_ids(course, grader.pex_name)
+    progress.start("grade-pex", len(groups))
+    try:
+        for i, group in enumerate(groups):
+            # grade this and the next ungraded groups in the background
+            if isinstance(grader, pex_grading.LookAheadGrader):
+                ungraded = (submissions[j] for j in range(i, len(groups))
+                            if not pex_grading.has_feedback(group_ids[j], gs, grader.pex_name, graded_ids))
+                grader.schedule(list(itertools.islice(ungraded, args.look_ahead + 1)))
+
+            title = f"Grading group {i + 1} of {len(groups)} ({progress.summary('grade-pex', 'groups')})"
+            if (runtime := progress.mean_seconds("docker_runs")) is not None:
+                title += f", tests take {runtime:.0f} s on average"
+            updated_grades += pex_grading.grade_pex_group(group, group_ids[i], submissions[i], grader, gs,
+                                                          console_header=f"{title}\n{len(title) * '─'}")
+            graded_ids.update(group_ids[i])
+            progress.advance("grade-pex")
+
+            gs.save(out_grading_sheet)
+            if i != len(groups) - 1:
+                util.info("", always_display=True)
+                answer = util.choose_option({"y", "n"}, "y", "Continue with the next group?")
+                if answer != "y":
+                    break
+    finally:
+        # stop gradings still running in the background, e.g. after aborting
+        if isinstance(grader, pex_grading.LookAheadGrader):
+            grader.cancel_all()
 
     util.clear_console()
     util.info(f"Grading finished. Updated {updated_grades} of {len(member_ids)} grades.", always_display=True)
@@ -172,6 +309,73 @@ def grade_pex(args: Namespace) -> None:
     file_mgmt.cleanup()
 
 
+def index(args: Namespace) -> None:
+    path_submissions: Path = file_mgmt.check_path(args.submissions)
+
+    catalog = Catalog(path_submissions, rebuild=args.rebuild)
+    util.info(f"Catalog of '{path_submissions}' contains {len(catalog)} submissions "
+              f"({sum(map(len, catalog.notebooks.values()))} notebooks).", always_display=True)
+
+
+def pex_worker(args: Namespace) -> None:
+    path_grading_package: Path = file_mgmt.check_path(args.grading_package)
+    file_mgmt.register_cleanup()
+
+    grader = pex_grading.PexGrader(path_grading_package)
+    try:
+        pex_grading.run_worker(grader, JobQueue(args.queue))
+    finally:
+        # other workers may still use the image
+        grader.cleanup(remove_image=False)
+
+
+def pex_report(args: Namespace) -> None:
+    exercises: List[str] | None = args.exercise
+    out: str | None = args.out
+
+    gradings, test_results = results_db.load_frames(exercises)
+    if gradings.empty:
+        util.error(f"No gradings found for exercise/s {', '.join(exercises)}" if exercises else "No gradings found")
+
+    util.info(report_mod.create_report(gradings, test_results), always_display=True, append_full_stop=False)
+
+    if out:
+        report_mod.export(gradings, test_results, out)
+        util.info(f"Exported {len(test_results)} test results to '{out}'.", always_display=True)
+
+
+def pex_similarity(args: Namespace) -> None:
+    path_submissions: Path = file_mgmt.check_path(args.submissions)
+    exercise: str = args.exercise
+    threshold: float = args.threshold
+    template: Path | None = file_mgmt.check_path(args.ignore_template) if args.ignore_template else None
+    path_groups: Path | None = file_mgmt.check_path(args.groups) if args.groups else None
+    file_mgmt.register_cleanup()
+
+    # extract submissions
+    # notebooks are extracted regardless of their size
+    guarded = []
+    path_submissions = file_mgmt.unzip_if_not_folder(path_submissions, guarded, keep_patterns=("*.ipynb",))
+    file_mgmt.extract_all_within(path_submissions, guarded=guarded, keep_patterns=("*.ipynb",))
+    upload_guard.report(guarded, "Files were not extracted")
+
+    notebooks = similarity.find_notebooks(path_submissions)
+    new_signatures = similarity.update_index(exercise, notebooks, template)
+    util.info(f"Indexed {new_signatures} new of {len(notebooks)} notebooks found for {exercise}.", always_display=True)
+
+    # notebooks shared within a group are not reported
+    groups = file_mgmt.parse_groups_file(path_groups) if path_groups else None
+    ids = roster.load(path_groups) if path_groups else None
+    clusters = similarity.find_clusters(exercise, threshold, template, groups, ids)
+    util.info("", always_display=True)
+    if not clusters:
+        util.info(f"No suspiciously similar notebooks found (threshold: {threshold:.2f}).", always_display=True)
+    for max_similarity, labels in clusters:
+        util.info(f"Similarity up to {max_similarity:.2f}: {', '.join(labels)}", always_display=True, append_full_stop=False)
+
+    file_mgmt.cleanup()
+
+
 def config_list(_: Namespace):
     util.info(f"Current configuration:\n\n{config.as_str()}", always_display=True, append_full_stop=False)
 
@@ -203,4 +407,45 @@ def config_edit(_: Namespace):
     config.save()
     util.info("", always_display=True)
     util.info("Configuration saved.", always_display=True)
-    util.info(f"Updated configuration:\n\n{config.as_str()}", always_display=True, append_full_stop=False)
\ No newline at end of file
+    util.info(f"Updated configuration:\n\n{config.as_str()}", always_display=True, append_full_stop=False)
+
+def daemon_start(_: Namespace) -> None:
+    if not daemon_client.is_supported():
+        util.error("The daemon requires unix domain sockets, which are not supported on this platform.")
+    if daemon_client.is_running():
+        util.warning(f"The daemon is already running ('{daemon_client.SOCKET_PATH}').")
+        return
+
+    subprocess.Popen([sys.executable, "-m", "cer_tool.main", "daemon", "run"], start_new_session=True,
+                     stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    for _ in range(50):
+        if daemon_client.is_running():
+            util.info(f"Daemon started ('{daemon_client.SOCKET_PATH}')", always_display=True)
+            return
+        time.sleep(0.1)
+    util.error("The daemon did not start. Please run 'cer-tool daemon run' to see its output.")
+
+
+def daemon_run(_: Namespace) -> None:
+    if not daemon_client.is_supported():
+        util.error("The daemon requires unix domain sockets, which are not supported on this platform.")
+    if daemon_client.is_running():
+        util.error(f"The daemon is already running ('{daemon_client.SOCKET_PATH}').")
+
+    from cer_tool import daemon
+    daemon.serve()
+
+
+def daemon_stop(_: Namespace) -> None:
+    if not daemon_client.is_running():
+        util.warning("The daemon is not running.")
+        return
+    daemon_client.request("shutdown")
+    util.info("Daemon stopped", always_display=True)
+
+
+def daemon_status(_: Namespace) -> None:
+    if daemon_client.is_running():
+        util.info(f"The daemon is running ('{daemon_client.SOCKET_PATH}')", always_display=True)
+    else:
+        util.info("The daemon is not running", always_display=True)
@@ -1,12 +1,14 @@
+import copy
 import json
 import importlib.resources
+import re
 from jsonschema import validate
 from platformdirs import user_config_path
 from pathlib import Path
 
 from jsonschema.exceptions import ValidationError
 from importlib.resources.abc import Traversable
-from typing import Union, List, Tuple, Callable, Type
+from typing import Union, List, Tuple, Callable, Type, NamedTuple
 
 from cer_tool import util
 
@@ -14,15 +16,31 @@ from cer_tool import util
 _config: dict = {}
 # whether the configuration is valid or needs to be checked
 _verified: bool = False
+# immutable view on the verified configuration, see snapshot()
+_snapshot: 'ConfigSnapshot | None' = None
 
-type Config_Entry = Union[str, int, bool, List[str]]
+type Config_Entry = Union[str, int, float, bool, List[str]]
 
 _CONFIG_PATH: Path = user_config_path("cer-tool", ensure_exists=True) / "config.json"
 _CONFIG_SCHEMA_PATH: Traversable = importlib.resources.files("cer_tool").joinpath("config.schema.json")
 
+
+def _pattern_groups(pattern: str) -> int:
+    try:
+        return re.compile(pattern).groups
+    except re.error:
+        return 0
+
+
 _CONFIG_CHECKS : List[Tuple[Callable[[dict], bool], str]] = [
     (lambda c: c["initials"] != "???", "initials not set"),
     (lambda c: "{}" in c["filenames"]["tmp_folder"], "tmp folder filename must include a placeholder"),
+    (lambda c: c["scratch"]["budget_bytes"] >= 0, "scratch budget must not be negative"),
+    (lambda c: c["upload_guard"]["max_file_bytes"] > 0, "maximum file size of the upload guard must be positive"),
+    (lambda c: c["pdf_optimization"]["image_resolution_dpi"] > 0, "image resolution of the PDF optimization must be positive"),
+    (lambda c: 0 <= c["pdf_optimization"]["min_saving_ratio"] < 1, "minimum saving ratio of the PDF optimization must be in [0, 1)"),
+    (lambda c: c["pdf_points"]["last_pages"] > 0, "number of PDF pages searched for points must be positive"),
+    (lambda c: _pattern_groups(c["pdf_points"]["annotation_pattern"]) >= 1, "annotation pattern for points must be a regular expression with a group"),
     (lambda c: "{}" in "".join(c["moodle"]["feedback_footer"]), "feedback footer must include a placeholder"),
     (lambda c: c["pex"]["text_divider"] != "", "text divider must not be empty"),
     (lambda c: len(c["pex"]["notebook_auto_edit"]["find"]) == len(c["pex"]["notebook_auto_edit"]["replace"]), "find and replace arrays must have the same length"),
@@ -34,7 +52,10 @@ _default_config: dict = {
         "tmp_folder": "__CER_TOOL_TEMP_FOLDER{}__",
         "edit_feedback_file": "__CER_TOOL_TEMP_COMMENT__.txt",
         "feedback_filename_prefix": "Feedback",
-        "points_placeholder": " --- "
+        "points_placeholder": " --- ",
+        "duplicates_file": "__CER_TOOL_DUPLICATES__.json",
+        "points_cache_file": "__CER_TOOL_PDF_POINTS__.json",
+        "prepared_file": "__CER_TOOL_PREPARED__.json"
     },
     "moodle": {
         "submission_keyword": "assignsubmission_file",
@@ -51,20 +72,130 @@ _default_config: dict = {
             "find": ["%matplotlib notebook", "matplotlib.use(\\\"nbAgg\\\")"],
             "replace": ["%matplotlib tk", "matplotlib.use('TkAgg')"]
         }
+    },
+    "scratch": {
+        "location": "auto",
+        "budget_bytes": 2147483648
+    },
+    "upload_guard": {
+        "max_file_bytes": 24999500,
+        # submitted documents, e.g. scanned PDFs, are never held back because of their size
+        "size_exempt_patterns": ["*.pdf"],
+        "skip_patterns": ["*__MACOSX/*", "*.DS_Store", "*__pycache__/*", "*.pyc", "*.ipynb_checkpoints/*",
+                          "*venv/*", "*node_modules/*", "*.git/*", "*.mp4", "*.mov", "*.avi", "*.mkv"],
+        "quarantine_folder": "__CER_TOOL_QUARANTINE__"
+    },
+    "metrics": {
+        "textfile_directory": ""
+    },
+    "pdf_optimization": {
+        "enabled": False,
+        "ghostscript": "gs",
+        "image_resolution_dpi": 150,
+        "min_file_bytes": 1000000,
+        "min_saving_ratio": 0.1
+    },
+    "pdf_points": {
+        "enabled": False,
+        "form_field": "Punkte",
+        "annotation_pattern": "(?i)(?:punkte|points|pts)\\s*[:=]\\s*(\\d+(?:[.,]\\d+)?)",
+        "last_pages": 2
     }
 }
 
+class FilenamesConfig(NamedTuple):
+    tmp_folder: str
+    edit_feedback_file: str
+    feedback_filename_prefix: str
+    points_placeholder: str
+    duplicates_file: str
+    points_cache_file: str
+    prepared_file: str
+
+
+class MoodleConfig(NamedTuple):
+    submission_keyword: str
+    feedback_footer: Tuple[str, ...]
+    feedback_footer_with_initials: Tuple[str, ...]
+    file_upload_limit_bytes: int
+
+
+class PexConfig(NamedTuple):
+    text_divider: str
+    html_magic_comment: str
+    docker_group_name: str
+    notebook_auto_edit: Tuple[Tuple[str, str], ...]
+
+
+class ScratchConfig(NamedTuple):
+    location: str
+    budget_bytes: int
+
+
+class UploadGuardConfig(NamedTuple):
+    max_file_bytes: int
+    size_exempt_patterns: Tuple[str, ...]
+    skip_patterns: Tuple[str, ...]
+    quarantine_folder: str
+
+
+class MetricsConfig(NamedTuple):
+    textfile_directory: str
+
+
+class PdfOptimizationConfig(NamedTuple):
+    enabled: bool
+    ghostscript: str
+    image_resolution_dpi: int
+    min_file_bytes: int
+    min_saving_ratio: float
+
+
+class PdfPointsConfig(NamedTuple):
+    enabled: bool
+    form_field: str
+    annotation_pattern: str
+    last_pages: int
+
+
+class ConfigSnapshot(NamedTuple):
+    initials: str
+    filenames: FilenamesConfig
+    moodle: MoodleConfig
+    pex: PexConfig
+    scratch: ScratchConfig
+    upload_guard: UploadGuardConfig
+    metrics: MetricsConfig
+    pdf_optimization: PdfOptimizationConfig
+    pdf_points: PdfPointsConfig
+
+
 def _initialise() -> None:
-    global _config, _verified
+    global _config, _verified, _snapshot
 
     if _CONFIG_PATH.exists():
         with open(_CONFIG_PATH, 'r') as file:
             _config = json.load(file)
+        # settings introduced after the config file was created
+        if _add_missing_defaults(_config, _default_config):
+            _save_without_verifying()
     else:
         _config = _default_config
         _save_without_verifying()
 
     _verified = False
+    _snapshot = None
+
+
+def _add_missing_defaults(config: dict, defaults: dict) -> bool:
+    changed = False
+    for key, default in defaults.items():
+        if key not in config:
+            config[key] = copy.deepcopy(default)
+            changed = True
+        elif isinstance(default, dict) and isinstance(config[key], dict):
+            changed = _add_missing_defaults(config[key], default) or changed
+    return changed
 
 
 def save() -> None:
@@ -77,7 +208,7 @@ def _save_without_verifying() -> None:
 
 
 def set(key_path: str, value: Config_Entry) -> None:
-    global _verified
+    global _verified, _snapshot
 
     keys = key_path.split(".")
     data = _config
@@ -88,6 +219,7 @@ def set(key_path: str, value: Config_Entry) -> None:
     data[keys[-1]] = value
 
     _verified = False
+    _snapshot = None
 
 
 def set_json(key_path: str, value: str) -> None:
@@ -110,6 +242,70 @@ def get(key_path: str) -> Config_Entry:
         data = data[key]
     return data
 
+def snapshot() -> ConfigSnapshot:
+    global _snapshot
+
+    if _snapshot is not None:
+        return _snapshot
+
+    _verify()
+    filenames, moodle, pex, scratch = _config["filenames"], _config["moodle"], _config["pex"], _config["scratch"]
+    upload_guard, metrics, pdf_optimization = _config["upload_guard"], _config["metrics"], _config["pdf_optimization"]
+    pdf_points = _config["pdf_points"]
+    _snapshot = ConfigSnapshot(
+        initials=_config["initials"],
+        filenames=FilenamesConfig(
+            tmp_folder=filenames["tmp_folder"],
+            edit_feedback_file=filenames["edit_feedback_file"],
+            feedback_filename_prefix=filenames["feedback_filename_prefix"],
+            points_placeholder=filenames["points_placeholder"],
+            duplicates_file=filenames["duplicates_file"],
+            points_cache_file=filenames["points_cache_file"],
+            prepared_file=filenames["prepared_file"],
+        ),
+        moodle=MoodleConfig(
+            submission_keyword=moodle["submission_keyword"],
+            feedback_footer=tuple(moodle["feedback_footer"]),
+            feedback_footer_with_initials=tuple(map(lambda s: s.format(_config["initials"]), moodle["feedback_footer"])),
+            file_upload_limit_bytes=moodle["file_upload_limit_bytes"],
+        ),
+        pex=PexConfig(
+            text_divider=pex["text_divider"],
+            html_magic_comment=pex["html_magic_comment"],
+            docker_group_name=pex["docker_group_name"],
+            notebook_auto_edit=tuple(zip(pex.get("notebook_auto_edit", {}).get("find", []),
+                                         pex.get("notebook_auto_edit", {}).get("replace", []))),
+        ),
+        scratch=ScratchConfig(
+            location=scratch["location"],
+            budget_bytes=scratch["budget_bytes"],
+        ),
+        upload_guard=UploadGuardConfig(
+            max_file_bytes=upload_guard["max_file_bytes"],
+            size_exempt_patterns=tuple(upload_guard["size_exempt_patterns"]),
+            skip_patterns=tuple(upload_guard["skip_patterns"]),
+            quarantine_folder=upload_guard["quarantine_folder"],
+        ),
+        metrics=MetricsConfig(
+            textfile_directory=metrics["textfile_directory"],
+        ),
+        pdf_optimization=PdfOptimizationConfig(
+            enabled=pdf_optimization["enabled"],
+            ghostscript=pdf_optimization["ghostscript"],
+            image_resolution_dpi=pdf_optimization["image_resolution_dpi"],
+            min_file_bytes=pdf_optimization["min_file_bytes"],
+            min_saving_ratio=pdf_optimization["min_saving_ratio"],
+        ),
+        pdf_points=PdfPointsConfig(
+            enabled=pdf_points["enabled"],
+            form_field=pdf_points["form_field"],
+            annotation_pattern=pdf_points["annotation_pattern"],
+            last_pages=pdf_points["last_pages"],
+        ),
+    )
+    return _snapshot
+
+
 def key_exists(key_path: str) -> bool:
     keys = key_path.split('.')
     data = _config
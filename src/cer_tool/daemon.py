@@ -0,0 +1,95 @@
+import json
+import os
+import socketserver
+import threading
+from typing import Dict, Tuple
+
+from cer_tool import util, config, grading_sheet
+from cer_tool.daemon_client import SOCKET_PATH
+
+# loaded grading sheets by absolute path, together with the modification time of the file when loaded
+_sheets: Dict[str, Tuple[float, grading_sheet.GradingSheet]] = {}
+
+
+def _get_sheet(path: str) -> grading_sheet.GradingSheet:
+    # reload the grading sheet if it was changed by another process, e.g. grade-pex
+    mtime = os.stat(path).st_mtime
+    if path not in _sheets or _sheets[path][0] != mtime:
+        _sheets[path] = (mtime, grading_sheet.GradingSheet(path))
+        util.info(f" DAEMON: loaded grading sheet '{path}'")
+    return _sheets[path][1]
+
+
+def _save_sheet(gs: grading_sheet.GradingSheet, path: str, out: str | None) -> None:
+    gs.save(out or path)
+    if out and out != path:
+        # the saved state belongs to another file now
+        del _sheets[path]
+        _sheets[out] = (os.stat(out).st_mtime, gs)
+    else:
+        _sheets[path] = (os.stat(path).st_mtime, gs)
+
+
+def _handle(command: str, arguments: dict) -> dict:
+    match command:
+        case "ping":
+            return {}
+
+        case "find_participants":
+            gs = _get_sheet(arguments["grading_sheet"])
+            return {"participants": gs.find_participants(arguments["keyword"])}
+
+        case "get_student":
+            gs = _get_sheet(arguments["grading_sheet"])
+            id = arguments["id"]
+            return {"name": gs.get_name(id), "points": gs.get_points(id), "comment": gs.get_comment(id),
+                    "edit_feedback_file": config.snapshot().filenames.edit_feedback_file}
+
+        case "set_comment":
+            path = arguments["grading_sheet"]
+            gs = _get_sheet(path)
+            id = arguments["id"]
+            if grading_sheet.encode_comment(arguments["comment"]) == grading_sheet.encode_comment(gs.get_comment(id)):
+                return {"changed": False}
+            gs.set_comment(id, arguments["comment"])
+            _save_sheet(gs, path, arguments["out"])
+            return {"changed": True}
+
+        case _:
+            raise ValueError(f"unknown command '{command}'")
+
+
+class _RequestHandler(socketserver.StreamRequestHandler):
+    def handle(self) -> None:
+        for line in self.rfile:
+            try:
+                request = json.loads(line)
+                if request["command"] == "shutdown":
+                    # shutdown() blocks until serve_forever() returns, so it must not run in the serving thread
+                    threading.Thread(target=self.server.shutdown).start()
+                    response = {}
+                else:
+                    response = _handle(request["command"], request["arguments"])
+            except SystemExit:
+                # util.error() already printed the details to the output of the daemon
+                response = {"error": "request failed, see the output of 'cer-tool daemon run' for details"}
+            except Exception as e:
+                # keep the daemon alive, the client reports the error
+                response = {"error": str(e) or type(e).__name__}
+            self.wfile.write(json.dumps(response).encode() + b"\n")
+
+
+def serve() -> None:
+    if SOCKET_PATH.exists():
+        SOCKET_PATH.unlink()
+
+    # verify the configuration once, s.t. all requests use the same snapshot
+    config.snapshot()
+
+    with socketserver.UnixStreamServer(str(SOCKET_PATH), _RequestHandler) as server:
+        os.chmod(SOCKET_PATH, 0o600)
+        util.info(f"cer-tool daemon listening on '{SOCKET_PATH}' (press Ctrl-C to stop) ...", always_display=True)
+        try:
+            server.serve_forever()
+        finally:
+            SOCKET_PATH.unlink(missing_ok=True)
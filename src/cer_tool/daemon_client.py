@@ -0,0 +1,101 @@
+import json
+import socket
+from argparse import Namespace
+from pathlib import Path
+from typing import List
+
+from platformdirs import user_runtime_path
+
+from cer_tool import util
+
+# kept free of heavy imports (pandas, py7zr, ...), s.t. thin clients start quickly
+
+SOCKET_PATH: Path = user_runtime_path("cer-tool", ensure_exists=True) / "daemon.sock"
+
+# commands handled by the daemon when it is running (see command_handlers for the local implementations)
+CLIENT_COMMANDS = {"edit_feedback"}
+
+
+def is_supported() -> bool:
+    return hasattr(socket, "AF_UNIX")
+
+
+def is_running() -> bool:
+    if not is_supported() or not SOCKET_PATH.exists():
+        return False
+    try:
+        request("ping")
+        return True
+    except OSError:
+        return False
+
+
+def request(command: str, **arguments) -> dict:
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as connection:
+        connection.connect(str(SOCKET_PATH))
+        connection.sendall(json.dumps({"command": command, "arguments": arguments}).encode() + b"\n")
+        with connection.makefile("rb") as response_file:
+            response = json.loads(response_file.readline())
+
+    if "error" in response:
+        util.error(f"cer-tool daemon: {response['error']}")
+    return response
+
+
+class RemoteGradingSheet:
+    """Proxy for a grading sheet kept in memory by the daemon."""
+
+    def __init__(self, path: str) -> None:
+        self.path = str(Path(path).resolve())
+
+    def select_participant(self, keyword: str) -> int:
+        results = request("find_participants", grading_sheet=self.path, keyword=keyword)["participants"]
+        if len(results) == 0:
+            util.error(f"No participant named '*{keyword}*' found.")
+            return 0
+        elif len(results) == 1:
+            return int(results[0][0])
+        else:
+            index = util.choose_index(list(map(lambda l: " - ".join(l), results)), "Multiple results found:")
+            return int(results[index][0])
+
+    def get_student(self, id: int) -> dict:
+        return request("get_student", grading_sheet=self.path, id=id)
+
+    def set_comment(self, id: int, comment: List[str], out: str | None = None) -> bool:
+        out = str(Path(out).resolve()) if out else None
+        return request("set_comment", grading_sheet=self.path, id=id, comment=comment, out=out)["changed"]
+
+
+def edit_feedback(args: Namespace) -> None:
+    keyword: str = ' '.join(args.student_name)
+    if args.groups or args.all or not keyword:
+        # batch editing loads the grading sheet only once anyway
+        from cer_tool import command_handlers
+        command_handlers.edit_feedback(args)
+        return
+
+    gs = RemoteGradingSheet(args.grading_sheet)
+    id = gs.select_participant(keyword)
+    student = gs.get_student(id)
+    edit_feedback_file = Path(student["edit_feedback_file"])
+
+    # create a new file with current feedback
+    info_line = f"# Editing comment for {student['name']} (id: {id}, {student['points'] or 'N/A'} points):"
+    if edit_feedback_file.exists():
+        option = util.choose_option({"y", "n"}, "y", f"path '{edit_feedback_file}' already exists. Overwrite?")
+        if option != "y":
+            util.error("Aborted by user")
+    with open(edit_feedback_file, "w", encoding="utf-8") as f:
+        f.write('\n'.join([info_line] + student["comment"]))
+
+    # open text editor to edit feedback and wait until the user has finished
+    util.open_file(edit_feedback_file)
+    util.wait_for_user("Please edit the comment, save the file and press ENTER to continue...")
+
+    # retrieve and save changes
+    feedback_new_raw = edit_feedback_file.read_text(encoding="utf-8").split('\n')
+    feedback_new = list(filter(lambda l: len(l) > 0 and not l.startswith('#'), feedback_new_raw))
+    edit_feedback_file.unlink()
+    if not gs.set_comment(id, feedback_new, args.out):
+        util.warning("No changes to the comment.")
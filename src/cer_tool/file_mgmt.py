@@ -1,25 +1,35 @@
+import atexit
+import hashlib
+import json
 import os
-import platform
+import queue
 import re
 import shutil
-import subprocess
+import threading
+import time
 import zipfile
+from concurrent.futures import Future, ThreadPoolExecutor
 from functools import reduce
 from pathlib import Path
-from typing import List, Tuple, Callable
+from typing import List, Tuple, Callable, Dict
 from os import PathLike
 from zipfile import ZipFile
 
+import pandas as pd
 import py7zr
 shutil.register_unpack_format('7zip', ['.7z'], py7zr.unpack_7zarchive)
 shutil.register_archive_format('7zip', py7zr.pack_7zarchive, description='7zip archive')
 
-from cer_tool import util, config
+from cer_tool import util, config, scratch, upload_guard, pdf_points, progress
+from cer_tool.catalog import Catalog
+from cer_tool.upload_guard import GuardedFile
 
 
 temporary_folders: List[Path] = []
-def _get_temporary_name() -> str:
-    return config.get("filenames.tmp_folder").format(len(temporary_folders))
+# temporary folders are also created by the threads of 'prepare' and the look-ahead grading of 'grade-pex'
+_temporary_folders_lock = threading.Lock()
+# guards the content hashes of extracted archives shared between the threads of 'prepare'
+_known_archives_lock = threading.Lock()
 
 
 def check_path(path: str) -> Path:
@@ -54,29 +64,45 @@ def delete_file(path: str) -> None:
     util.info(f" DELETE: '{path}'")
 
 
+def hash_file(path: str | PathLike[str]) -> str:
+    with open(path, "rb") as f:
+        return hashlib.file_digest(f, "sha256").hexdigest()
+
+
 def create_folder(path: str | PathLike[str]) -> None:
     if not Path(path).exists():
         Path(path).mkdir(parents=True)
         util.info(f" CREATE: folder '{path}'")
 
-def create_temporary_folder() -> Path:
-    folder_name: str = _get_temporary_name()
-    p = Path(folder_name)
+def _add_temporary_folder(path: Path) -> None:
+    with _temporary_folders_lock:
+        temporary_folders.append(path.resolve())
+
+
+def create_temporary_folder(expected_bytes: int = 0) -> Path:
+    p = scratch.new_folder(expected_bytes)
     p.mkdir(parents=True)
     util.info(f" CREATE: temporary folder '{p}'")
-    temporary_folders.append(p.resolve())
+    _add_temporary_folder(p)
     return p
 
 
-def extract_archive(path: str | PathLike[str], target: str | PathLike[str] | None = None):
+def extract_archive(path: str | PathLike[str], target: str | PathLike[str] | None = None,
+                    guarded: List[GuardedFile] | None = None, keep_patterns: Tuple[str, ...] = ()):
     path_from = Path(path)
     path_to = Path(target) if target else path_from.with_suffix("")
-    shutil.unpack_archive(path_from, path_to)
+    # archives nested in an extracted archive are extracted into the same scratch folder
+    scratch.reserve(path_to.parent, scratch.estimate_extracted_size(path_from))
+    start = time.perf_counter()
+    if guarded is None or not upload_guard.extract_archive(path_from, path_to, guarded, keep_patterns):
+        shutil.unpack_archive(path_from, path_to)
+    progress.record("extracted_bytes", path_from.stat().st_size, time.perf_counter() - start)
     util.info(f" EXTRACT: '{path_from}' → '{path_to}'")
-    temporary_folders.append(path_to.resolve())
+    _add_temporary_folder(path_to)
 
 
-def extract_all_within(path: str | PathLike[str]):
+def extract_all_within(path: str | PathLike[str], known_archives: Dict[str, Future] | None = None,
+                       guarded: List[GuardedFile] | None = None, keep_patterns: Tuple[str, ...] = ()):
     archive_suffixes: List[str] = reduce(lambda acc, curr: acc + curr[1], shutil.get_unpack_formats(), []) # create a list of supported archive extensions
     path: Path = Path(path)
     base_folder: str = path.stem
@@ -89,17 +115,45 @@ def extract_all_within(path: str | PathLike[str]):
             if file.is_dir():
                 rec(file, level + 1)
             elif file.suffix in archive_suffixes:
-                extract_archive(file)
+                if known_archives is None:
+                    extract_archive(file, guarded=guarded, keep_patterns=keep_patterns)
+                else:
+                    # byte-identical archives (e.g. uploaded by several group members) are only decompressed once
+                    digest = hash_file(file)
+                    with _known_archives_lock:
+                        extracted = known_archives.get(digest)
+                        if extracted is None:
+                            known_archives[digest] = Future()
+                    if extracted is not None:
+                        # wait in case another thread is still extracting the same archive
+                        extracted_folder, extracted_guarded = extracted.result()
+                        shutil.copytree(extracted_folder, file.with_suffix(""), dirs_exist_ok=True)
+                        util.info(f" COPY: '{extracted_folder}' → '{file.with_suffix('')}' (identical archive)")
+                        _add_temporary_folder(file.with_suffix(""))
+                        if guarded is not None:
+                            guarded.extend(f._replace(path=file.with_suffix("") / f.path.relative_to(extracted_folder),
+                                                      archive=file) for f in extracted_guarded)
+                    else:
+                        try:
+                            archive_guarded = [] if guarded is not None else None
+                            extract_archive(file, guarded=archive_guarded, keep_patterns=keep_patterns)
+                        except BaseException as e:
+                            known_archives[digest].set_exception(e)
+                            raise
+                        known_archives[digest].set_result((file.with_suffix(""), archive_guarded or []))
+                        if guarded is not None:
+                            guarded.extend(archive_guarded)
                 rec(file.with_suffix(""), level + 1)
 
     rec(path)
 
 
-def unzip_if_not_folder(path: PathLike[str] | str) -> Path:
+def unzip_if_not_folder(path: PathLike[str] | str, guarded: List[GuardedFile] | None = None,
+                        keep_patterns: Tuple[str, ...] = ()) -> Path:
     path = Path(path)
     if not path.is_dir():
-        target = Path(_get_temporary_name())
-        extract_archive(path, target)
+        target = scratch.new_folder(scratch.estimate_extracted_size(path))
+        extract_archive(path, target, guarded, keep_patterns)
         return target
     else:
         return path
@@ -112,60 +166,125 @@ def zip_folder(path: str, output_path: str) -> None:
     util.info(f" ZIP: '{path}' → '{output_path}.zip'")
 
 
-def zip_folder_with_limit(path: str | PathLike[str], output_path: str,
-                          limit_bytes: int | None = None) -> int:
-    limit_bytes = config.get("moodle.file_upload_limit_bytes") if limit_bytes is None else limit_bytes
+# upper bounds for the bytes a zip archive needs in addition to the (compressed) file contents
+_ZIP_ENTRY_OVERHEAD: int = 30 + 46 + 2 * 20  # local header + central directory header + zip64 extra fields
+_ZIP_END_OVERHEAD: int = 22 + 56 + 20  # end of central directory records (incl. zip64)
 
-    def partition(files: List[Tuple[Path, int]], acc_size: int = 0, acc: List[Path] = None) -> List[List[Path]]:
-        if not files:
-            return [acc] if acc is not None else []
 
-        file, size = files[0]
+class ZipPartWriter:
+    """Streams files into one or more zip files of limited size, compressing on a background thread."""
 
-        if size > limit_bytes:
-            util.warning(f"file '{file}' exceeds limit of {limit_bytes} bytes.", "file will be skipped.")
-            return partition(files[1:], acc_size, acc)
+    def __init__(self, output_path: str, limit_bytes: int | None = None) -> None:
+        self.limit_bytes = config.snapshot().moodle.file_upload_limit_bytes if limit_bytes is None else limit_bytes
+        self.output_path = re.sub(r"(.*)\.zip", r"\1", output_path) if output_path.endswith(".zip") else output_path
+        self.parts: List[Path] = []
+        self._queue: queue.Queue[Tuple[Path, str] | None] = queue.Queue(maxsize=16)
+        self._error: BaseException | None = None
+        self._closed = False
+        self._thread = threading.Thread(target=self._write_all, daemon=True)
+        self._thread.start()
 
-        if size + acc_size <= limit_bytes:  # insert file into current sub-list
-            new_acc = acc + [file] if acc is not None else [file]
-            return partition(files[1:], size + acc_size, new_acc)
-        else:  # insert file into new sub-list
-            rest = partition(files[1:], size, [file])
-            return [acc] + rest
-
-    def zip_files(files: List[Path], suffix: str) -> None:
-        with ZipFile(f"{output_path}{suffix}.zip", "w", compression=zipfile.ZIP_DEFLATED) as zip:
-            for file in files:
-                zip.write(file, file.name)
-                util.info(f" ZIP: '{file}' → '{output_path}{suffix}.zip'")
-
-    if output_path.endswith(".zip"):
-        output_path = re.sub(r"(.*)\.zip", r"\1", output_path)
+    def __enter__(self) -> 'ZipPartWriter':
+        return self
 
-    files_to_zip = list(Path(path).iterdir())
-    files_to_zip = list(map(lambda p: (p, p.stat().st_size), files_to_zip))  # zip with file size
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        if exc_type is not None and not self._closed:
+            self.abort()
 
-    partitioned_files = partition(files_to_zip)
-    total_zips = len(partitioned_files)
+    def add(self, file: Path, name: str) -> None:
+        if self._error is not None:
+            raise self._error
+        self._queue.put((file, name))
 
-    for i, partition in enumerate(partitioned_files):
-        suffix = f"_{i + 1}_of_{total_zips}" if total_zips > 0 else ""
-        zip_files(partition, suffix)
+    def _write_all(self) -> None:
+        zip: ZipFile | None = None
+        central_directory_size = 0
 
-    return total_zips
+        try:
+            while (item := self._queue.get()) is not None:
+                file, name = item
+                file_size = file.stat().st_size
+                # deflate may slightly enlarge incompressible files (e.g. PDFs)
+                required_size = file_size + file_size // 1000 + 64 + _ZIP_ENTRY_OVERHEAD + 2 * len(name.encode())
+
+                if required_size + _ZIP_END_OVERHEAD > self.limit_bytes:
+                    util.warning(f"file '{file}' exceeds limit of {self.limit_bytes} bytes.", "file will be skipped.")
+                    continue
+
+                if zip is None or zip.fp.tell() + central_directory_size + required_size + _ZIP_END_OVERHEAD > self.limit_bytes:
+                    if zip is not None:
+                        zip.close()
+                    part = Path(f"{self.output_path}_{len(self.parts) + 1}.zip.part")
+                    self.parts.append(part)
+                    zip = ZipFile(part, "w", compression=zipfile.ZIP_DEFLATED)
+                    central_directory_size = 0
+
+                start = time.perf_counter()
+                zip.write(file, name)
+                progress.record("zipped_bytes", file_size, time.perf_counter() - start)
+                central_directory_size += 46 + len(name.encode())
+                util.info(f" ZIP: '{file}' → '{self.parts[-1]}' as '{name}'")
+        except BaseException as e:
+            self._error = e
+            # keep consuming, s.t. the producer does not block
+            while self._queue.get() is not None:
+                pass
+        finally:
+            if zip is not None:
+                zip.close()
+
+    def _join(self) -> None:
+        self._closed = True
+        self._queue.put(None)
+        self._thread.join()
+
+    def close(self) -> int:
+        self._join()
+        if self._error is not None:
+            raise self._error
+
+        # name the parts after their total count
+        total_zips = len(self.parts)
+        for i, part in enumerate(self.parts):
+            target = Path(f"{self.output_path}_{i + 1}_of_{total_zips}.zip")
+            part.replace(target)
+            self.parts[i] = target
+        return total_zips
+
+    def abort(self) -> None:
+        self._join()
+        for part in self.parts:
+            part.unlink(missing_ok=True)
+            util.info(f" DELETE: '{part}'")
 
 
 def delete_folder(folder: Path) -> None:
     if folder.exists():
         shutil.rmtree(folder)
         util.info(f" DELETE: '{folder}'")
-    if folder.resolve() in temporary_folders:
-        temporary_folders.remove(folder.resolve())
+    with _temporary_folders_lock:
+        if folder.resolve() in temporary_folders:
+            temporary_folders.remove(folder.resolve())
+    scratch.release(folder)
 
 
 def cleanup() -> None:
-    for folder in reversed(temporary_folders):
+    with _temporary_folders_lock:
+        folders = list(reversed(temporary_folders))
+    for folder in folders:
         delete_folder(folder)
+    scratch.cleanup()
+
+
+_cleanup_registered: bool = False
+
+
+def register_cleanup() -> None:
+    # also remove temporary folders when exiting after an error, called by the commands creating them
+    global _cleanup_registered
+    if not _cleanup_registered:
+        atexit.register(cleanup)
+        _cleanup_registered = True
 
 
 def find_all_paths(keyword: str, path: str | PathLike[str], replace_non_ascii: bool = True) -> List[Path]:
@@ -175,11 +294,15 @@ def find_all_paths(keyword: str, path: str | PathLike[str], replace_non_ascii: b
 
 
 def find_single_path(keyword: str, path: str | PathLike[str], replace_non_ascii: bool = True,
-                     filter_fun: Callable[[Path], bool] | None = None) -> Path:
+                     filter_fun: Callable[[Path], bool] | None = None, interactive: bool = True) -> Path:
     results = find_all_paths(keyword, path, replace_non_ascii)
     if filter_fun:
         results = list(filter(filter_fun, results))
 
+    # e.g. in background threads, which must neither ask the user nor exit the program
+    if not interactive and len(results) != 1:
+        raise LookupError(f"{len(results)} results found for '{keyword}' in '{path}'")
+
     i = 0
     if not results:
         util.error(f"No results found for '{keyword}'")
@@ -208,47 +331,234 @@ def parse_groups_file(path: str | PathLike[str]) -> List[List[str]] | None:
         return None
 
 
-def _flat_copy_all(path_from: Path, path_to: Path, name_prefix: str, name_suffix: str, _count: int = 0) -> int:
+def _list_flat_copy(path_from: Path, path_to: Path, name_prefix: str, name_suffix: str,
+                    guarded: List[GuardedFile], base_folder: Path | None = None) -> List[Tuple[Path, Path, str]]:
+    # (file, target, content hash) for all files inside the folder, numbered in a fixed order
+    base_folder = base_folder or path_from
+    files = []
     files_in_folder = sorted(path_from.glob("*"))
     for i, file in enumerate(files_in_folder):
         i += 1
         if not file.is_dir():
+            # files extracted without a check of the upload guard, e.g. from 7z archives or folder exports
+            size = file.stat().st_size
+            reason = upload_guard.check(file.relative_to(base_folder).as_posix(), size)
+            if reason is not None:
+                guarded.append(GuardedFile(file, size, reason))
+                continue
             extension = file.suffix
-            shutil.copy(file, path_to / f"{name_prefix}{i}{name_suffix}{extension}")
-            util.info(f" COPY: '{file.name}' → '{name_prefix}{i}{name_suffix}{extension}'")
-            _count += 1
+            files.append((file, path_to / f"{name_prefix}{i}{name_suffix}{extension}", hash_file(file)))
         else:
-            sub_count = _flat_copy_all(file, path_to, name_prefix + f"{i}-", name_suffix)
-            _count += sub_count
-    return _count
+            files += _list_flat_copy(file, path_to, name_prefix + f"{i}-", name_suffix, guarded, base_folder)
+    return files
+
+
+def _fingerprint_submission(submission_folder: Path) -> str:
+    # content of all uploaded files, computed before nested archives are extracted
+    fingerprint = hashlib.sha256()
+    for file in sorted(filter(Path.is_file, submission_folder.rglob("*"))):
+        fingerprint.update(f"{file.relative_to(submission_folder).as_posix()}:{hash_file(file)}\n".encode())
+    return fingerprint.hexdigest()
+
+
+def _collect_submission(submission_folder: Path, path_to: Path, name_prefix: str, name_suffix: str,
+                        known_archives: Dict[str, Future], previous_fingerprint: str | None
+                        ) -> Tuple[str, List[Tuple[Path, Path, str]] | None, List[GuardedFile]]:
+    fingerprint = _fingerprint_submission(submission_folder)
+    if fingerprint == previous_fingerprint:
+        return fingerprint, None, []
+
+    guarded = []
+    extract_all_within(submission_folder, known_archives, guarded)
+    return fingerprint, _list_flat_copy(submission_folder, path_to, name_prefix, name_suffix, guarded), guarded
+
+
+def _copy(file: Path, target: Path) -> None:
+    if target.exists():
+        # never overwrite files which may have been annotated already
+        util.warning(f"File '{target}' already exists.", "File will not be overwritten.")
+        return
+    shutil.copy(file, target)
+    util.info(f" COPY: '{file.name}' → '{target.name}'")
+
+
+def load_duplicates(path: str | PathLike[str]) -> Dict[str, str]:
+    duplicates_file = Path(path) / config.snapshot().filenames.duplicates_file
+    if not duplicates_file.exists():
+        return {}
+    with open(duplicates_file, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _save_duplicates(path: str | PathLike[str], duplicates: Dict[str, str]) -> None:
+    duplicates_file = Path(path) / config.snapshot().filenames.duplicates_file
+    with open(duplicates_file, "w", encoding="utf-8") as f:
+        json.dump(duplicates, f, indent=4, sort_keys=True, ensure_ascii=False)
+    util.info(f" CREATE: file '{duplicates_file}'")
+
+
+def _load_prepared(path: str | PathLike[str]) -> Dict[str, Dict[str, str | int]]:
+    # moodle id → fingerprint and revision of the submission copied by an earlier 'prepare'
+    prepared_file = Path(path) / config.snapshot().filenames.prepared_file
+    if not prepared_file.exists():
+        return {}
+    with open(prepared_file, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _save_prepared(path: str | PathLike[str], prepared: Dict[str, Dict[str, str | int]]) -> None:
+    prepared_file = Path(path) / config.snapshot().filenames.prepared_file
+    with open(prepared_file, "w", encoding="utf-8") as f:
+        json.dump(prepared, f, indent=4, sort_keys=True)
+    util.info(f" CREATE: file '{prepared_file}'")
 
 
-def extract_theoretical_submissions(groups: List[List[str]], path_from: str | PathLike[str], path_to: str) -> List[int]:
+def find_submission_folder(member: str, path_from: str | PathLike[str], catalog: Catalog | None = None,
+                           moodle_id: int | None = None) -> Path:
+    if catalog and moodle_id is not None:
+        # id remembered from an earlier exercise, see roster.py
+        folders = [p for p in catalog.folders_by_id(moodle_id, path_from) if p.is_dir()]
+        if len(folders) == 1:
+            return folders[0]
+
+    candidates = [p for p in catalog.folders_by_name(member, path_from) if p.is_dir()] if catalog else []
+    if len(candidates) == 1:
+        return candidates[0]
+    elif len(candidates) > 1:
+        return candidates[util.choose_index(candidates, f"Multiple results found for '{member}':", "Select the correct result:")]
+
+    # e.g. partial names in the groups file
+    return find_single_path(f"*{member.replace(' ', '*')}*{config.snapshot().moodle.submission_keyword}*", path_from)
+
+
+def extract_theoretical_submissions(groups: List[List[str]], path_from: str | PathLike[str], path_to: str,
+                                    catalog: Catalog | None = None, jobs: int | None = None,
+                                    guarded: List[GuardedFile] | None = None,
+                                    known_ids: Dict[str, int] | None = None) -> Tuple[List[str], List[str], List[str]]:
+    """Ids of the extracted and the unchanged submissions and the members whose files were all held back."""
     create_folder(path_to)
     path_to = Path(path_to)
     path_from = Path(path_from)
+    cfg = config.snapshot()
     extracted = []
-
+    unchanged = []
+    held_back_members = []
+    # group and content hash → copied file/extracted archive, only members of a group share their feedback
+    copied: Dict[Tuple[int, str], Path] = {}
+    # content hash → member and file copied first, identical files of other groups are only reported
+    first_copies: Dict[str, Tuple[str, Path]] = {}
+    known_archives: Dict[str, Future] = {}
+    duplicates = load_duplicates(path_to)
+    prepared = _load_prepared(path_to)
+
+    # resolve all submission folders up front, as this may require choosing between several results
+    members = []
+    members_by_folder: Dict[Path, str] = {}
     for groupIdx, group in enumerate(groups):
         for memberIdx, member in enumerate(group):
-            submission_folder = find_single_path(f"*{member.replace(' ', '*')}*{config.get("moodle.submission_keyword")}*", path_from)
-            extract_all_within(submission_folder)
+            submission_folder = find_submission_folder(member, path_from, catalog,
+                                                       known_ids.get(member) if known_ids is not None else None)
+            if submission_folder in members_by_folder:
+                # the same folder must not be extracted by two threads at once
+                util.warning(f"{member} and {members_by_folder[submission_folder]} have the same submission folder "
+                             f"'{submission_folder.name}'.", f"{member} will be skipped.")
+                continue
+            members_by_folder[submission_folder] = member
             moodle_id = submission_folder.name.split("_")[1]
-
+            if known_ids is not None:
+                known_ids[member] = int(moodle_id)
             prefix = f"Submission_Gr{groupIdx + 1}{util.index_to_ascii(memberIdx)}_{member}_{moodle_id}_File "
-            suffix = f"_{config.get("filenames.points_placeholder")}pts"
-
-            count = _flat_copy_all(submission_folder, path_to, prefix, suffix)
-            if count > 0:
+            if moodle_id in prepared:
+                # changed submissions get new file numbers, s.t. already annotated files stay untouched
+                prefix += f"v{prepared[moodle_id]['revision'] + 1}-"
+            members.append((groupIdx, member, moodle_id, submission_folder, prefix))
+    suffix = f"_{cfg.filenames.points_placeholder}pts"
+
+    progress.start("prepare", len(members))
+    pool = ThreadPoolExecutor(jobs)
+    try:
+        # extract and hash the submissions of all students concurrently
+        collected = [pool.submit(_collect_submission, submission_folder, path_to, prefix, suffix, known_archives,
+                                 prepared.get(moodle_id, {}).get("fingerprint"))
+                     for _, _, moodle_id, submission_folder, prefix in members]
+
+        # decide in group order which file gets copied, s.t. the result does not depend on the order of the threads
+        to_copy = []
+        held_back = []
+        to_quarantine = []
+        quarantine_folder = path_to / cfg.upload_guard.quarantine_folder if cfg.upload_guard.quarantine_folder else None
+        for (groupIdx, member, moodle_id, submission_folder, _), result in zip(members, collected):
+            fingerprint, files, submission_guarded = result.result()
+            progress.advance("prepare")
+            if files is None:
+                util.info(f" SKIP: submission of {member} (id: {moodle_id}) did not change")
+                unchanged.append(moodle_id)
+                continue
+
+            # files held back while extracting the export or the archives inside the submission
+            submission_guarded += [f for f in guarded or [] if f.path.is_relative_to(submission_folder)]
+            held_back += submission_guarded
+            if quarantine_folder:
+                to_quarantine += [(f, quarantine_folder / submission_folder.name / f.path.relative_to(submission_folder))
+                                  for f in submission_guarded if f.reason == "oversized"]
+
+            for file, target, digest in files:
+                original = copied.get((groupIdx, digest))
+                if original is None and digest in first_copies:
+                    # e.g. copied from another group, which must not be graded automatically with the same points
+                    other_member, other_target = first_copies[digest]
+                    util.warning(f"'{file.name}' of {member} is identical to '{other_target.name}' of {other_member} "
+                                 "of another group.", "Both files are copied and annotated separately, unless you "
+                                                      "confirm to treat them as one")
+                    if util.choose_option({"y", "n"}, "n", "Annotate only one file and use it as feedback for both students?") == "y":
+                        original = other_target
+                if original is not None:
+                    # only the first copy gets annotated, 'finish' uses it as feedback for the duplicate, too
+                    duplicates[target.name] = original.name
+                    util.info(f" DEDUP: '{file.name}' → same as '{original.name}'")
+                else:
+                    copied[(groupIdx, digest)] = target
+                    first_copies.setdefault(digest, (member, target))
+                    to_copy.append((file, target))
+
+            if len(files) > 0:
                 extracted.append(moodle_id)
+                if moodle_id in prepared:
+                    util.warning(f"Submission of {member} (id: {moodle_id}) changed since the last 'prepare'.",
+                                 "New files were added with version prefix, existing files were not modified.")
+                    prepared[moodle_id] = {"fingerprint": fingerprint, "revision": prepared[moodle_id]["revision"] + 1}
+                else:
+                    prepared[moodle_id] = {"fingerprint": fingerprint, "revision": 1}
+            elif submission_guarded:
+                util.warning(f"All files of member {member} (id: {moodle_id}) were held back by the upload guard",
+                             "Member will be skipped.")
+                held_back_members.append(f"{member} (id: {moodle_id})")
             else:
                 util.warning(f"Did not find any files for member {member} (id: {moodle_id})", "Member will be skipped.")
 
-    return extracted
-
-
-def find_pex_submission(id: int, submissions: str | PathLike[str]) -> Path:
-    submission_folder = find_single_path(f"*{id}*{config.get("moodle.submission_keyword")}", submissions)
+        # report before copying, s.t. the user can abort if something important was held back
+        upload_guard.report(held_back, f"Irrelevant files were skipped, oversized files are copied to '{quarantine_folder}' "
+                                       f"instead" if quarantine_folder else "Files were skipped")
+        list(pool.map(lambda args: _copy(*args), to_copy))
+        list(pool.map(lambda args: upload_guard.quarantine(*args), filter(lambda q: not q[1].exists(), to_quarantine)))
+    finally:
+        pool.shutdown(cancel_futures=True)
+
+    if duplicates:
+        _save_duplicates(path_to, duplicates)
+    _save_prepared(path_to, prepared)
+    return extracted, unchanged, held_back_members
+
+
+def find_pex_submission(id: int, submissions: str | PathLike[str], catalog: Catalog | None = None) -> Path:
+    folders = [p for p in catalog.folders_by_id(id, submissions) if p.is_dir()] if catalog else []
+    if len(folders) == 1:
+        notebooks = [p for p in catalog.notebooks_of(folders[0], submissions) if p.is_file()]
+        if len(notebooks) == 1:
+            return notebooks[0]
+
+    # not indexed (e.g. notebooks inside non-zip archives) or ambiguous
+    submission_folder = find_single_path(f"*{id}*{config.snapshot().moodle.submission_keyword}", submissions)
     return find_single_path("*.ipynb", submission_folder,
                             filter_fun=lambda p: not p.name.endswith("-checkpoint.ipynb") and not p.name.startswith("._"))
 
@@ -275,60 +585,89 @@ def parse_submission_filename(path: Path) -> (str, int, str, (float | None)):
     return name, id, file_id, points
 
 
-def get_points_from_path(keyword: str, path: str) -> float | None:
-    path = Path(path)
-    feedback_files = find_all_paths(f"*_{keyword}_*", path)
-
-    points_sum = 0
-    points_found = False
-
-    for file in feedback_files:
-        try:
-            _, id, _, points = parse_submission_filename(file)
-            points_sum += float(points)
-            points_found = True
-        except ValueError or TypeError:
-            util.warning(f"No points found inside '{file.name}'.",
-                         "File will not be considered for calculating points.")
-            continue
+def _revision(file_id: str) -> int:
+    # files of changed submissions are numbered with their revision by 'prepare', e.g. 'v2-1'
+    match = re.match(r"^v(\d+)-", file_id)
+    return int(match.group(1)) if match else 1
 
-    return points_sum if points_found else None
 
+def _is_superseded(id: str, file_id: str, prepared: Dict[str, Dict[str, str | int]]) -> bool:
+    # only the files of the latest revision copied by 'prepare' are feedback
+    return _revision(file_id) < prepared.get(id, {}).get("revision", 1)
 
-def copy_feedback_files(keyword: str, path_from: str | PathLike[str], path_to: str | PathLike[str], submission_name: str = "") -> int:
-    path_from = Path(path_from)
-    path_to = Path(path_to)
-    feedback_files = find_all_paths(f"*_{keyword}_*", path_from)
-    copied = 0
 
-    for file in feedback_files:
-        student_name, student_id, file_id, points = parse_submission_filename(file)
+def _scan_feedback_folder(path_from: str | PathLike[str]) -> pd.DataFrame:
+    # parse every filename once instead of searching the folder for each student
+    cfg = config.snapshot()
+    quarantine_folder = cfg.upload_guard.quarantine_folder
+    prepared = _load_prepared(path_from)
+    points_cache = pdf_points.load_cache(path_from) if cfg.pdf_points.enabled else None
+    records = []
+    for file in Path(path_from).rglob("*"):
+        if not file.is_file() or (quarantine_folder and quarantine_folder in file.parts):
+            continue
+        try:
+            name, id, file_id, points = parse_submission_filename(file)
+        except ValueError:
+            continue
+        if not id.isdigit():
+            # not a submission file, e.g. the duplicates file
+            continue
+        if _is_superseded(id, file_id, prepared):
+            util.warning(f"'{file.name}' belongs to an older version of the submission of {name} (id: {id}).",
+                         f"File will not be included as feedback, only files of version {prepared[id]['revision']} are.")
+            continue
+        if points_cache is not None and file.suffix.lower() == ".pdf":
+            # points entered inside the annotated PDF take precedence over the filename
+            pdf_points_value = pdf_points.cached_points(file, Path(path_from), points_cache)
+            if pdf_points_value is not None:
+                if points is not None and points != pdf_points_value:
+                    util.warning(f"Points inside '{file.name}' ({pdf_points_value}) differ from its filename.",
+                                 "Points inside the file will be used.")
+                points = pdf_points_value
         if points is None:
             util.warning(f"No points found inside '{file.name}'.", "File will not be included as feedback.")
             continue
-
-        filename = f"{student_name}_{student_id}_{config.get("moodle.submission_keyword")}_{config.get("filenames.feedback_filename_prefix")}"
-        if submission_name:
-            filename += f"_{submission_name}"
-        filename += f"_(Datei {file_id})_{config.get("initials")}{file.suffix}"
-
-        shutil.copy2(file, path_to / filename)
-        copied += 1
-        util.info(f" COPY: '{file}' → '{path_to / filename}'")
-
-    return copied
-
-
-def open_file(path: str | PathLike[str]) -> None:
-    path = Path(path)
-    # taken from: https://stackoverflow.com/questions/434597/open-document-with-default-os-application-in-python-both-in-windows-and-mac-os
-    # and https://stackoverflow.com/questions/5772873/python-spawn-off-a-child-subprocess-detach-and-exit
-    if platform.system() == 'Darwin':  # macOS
-        subprocess.Popen(('open', path), start_new_session=True)
-    elif platform.system() == 'Windows':  # Windows
-        subprocess.Popen(('start', '', path), creationflags=subprocess.DETACHED_PROCESS, shell=True)
-    else:  # linux variants
-        subprocess.Popen(('xdg-open', path), start_new_session=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        records.append((file, name, id, file_id, points))
+
+    if points_cache is not None:
+        pdf_points.save_cache(path_from, points_cache)
+    return pd.DataFrame.from_records(records, columns=["path", "name", "id", "file_id", "points"])
+
+
+def find_all_feedback_files(path_from: str | PathLike[str], duplicates: Dict[str, str],
+                            submission_name: str = "") -> pd.DataFrame:
+    """One row per feedback file and student: student id, path, filename inside the feedback zip and points."""
+    files = _scan_feedback_folder(path_from)
+    own = files.rename(columns={"name": "student_name", "id": "student_id"})
+    own["student_file_id"] = own["file_id"]
+
+    # feedback files annotated for someone else, but submitted identically by a student
+    shared = pd.DataFrame.from_records(
+        [parse_submission_filename(Path(duplicate_name))[:3] + parse_submission_filename(Path(original_name))[1:3]
+         for duplicate_name, original_name in duplicates.items()],
+        columns=["student_name", "student_id", "student_file_id", "id", "file_id"])
+    # the student uploaded the same file twice, its points are already counted
+    shared = shared[shared["student_id"] != shared["id"]]
+    prepared = _load_prepared(path_from)
+    superseded = [_is_superseded(id, file_id, prepared) for id, file_id in zip(shared["student_id"], shared["student_file_id"])]
+    shared = shared[~pd.Series(superseded, index=shared.index, dtype=bool)]
+    shared = shared.merge(files[["path", "id", "file_id", "points"]], on=["id", "file_id"])
+
+    feedback = pd.concat([own, shared], ignore_index=True)
+    feedback["filename"] = [_feedback_filename(name, id, file_id, submission_name, path.suffix)
+                            for name, id, file_id, path in zip(feedback["student_name"], feedback["student_id"],
+                                                               feedback["student_file_id"], feedback["path"])]
+    return feedback[["student_id", "path", "filename", "points"]]
+
+
+def _feedback_filename(student_name: str, student_id: str, file_id: str, submission_name: str, suffix: str) -> str:
+    cfg = config.snapshot()
+    filename = f"{student_name}_{student_id}_{cfg.moodle.submission_keyword}_{cfg.filenames.feedback_filename_prefix}"
+    if submission_name:
+        filename += f"_{submission_name}"
+    filename += f"_(Datei {file_id})_{cfg.initials}{suffix}"
+    return filename
 
 
 def replace_in_file(path: str | PathLike[str], old: str, replacement: str) -> None:
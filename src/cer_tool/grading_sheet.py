@@ -1,25 +1,123 @@
 import csv
+import hashlib
+import os
+import platform
 import re
-from typing import List
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, List, NamedTuple, Set, Tuple
 from os import PathLike
 
+if platform.system() == "Windows":
+    import msvcrt
+else:
+    import fcntl
+
 import pandas as pd
 from pandas.core.frame import DataFrame
+from platformdirs import user_data_path
 
 from cer_tool import util
 
 
+_LOCK_FOLDER: Path = user_data_path("cer-tool", ensure_exists=True) / "locks"
+# attempts of ~10 seconds each to lock a grading sheet on Windows, before giving up
+_LOCK_ATTEMPTS: int = 30
+
+
+@contextmanager
+def _locked(path: str | PathLike[str]):
+    # advisory lock on a separate file, as saving replaces the grading sheet itself
+    # kept in the user data folder (one per grading sheet), s.t. no files are left next to the grading sheet
+    _LOCK_FOLDER.mkdir(exist_ok=True)
+    lock_path = _LOCK_FOLDER / f"{hashlib.sha256(str(Path(path).resolve()).encode()).hexdigest()[:16]}.lock"
+    with open(lock_path, "a+") as lock_file:
+        if platform.system() == "Windows":
+            for attempt in range(_LOCK_ATTEMPTS):
+                try:
+                    msvcrt.locking(lock_file.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:
+                    # still locked after ~10 seconds, e.g. by another command or a process that hangs
+                    if attempt == 0:
+                        util.warning(f"The grading sheet '{path}' is locked by another command (lock file "
+                                     f"'{lock_path}').", "Waiting until it is unlocked")
+            else:
+                util.error(f"The grading sheet '{path}' is still locked after {_LOCK_ATTEMPTS * 10} seconds. Please "
+                           f"stop the command using it or, if there is none, delete the lock file '{lock_path}'")
+        else:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if platform.system() == "Windows":
+                lock_file.seek(0)
+                msvcrt.locking(lock_file.fileno(), msvcrt.LK_UNLCK, 1)
+            else:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def _read(path: str | PathLike[str]) -> DataFrame:
+    return pd.read_csv(path, index_col=0).fillna('')
+
+
+class Update(NamedTuple):
+    points: float | None = None
+    # replaces the comment, a string is used as HTML as it is
+    comment: List[str] | str | None = None
+    # appended to the (replaced) comment, e.g. the feedback footer
+    append: List[str] | None = None
+
+
 class GradingSheet:
     data: DataFrame = []
 
     def __init__(self, path: str | PathLike[str]) -> None:
         self.path = path
-        self.data = pd.read_csv(path, index_col=0)
-        self.data = self.data.fillna('')
+        with _locked(path):
+            self.data = _read(path)
+        self.loaded = self.data.copy()
+        # cells changed by this process, only these are written back into a grading sheet changed by others
+        self.changed: Set[Tuple[str, str]] = set()
+        self.filtered_ids: List[str] | None = None
 
     def save(self, path: str | PathLike[str] | None = None):
-        output_path = path if path else self.path
-        self.data.to_csv(output_path, quoting=csv.QUOTE_ALL)
+        output_path = Path(path if path else self.path)
+        with _locked(output_path):
+            if output_path.exists() and output_path.resolve() == Path(self.path).resolve():
+                # row-level merge: keep changes of other processes made since this sheet was loaded
+                merged = _read(output_path)
+                for row, column in self.changed:
+                    if row in merged.index:
+                        merged.loc[row, column] = self.data.loc[row, column]
+                    else:
+                        # removed by another process filtering the grading sheet
+                        merged.loc[row] = self.data.loc[row]
+                missing = self.data.loc[~self.data.index.isin(merged.index)]
+                if self.filtered_ids is not None:
+                    # besides the own rows, keep the rows added or changed by other processes since loading
+                    common = merged.index.intersection(self.loaded.index)
+                    # e.g. columns added by other tools
+                    columns = merged.columns.union(self.loaded.columns)
+                    theirs = merged.loc[common].reindex(columns=columns, fill_value="")
+                    loaded = self.loaded.loc[common].reindex(columns=columns, fill_value="")
+                    changed_by_others = common[(theirs != loaded).any(axis=1)]
+                    merged = merged.loc[merged.index.isin(self.filtered_ids) | merged.index.isin(changed_by_others)
+                                        | ~merged.index.isin(self.loaded.index)]
+                    merged = pd.concat([merged, missing.loc[missing.index.isin(self.filtered_ids)]])
+                # rows removed from the file by others stay available to this process
+                self.data = pd.concat([merged, missing.loc[~missing.index.isin(merged.index)]])
+            else:
+                merged = self.data
+
+            # write atomically, s.t. other processes never read a partially written grading sheet
+            tmp_path = output_path.with_name(f".{output_path.name}.tmp")
+            merged.to_csv(tmp_path, quoting=csv.QUOTE_ALL)
+            os.replace(tmp_path, output_path)
+            if output_path.resolve() == Path(self.path).resolve():
+                # the own changes are no changes of others when saving again, read as they are compared later
+                self.loaded = _read(output_path)
+        self.changed.clear()
 
     def __str__(self) -> str:
         return f"<grading scheme @'{self.path}' containing {self.data} entries>"
@@ -31,6 +129,7 @@ class GradingSheet:
     def set_points(self, id: int, points: float) -> None:
         points_german = str(points).replace('.', ',')
         self.data.loc[f"Teilnehmer/in{id}", "Bewertung"] = points_german
+        self.changed.add((f"Teilnehmer/in{id}", "Bewertung"))
         util.info(f" GRADING SHEET: points for {self.data.loc[f"Teilnehmer/in{id}", "Vollständiger Name"]} set to {points_german}.")
 
     def get_points(self, id) -> float | None:
@@ -52,14 +151,41 @@ class GradingSheet:
             comment = encode_comment(comment)
 
         self.data.loc[f"Teilnehmer/in{id}", "Feedback als Kommentar"] = comment
+        self.changed.add((f"Teilnehmer/in{id}", "Feedback als Kommentar"))
         util.info(
             f" GRADING SHEET: feedback for {self.data.loc[f"Teilnehmer/in{id}", "Vollständiger Name"]} set to '{self.data.loc[f"Teilnehmer/in{id}", "Feedback als Kommentar"]}'.")
 
     def append_comment(self, id: int, comment: List[str]) -> None:
         self.data.loc[f"Teilnehmer/in{id}", "Feedback als Kommentar"] += encode_comment(comment)
+        self.changed.add((f"Teilnehmer/in{id}", "Feedback als Kommentar"))
         util.info(
             f" GRADING SHEET: feedback for {self.data.loc[f"Teilnehmer/in{id}", "Vollständiger Name"]} set to '{self.data.loc[f"Teilnehmer/in{id}", "Feedback als Kommentar"]}'.")
 
+    def apply_updates(self, updates: Dict[int, Update]) -> None:
+        rows = {f"Teilnehmer/in{id}": update for id, update in updates.items()}
+        # check all ids first, s.t. either all or none of the updates are applied
+        unknown = [str(id) for id in updates if f"Teilnehmer/in{id}" not in self.data.index]
+        if unknown:
+            util.error(f"Participants with the ids {', '.join(unknown)} not found in the grading sheet")
+
+        points = pd.Series({row: str(update.points).replace('.', ',')
+                            for row, update in rows.items() if update.points is not None}, dtype=object)
+        self.data.loc[points.index, "Bewertung"] = points
+
+        comments = pd.Series({row: update.comment if isinstance(update.comment, str) else encode_comment(update.comment)
+                              for row, update in rows.items() if update.comment is not None}, dtype=object)
+        self.data.loc[comments.index, "Feedback als Kommentar"] = comments
+
+        appended = pd.Series({row: encode_comment(update.append)
+                              for row, update in rows.items() if update.append is not None}, dtype=object)
+        self.data.loc[appended.index, "Feedback als Kommentar"] = \
+            self.data.loc[appended.index, "Feedback als Kommentar"].astype(str) + appended
+
+        self.changed.update((row, "Bewertung") for row in points.index)
+        self.changed.update((row, "Feedback als Kommentar") for row in comments.index.union(appended.index))
+        util.info(f" GRADING SHEET: set points of {len(points)} and feedback of {len(comments.index.union(appended.index))} "
+                  f"participant/s.")
+
     def find_participants(self, keyword: str) -> List[List[str]]:
         selected_cols: DataFrame = self.data[["Vollständiger Name"]]
         filtered: DataFrame = selected_cols[selected_cols["Vollständiger Name"].str.contains(keyword, case=False)]
@@ -80,8 +206,8 @@ class GradingSheet:
 
     def filter(self, ids: List[int]) -> None:
         # map ids to actual entries within grading sheet
-        translated_ids = map(lambda id: f"Teilnehmer/in{id}", ids)
-        self.data = self.data.loc[self.data.index.isin(translated_ids)]
+        self.filtered_ids = list(map(lambda id: f"Teilnehmer/in{id}", ids))
+        self.data = self.data.loc[self.data.index.isin(self.filtered_ids)]
         util.info(f" GRADING SHEET: Filtered to these IDs: {ids} ({len(self.data.index)} entries left).")
 
 
@@ -0,0 +1,171 @@
+import asyncio
+import glob
+import json
+import os
+import re
+import shlex
+import shutil
+from pathlib import Path
+from typing import Dict, List
+
+from cer_tool import util, file_mgmt
+
+
+# caches kept by BuildKit between builds, s.t. changed dependencies are not downloaded again
+_PIP_CACHE_MOUNT: str = "--mount=type=cache,target=/root/.cache/pip"
+# only the downloaded packages, as the package lists may be part of a layer of an earlier 'apt-get update'
+_APT_CACHE_MOUNT: str = "--mount=type=cache,target=/var/cache/apt,sharing=locked"
+
+_VARIABLE_PATTERN = re.compile(r"\$(?:\{(\w+)\}|(\w+))")
+_STEP_PATTERN = re.compile(r"^#(\d+) \[([^\]]*\d+/\d+)\] (.*)$")
+_STEP_RESULT_PATTERN = re.compile(r"^#(\d+) (?:DONE (\d+(?:\.\d+)?)s|(CACHED))$")
+# errors of docker installations without BuildKit, e.g. without the buildx plugin or with an old daemon
+_BUILDKIT_UNAVAILABLE_PATTERN = re.compile(r"buildx component is missing|unknown flag: --progress|requires BuildKit|"
+                                           r"BuildKit is not supported|buildkit not supported", re.IGNORECASE)
+
+
+def _directives(dockerfile: str) -> List[str]:
+    # e.g. '# syntax=docker/dockerfile:1', only valid at the top of the file
+    directives = []
+    for line in dockerfile.splitlines():
+        if not re.match(r"^#\s*\w+\s*=", line):
+            break
+        directives.append(line)
+    return directives
+
+
+def _instructions(dockerfile: str) -> List[str]:
+    # one line per instruction, without comments and line continuations
+    lines = [line for line in dockerfile.splitlines() if not line.lstrip().startswith("#")]
+    return [instruction.strip() for instruction in re.sub(r"[ \t]*\\[ \t]*\n[ \t]*", " ", "\n".join(lines)).splitlines()
+            if instruction.strip()]
+
+
+def _copy_sources(instruction: str, build_args: Dict[str, str]) -> List[str] | None:
+    """Sources of a COPY or ADD instruction taken from the build context, None if they cannot be determined."""
+    arguments = instruction.split(None, 1)[1] if " " in instruction else ""
+    try:
+        parts = json.loads(arguments) if arguments.startswith("[") else shlex.split(arguments)
+    except ValueError:
+        return None
+    flags = [part for part in parts if part.startswith("--")]
+    if any(flag.startswith("--from") for flag in flags):
+        # copied from another stage or image
+        return []
+
+    sources = []
+    for source in [part for part in parts if not part.startswith("--")][:-1]:
+        if re.match(r"^[a-z]+://", source):
+            continue
+        resolved = _VARIABLE_PATTERN.sub(lambda m: build_args.get(m.group(1) or m.group(2), m.group(0)), source)
+        if "$" in resolved:
+            return None
+        sources.append(resolved)
+    return sources
+
+
+def _with_cache_mounts(instruction: str) -> str:
+    keyword, _, command = instruction.partition(" ")
+    if keyword.upper() != "RUN" or command.startswith("--mount") or command.startswith("["):
+        return instruction
+    mounts = []
+    if re.search(r"\bpip3? install\b", command):
+        mounts.append(_PIP_CACHE_MOUNT)
+        command = re.sub(r"\s--no-cache-dir\b", "", command)
+    if re.search(r"\bapt(-get)? install\b", command):
+        mounts.append(_APT_CACHE_MOUNT)
+        # base images delete downloaded packages after each installation by default
+        command = f"rm -f /etc/apt/apt.conf.d/docker-clean; {command}"
+    return f"RUN {' '.join(mounts)} {command}" if mounts else instruction
+
+
+def stage_context(package: Path, build_args: Dict[str, str]) -> Path | None:
+    """Copies the Dockerfile and the files it copies into a temporary build context, None if not possible."""
+    dockerfile_path = package / "Dockerfile"
+    if not dockerfile_path.is_file():
+        return None
+    dockerfile = dockerfile_path.read_text(encoding="utf-8")
+    if "<<" in dockerfile:
+        # here-documents span several lines, which is not supported by this simple parser
+        return None
+    instructions = _instructions(dockerfile)
+
+    # defaults of build arguments, e.g. 'ARG exercise=pex1'
+    build_args = dict(build_args)
+    for instruction in instructions:
+        if match := re.match(r"^ARG\s+(\w+)=(\S*)$", instruction, re.IGNORECASE):
+            build_args.setdefault(match.group(1), match.group(2).strip("\"'"))
+
+    sources = []
+    for instruction in instructions:
+        if instruction.split(None, 1)[0].upper() in ("COPY", "ADD"):
+            instruction_sources = _copy_sources(instruction, build_args)
+            if instruction_sources is None:
+                util.info(f" BUILD: cannot determine the files used by '{instruction}', sending the whole package")
+                return None
+            sources += instruction_sources
+
+    context = file_mgmt.create_temporary_folder()
+    for source in sources:
+        matches = glob.glob(source.lstrip("/"), root_dir=package) if glob.has_magic(source) else [source.lstrip("/")]
+        for match in matches:
+            path = package / match
+            if not path.exists():
+                # let docker report the missing file
+                util.info(f" BUILD: '{match}' not found, sending the whole package")
+                file_mgmt.delete_folder(context)
+                return None
+            target = context / match
+            target.parent.mkdir(parents=True, exist_ok=True)
+            if path.is_dir():
+                shutil.copytree(path, target, dirs_exist_ok=True)
+            else:
+                shutil.copy2(path, target)
+    if (package / ".dockerignore").is_file():
+        shutil.copy2(package / ".dockerignore", context / ".dockerignore")
+
+    (context / "Dockerfile").write_text("\n".join(_directives(dockerfile) + list(map(_with_cache_mounts, instructions)))
+                                        + "\n", encoding="utf-8")
+    util.info(f" BUILD: staged {len(sources)} source/s of '{package}' in '{context}'")
+    return context
+
+
+def _report_steps(output: str) -> None:
+    names: Dict[str, str] = {}
+    results: Dict[str, float | None] = {}
+    for line in output.splitlines():
+        if match := _STEP_PATTERN.match(line):
+            names.setdefault(match.group(1), f"[{match.group(2)}] {match.group(3)}")
+        elif match := _STEP_RESULT_PATTERN.match(line):
+            results[match.group(1)] = None if match.group(3) else float(match.group(2))
+
+    steps = [(names[step], seconds) for step, seconds in results.items() if step in names]
+    for name, seconds in steps:
+        duration = "cached" if seconds is None else f"{seconds:.1f} s"
+        util.info(f"   {duration:>9}: {name[:100]}", always_display=True, append_full_stop=False)
+    cached = sum(1 for _, seconds in steps if seconds is None)
+    total = sum(seconds for _, seconds in steps if seconds is not None)
+    util.info(f"Docker image built, steps took {total:.1f} s ({cached} of {len(steps)} steps cached).", always_display=True)
+
+
+def build_image(package: Path, tag: str, build_args: Dict[str, str]) -> None:
+    context = stage_context(package, build_args)
+    arguments = [argument for name, value in build_args.items() for argument in ("--build-arg", f"{name}={value}")]
+    # cache mounts and the plain progress output, which contains the time of each step, require BuildKit
+    command = ["docker", "build", "--progress=plain", "-t", tag] + arguments + [str(context or package)]
+
+    success, output = asyncio.run(util.run_command_async(command, show_output=True,
+                                                         env=os.environ | {"DOCKER_BUILDKIT": "1"}))
+    if context is not None:
+        file_mgmt.delete_folder(context)
+    if success:
+        _report_steps(output)
+        return
+
+    if not _BUILDKIT_UNAVAILABLE_PATTERN.search(output):
+        # e.g. an error in the Dockerfile or a failing installation, which would fail the same way again
+        util.error(f"Command '{shlex.join(command)}' exited unsuccessfully. See the above output for details.")
+
+    # docker without buildx only has the classic builder, which supports neither cache mounts nor plain progress
+    util.warning("BuildKit is not available.", "The image is built again from the unmodified package, as without this tool")
+    util.run_command(["docker", "build", "-t", tag] + arguments + [str(package)])
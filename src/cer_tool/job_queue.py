@@ -0,0 +1,167 @@
+import json
+import sqlite3
+import time
+from os import PathLike
+from pathlib import Path
+from typing import Tuple
+
+from platformdirs import user_data_path
+
+from cer_tool import util
+
+
+DEFAULT_QUEUE_PATH: Path = user_data_path("cer-tool", ensure_exists=True) / "jobs.sqlite3"
+
+_SCHEMA: str = """
+CREATE TABLE IF NOT EXISTS jobs (
+    job_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    exercise TEXT NOT NULL,
+    notebook_name TEXT NOT NULL,
+    notebook BLOB NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    worker TEXT,
+    claimed REAL,
+    result TEXT,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    error TEXT,
+    created REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs(exercise, status);
+"""
+
+# running jobs not finished within this time are assumed to be abandoned by their worker
+_STALE_AFTER_SECONDS: float = 30 * 60
+# jobs failing or abandoned this often are not claimed again, s.t. a single submission cannot stop all workers
+_MAX_ATTEMPTS: int = 3
+# a job not claimed within this time is reported, e.g. if no worker is running
+_UNCLAIMED_HINT_SECONDS: float = 60
+
+
+class JobQueue:
+    """Grading jobs shared between any number of processes through a SQLite database."""
+
+    path: Path = DEFAULT_QUEUE_PATH
+
+    def __init__(self, path: str | PathLike[str] | None = None) -> None:
+        self.path = Path(path) if path else DEFAULT_QUEUE_PATH
+        connection = self._connect()
+        connection.execute("PRAGMA journal_mode = WAL")
+        # queues created before failed jobs were recorded (no columns if not created yet)
+        columns = [row[1] for row in connection.execute("PRAGMA table_info(jobs)")]
+        for column, definition in (("attempts", "INTEGER NOT NULL DEFAULT 0"), ("error", "TEXT")):
+            if columns and column not in columns:
+                connection.execute(f"ALTER TABLE jobs ADD COLUMN {column} {definition}")
+        connection.executescript(_SCHEMA)
+        connection.close()
+
+    def _connect(self) -> sqlite3.Connection:
+        # other processes may hold the lock for a short time, so wait instead of failing immediately
+        return sqlite3.connect(self.path, timeout=30, isolation_level=None)
+
+    def submit(self, exercise: str, notebook: Path) -> int:
+        connection = self._connect()
+        cursor = connection.execute("INSERT INTO jobs (exercise, notebook_name, notebook, created) VALUES (?, ?, ?, ?)",
+                                    (exercise, notebook.name, notebook.read_bytes(), time.time()))
+        connection.close()
+        return cursor.lastrowid
+
+    @staticmethod
+    def _fail_abandoned(connection: sqlite3.Connection) -> None:
+        # e.g. the worker was killed while grading, the job is only claimed again if attempts are left
+        connection.execute("UPDATE jobs SET status = 'failed', error = 'abandoned by worker ' || worker || ' after ' "
+                           "|| attempts || ' attempt/s' WHERE status = 'running' AND claimed < ? AND attempts >= ?",
+                           (time.time() - _STALE_AFTER_SECONDS, _MAX_ATTEMPTS))
+
+    def claim(self, exercise: str, worker: str) -> Tuple[int, str, bytes] | None:
+        connection = self._connect()
+        try:
+            # lock the database for writing, s.t. no two workers claim the same job
+            connection.execute("BEGIN IMMEDIATE")
+            self._fail_abandoned(connection)
+            row = connection.execute(
+                "SELECT job_id, notebook_name, notebook FROM jobs WHERE exercise = ? AND "
+                "(status = 'pending' OR (status = 'running' AND claimed < ?)) ORDER BY job_id LIMIT 1",
+                (exercise, time.time() - _STALE_AFTER_SECONDS)).fetchone()
+            if row is not None:
+                connection.execute("UPDATE jobs SET status = 'running', worker = ?, claimed = ?, attempts = attempts + 1 "
+                                   "WHERE job_id = ?", (worker, time.time(), row[0]))
+            connection.execute("COMMIT")
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        finally:
+            connection.close()
+        return row
+
+    def complete(self, job_id: int, result: dict) -> None:
+        connection = self._connect()
+        connection.execute("UPDATE jobs SET status = 'done', result = ?, notebook = x'' WHERE job_id = ?",
+                           (json.dumps(result), job_id))
+        connection.close()
+
+    def release(self, job_id: int) -> None:
+        # e.g. the worker is stopped, which does not count as an attempt
+        connection = self._connect()
+        connection.execute("UPDATE jobs SET status = 'pending', worker = NULL, claimed = NULL, attempts = attempts - 1 "
+                           "WHERE job_id = ? AND status = 'running'", (job_id,))
+        connection.close()
+
+    def fail(self, job_id: int, error: str) -> bool:
+        """Returns whether the job failed for good, otherwise it is left to the next worker."""
+        connection = self._connect()
+        connection.execute("UPDATE jobs SET status = CASE WHEN attempts >= ? THEN 'failed' ELSE 'pending' END, "
+                           "error = ?, worker = NULL, claimed = NULL WHERE job_id = ? AND status = 'running'",
+                           (_MAX_ATTEMPTS, error, job_id))
+        row = connection.execute("SELECT status FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+        connection.close()
+        return row is not None and row[0] == "failed"
+
+    def cancel(self, job_id: int) -> None:
+        connection = self._connect()
+        connection.execute("DELETE FROM jobs WHERE job_id = ? AND status = 'pending'", (job_id,))
+        connection.close()
+
+    def status(self, job_id: int) -> Tuple[str, str | None, float | None]:
+        """Status of the job, the worker and when it claimed the job."""
+        connection = self._connect()
+        self._fail_abandoned(connection)
+        row = connection.execute("SELECT status, worker, claimed FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+        connection.close()
+        return row if row is not None else ("unknown", None, None)
+
+    def error(self, job_id: int) -> str | None:
+        connection = self._connect()
+        row = connection.execute("SELECT error FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+        connection.close()
+        return row[0] if row is not None else None
+
+    def result(self, job_id: int) -> dict | None:
+        connection = self._connect()
+        row = connection.execute("SELECT result FROM jobs WHERE job_id = ? AND status = 'done'", (job_id,)).fetchone()
+        connection.close()
+        return json.loads(row[0]) if row is not None else None
+
+    def wait_for_result(self, job_id: int, poll_interval: float = 0.5) -> dict:
+        """Raises a RuntimeError with the error of the last attempt if the job failed for good."""
+        started = time.monotonic()
+        reported = None
+        while (result := self.result(job_id)) is None:
+            status, worker, claimed = self.status(job_id)
+            if status == "unknown":
+                util.error(f"Grading job {job_id} does not exist (anymore) in queue '{self.path}'")
+            elif status == "failed":
+                raise RuntimeError(self.error(job_id))
+            elif status == "pending" and reported != status and time.monotonic() - started > _UNCLAIMED_HINT_SECONDS:
+                reported = status
+                util.warning(f"Grading job {job_id} was not claimed within {_UNCLAIMED_HINT_SECONDS:.0f} s.",
+                             "Please check that a 'pex-worker' is running for this queue and exercise")
+            elif status == "running" and claimed < time.time() - _STALE_AFTER_SECONDS and reported != "stale":
+                reported = "stale"
+                util.warning(f"Grading job {job_id} was claimed by '{worker}' more than {_STALE_AFTER_SECONDS / 60:.0f} "
+                             "min ago without a result.", "It is graded again by the next 'pex-worker' started for "
+                                                          "this queue and exercise")
+            elif status == "running" and reported != worker and claimed >= time.time() - _STALE_AFTER_SECONDS:
+                reported = worker
+                util.info(f" QUEUE: job {job_id} is graded by '{worker}'")
+            time.sleep(poll_interval)
+        return result
@@ -1,6 +1,6 @@
 import argparse
 
-from cer_tool import command_handlers, file_mgmt, util
+from cer_tool import daemon_client, util
 from cer_tool.flags import flags
 
 
@@ -16,7 +16,7 @@ def main():
     parser_prepare = subparsers.add_parser("prepare", aliases=["pp"],
                                            help="gather and rename submission files, s.t. they can be easily graded with a PDF annotator",
                                            description="gather and rename submission files, s.t. they can be easily graded with a PDF annotator")
-    parser_prepare.set_defaults(func=command_handlers.prepare)
+    parser_prepare.set_defaults(func="prepare")
 
     parser_prepare_group_input = parser_prepare.add_argument_group("input files")
     parser_prepare_group_input.add_argument("-g", "--groups", required=True,
@@ -26,6 +26,20 @@ def main():
 
     parser_prepare.add_argument("-o", "--out", required=False, default="./submissions",
                                 help="custom output folder")
+    parser_prepare.add_argument("-j", "--jobs", type=int, required=False,
+                                help="number of students processed concurrently (default: depending on the number of CPUs)")
+
+    # index
+    parser_index = subparsers.add_parser("index", aliases=["idx"],
+                                         help="catalog the submission folders of a Moodle export in advance",
+                                         description="catalog the submission folders of a Moodle export in advance "
+                                                     "(prepare and grade-pex do this implicitly)")
+    parser_index_group_input = parser_index.add_argument_group("input files")
+    parser_index_group_input.add_argument("-s", "--submissions", required=True,
+                                          help="path to a zip file or a folder containing the submissions")
+    parser_index.add_argument("-r", "--rebuild", action="store_true", required=False,
+                              help="rebuild the catalog even if the submissions did not change")
+    parser_index.set_defaults(func="index")
 
     # edit_feedback
     parser_feedback = subparsers.add_parser("edit-feedback", aliases=["efb"],
@@ -35,9 +49,14 @@ def main():
     parser_feedback_group_input.add_argument("-t", "--grading-sheet", required=True,
                                              help="path to the grading sheet to edit")
     parser_feedback.add_argument("-o", "--out", required=False, help="custom output file (default: overwrite input file)")
-    parser_feedback.add_argument("student_name", nargs='+',
+    parser_feedback_group_input.add_argument("-g", "--groups", required=False,
+                                             help="path to text file containing groups: edit the feedback of all their "
+                                                  "members at once (optionally filtered by student_name)")
+    parser_feedback.add_argument("-a", "--all", action="store_true", required=False,
+                                 help="edit the feedback of all students matching student_name at once")
+    parser_feedback.add_argument("student_name", nargs='*',
                                  help="partial or complete name of the student whose feedback should be edited")
-    parser_feedback.set_defaults(func=command_handlers.edit_feedback)
+    parser_feedback.set_defaults(func="edit_feedback")
 
     # finish
     parser_finish = subparsers.add_parser("finish", aliases=["fs"],
@@ -58,7 +77,10 @@ def main():
                                help="custom path for output grading sheet (default: ./_out_GRADING_SHEET.csv)")
     parser_finish.add_argument("-sn", "--submission-name", required=False,
                                help="name of the submission to be included in the feedback file names (default: '')")
-    parser_finish.set_defaults(func=command_handlers.finish)
+    parser_finish.add_argument("-j", "--jobs", type=int, required=False,
+                               help="number of PDF files optimized concurrently, see config 'pdf_optimization' "
+                                    "(default: depending on the number of CPUs)")
+    parser_finish.set_defaults(func="finish")
 
     # grade_pex
     parser_pex = subparsers.add_parser("grade-pex", aliases=["pex"],
@@ -77,7 +99,52 @@ def main():
 
     parser_pex.add_argument("-ot", "--out-grading-sheet", required=False,
                             help="custom path for output grading sheet (default: overwrite input file)")
-    parser_pex.set_defaults(func=command_handlers.grade_pex)
+    parser_pex.add_argument("-la", "--look-ahead", type=int, required=False, default=2,
+                            help="number of upcoming groups graded in the background during review (default: 2)")
+    parser_pex.add_argument("-q", "--queue", nargs='?', const="", required=False,
+                            help="let 'pex-worker' processes run the automatic tests using the given job queue "
+                                 "(default queue if no path is given)")
+    parser_pex.set_defaults(func="grade_pex")
+
+    # pex_worker
+    parser_worker = subparsers.add_parser("pex-worker", aliases=["pexw"],
+                                          help="run automatic tests for grade-pex sessions using a shared job queue",
+                                          description="run automatic tests for grade-pex sessions using a shared job queue")
+    parser_worker_group_input = parser_worker.add_argument_group("input files")
+    parser_worker_group_input.add_argument("-p", "--grading-package", required=True,
+                                           help="path to an archive or a folder containing the scripts for automatic grading")
+    parser_worker.add_argument("-q", "--queue", required=False,
+                               help="path to the job queue shared with grade-pex (default: queue in user data directory)")
+    parser_worker.set_defaults(func="pex_worker")
+
+    # pex_report
+    parser_pex_report = subparsers.add_parser("pex-report", aliases=["pexr"],
+                                              help="summarize the recorded results of graded programming exercises",
+                                              description="summarize the recorded results of graded programming exercises")
+    parser_pex_report.add_argument("-e", "--exercise", nargs='+', required=False,
+                                   help="name/s of the exercise/s to include, e.g. 'pex3' (default: all recorded exercises)")
+    parser_pex_report.add_argument("-o", "--out", required=False,
+                                   help="path for exporting all test results as .csv or .parquet file")
+    parser_pex_report.set_defaults(func="pex_report")
+
+    # pex_similarity
+    parser_similarity = subparsers.add_parser("pex-similarity", aliases=["pexs"],
+                                              help="find near-duplicate programming exercise submissions",
+                                              description="find near-duplicate programming exercise submissions, "
+                                                          "including those indexed in earlier runs")
+    parser_similarity_group_input = parser_similarity.add_argument_group("input files")
+    parser_similarity_group_input.add_argument("-s", "--submissions", required=True,
+                                               help="path to an archive or a folder containing the submissions")
+    parser_similarity_group_input.add_argument("-i", "--ignore-template", required=False,
+                                               help="path to a template notebook whose code is ignored for comparison")
+    parser_similarity_group_input.add_argument("-g", "--groups", required=False,
+                                               help="path to text file containing groups: similar notebooks of members "
+                                                    "of the same group are not reported")
+    parser_similarity.add_argument("-e", "--exercise", required=True,
+                                   help="name of the exercise, e.g. 'pex3' (only submissions of the same exercise are compared)")
+    parser_similarity.add_argument("-th", "--threshold", type=float, required=False, default=0.8,
+                                   help="minimum estimated similarity between 0 and 1 to report (default: 0.8)")
+    parser_similarity.set_defaults(func="pex_similarity")
 
     # config
     parser_config = subparsers.add_parser("config",
@@ -90,21 +157,44 @@ def main():
     # config-list
     parser_config_list = config_subparsers.add_parser("list", aliases=["l"],
                                                       help="list the current configuration", description="list the current configuration")
-    parser_config_list.set_defaults(func=command_handlers.config_list)
+    parser_config_list.set_defaults(func="config_list")
 
     # config-edit
     parser_config_edit = config_subparsers.add_parser("edit", aliases=["e"],
                                                       help="edit the current configuration",
                                                       description="edit the current configuration")
-    parser_config_edit.set_defaults(func=command_handlers.config_edit)
+    parser_config_edit.set_defaults(func="config_edit")
+
+    # daemon
+    parser_daemon = subparsers.add_parser("daemon",
+                                          help="keep grading sheets and configuration loaded to speed up short commands",
+                                          description="keep grading sheets and configuration loaded to speed up short "
+                                                      "commands (currently: edit-feedback)")
+    daemon_subparsers = parser_daemon.add_subparsers(required=True,
+                                                     title="daemon subcommands", description="The following commands are available:",
+                                                     help="command to be executed")
+    daemon_subparsers.add_parser("start", help="start the daemon in the background",
+                                 description="start the daemon in the background").set_defaults(func="daemon_start")
+    daemon_subparsers.add_parser("run", help="run the daemon in the foreground",
+                                 description="run the daemon in the foreground").set_defaults(func="daemon_run")
+    daemon_subparsers.add_parser("stop", help="stop the running daemon",
+                                 description="stop the running daemon").set_defaults(func="daemon_stop")
+    daemon_subparsers.add_parser("status", help="show whether the daemon is running",
+                                 description="show whether the daemon is running").set_defaults(func="daemon_status")
 
 
     args = parser_main.parse_args()
 
     flags["verbose"] = args.verbose
     try:
-        args.func(args)
+        if args.func in daemon_client.CLIENT_COMMANDS and daemon_client.is_running():
+            getattr(daemon_client, args.func)(args)
+        else:
+            # imported lazily, s.t. commands served by the daemon do not pay for loading pandas etc.
+            from cer_tool import command_handlers
+            getattr(command_handlers, args.func)(args)
     except KeyboardInterrupt:
+        from cer_tool import file_mgmt
         file_mgmt.cleanup()
         util.warning("Aborted by user.", "Some temporary files or folders may have been left.")
 
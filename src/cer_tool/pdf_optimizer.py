@@ -0,0 +1,69 @@
+import shutil
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, List
+
+from cer_tool import util, config, file_mgmt
+
+
+def _ghostscript_command(cfg: config.PdfOptimizationConfig, source: Path, target: Path) -> List[str]:
+    dpi = cfg.image_resolution_dpi
+    return [cfg.ghostscript, "-q", "-dBATCH", "-dNOPAUSE", "-dSAFER", "-sDEVICE=pdfwrite",
+            "-dCompatibilityLevel=1.5",
+            # recompress and downsample page images, e.g. scans and pages rendered by tablet apps
+            "-dAutoFilterColorImages=true", "-dAutoFilterGrayImages=true",
+            "-dDownsampleColorImages=true", f"-dColorImageResolution={dpi}", "-dColorImageDownsampleType=/Bicubic",
+            "-dDownsampleGrayImages=true", f"-dGrayImageResolution={dpi}", "-dGrayImageDownsampleType=/Bicubic",
+            "-dDownsampleMonoImages=true", f"-dMonoImageResolution={dpi * 2}",
+            # embed each font and identical images only once
+            "-dSubsetFonts=true", "-dCompressFonts=true", "-dDetectDuplicateImages=true",
+            # linearized output
+            "-dFastWebView=true",
+            f"-sOutputFile={target}", str(source)]
+
+
+def optimize(source: Path, target: Path) -> Path:
+    """Returns an optimized copy of the PDF, or the PDF itself if the copy is not sufficiently smaller."""
+    cfg = config.snapshot().pdf_optimization
+    try:
+        size = source.stat().st_size
+        if size < cfg.min_file_bytes:
+            return source
+
+        # like the docker commands, s.t. the number of concurrent commands is limited for the whole process
+        success, output = util.run_potentially_failing_command(_ghostscript_command(cfg, source, target))
+        if not success or not target.exists():
+            raise OSError(output.strip())
+        optimized_size = target.stat().st_size
+    except Exception as e:
+        # e.g. a damaged PDF, the feedback is packed regardless (errors of the pool would only surface in 'finish')
+        util.warning(f"Could not optimize '{source.name}': {e}", "The original file will be used.")
+        target.unlink(missing_ok=True)
+        return source
+
+    if optimized_size > size * (1 - cfg.min_saving_ratio):
+        util.info(f" PDF: '{source.name}' kept ({optimized_size / 1e6:.1f} MB optimized vs. {size / 1e6:.1f} MB)")
+        target.unlink()
+        return source
+
+    util.info(f" PDF: '{source.name}' optimized ({size / 1e6:.1f} MB → {optimized_size / 1e6:.1f} MB)")
+    return target
+
+
+def optimize_all(files: List[Path], jobs: int | None = None) -> Dict[Path, Future]:
+    """Starts optimizing the PDFs in the background, the futures resolve to the file to use instead."""
+    cfg = config.snapshot().pdf_optimization
+    pdfs = list(dict.fromkeys(file for file in files if file.suffix.lower() == ".pdf"))
+    if not cfg.enabled or not pdfs:
+        return {}
+    if shutil.which(cfg.ghostscript) is None:
+        util.warning(f"Ghostscript ('{cfg.ghostscript}') was not found.", "PDF files will not be optimized.")
+        return {}
+
+    target_folder = file_mgmt.create_temporary_folder(sum(map(lambda file: file.stat().st_size, pdfs)))
+    # ghostscript runs as a separate process, so threads suffice
+    pool = ThreadPoolExecutor(jobs)
+    # numbered, as files of different students may have the same name
+    futures = {file: pool.submit(optimize, file, target_folder / f"{i}_{file.name}") for i, file in enumerate(pdfs)}
+    pool.shutdown(wait=False)
+    return futures
@@ -0,0 +1,94 @@
+import json
+import re
+from os import PathLike
+from pathlib import Path
+from typing import Dict, Tuple
+
+from cer_tool import util, config
+
+
+def _parse_number(text: str) -> float | None:
+    try:
+        return float(text.strip().replace(",", "."))
+    except ValueError:
+        return None
+
+
+def _resolve(value, default=None):
+    # entries may be references to objects elsewhere in the file
+    return default if value is None else value.get_object()
+
+
+def _from_form(root, field_name: str) -> float | None:
+    # fields may be nested, the value of the designated field is used
+    form = _resolve(root.get("/AcroForm"), {})
+    fields = list(_resolve(form.get("/Fields"), []))
+    while fields:
+        field = fields.pop().get_object()
+        if field.get("/T") == field_name and field.get("/V") is not None:
+            return _parse_number(str(_resolve(field["/V"])))
+        fields += list(_resolve(field.get("/Kids"), []))
+    return None
+
+
+def _from_annotations(pages, pattern: re.Pattern, last_pages: int) -> float | None:
+    # points are written at the end, so only the annotations of the last pages are read
+    for index in range(len(pages) - 1, max(-1, len(pages) - 1 - last_pages), -1):
+        for annotation in _resolve(pages[index].get("/Annots"), []):
+            contents = _resolve(annotation.get_object().get("/Contents"))
+            if contents is not None and (match := pattern.search(str(contents))):
+                return _parse_number(match.group(1))
+    return None
+
+
+def read_points(path: Path) -> float | None:
+    """Points inside the PDF, None if there are none. Raises a ValueError if the PDF cannot be read."""
+    try:
+        from pypdf import PdfReader
+        from pypdf.errors import PyPdfError
+    except ImportError:
+        util.error("Reading points from PDF files requires 'pypdf' to be installed")
+
+    cfg = config.snapshot().pdf_points
+    try:
+        # the reader only loads the cross-reference table and trailer, objects are read from the file on access
+        with open(path, "rb") as f:
+            reader = PdfReader(f)
+            points = _from_form(reader.trailer["/Root"], cfg.form_field) if cfg.form_field else None
+            if points is None:
+                points = _from_annotations(reader.pages, re.compile(cfg.annotation_pattern), cfg.last_pages)
+            return points
+    except (PyPdfError, OSError, ValueError, KeyError) as e:
+        raise ValueError(f"Could not read points from '{path.name}': {e}") from e
+
+
+def load_cache(folder: str | PathLike[str]) -> Dict[str, Tuple[int, int, float | None]]:
+    cache_file = Path(folder) / config.snapshot().filenames.points_cache_file
+    if not cache_file.exists():
+        return {}
+    with open(cache_file, "r", encoding="utf-8") as f:
+        return {path: tuple(entry) for path, entry in json.load(f).items()}
+
+
+def save_cache(folder: str | PathLike[str], cache: Dict[str, Tuple[int, int, float | None]]) -> None:
+    cache_file = Path(folder) / config.snapshot().filenames.points_cache_file
+    with open(cache_file, "w", encoding="utf-8") as f:
+        json.dump(cache, f, indent=4, sort_keys=True)
+    util.info(f" CREATE: file '{cache_file}'")
+
+
+def cached_points(file: Path, folder: Path, cache: Dict[str, Tuple[int, int, float | None]]) -> float | None:
+    # PDFs are only parsed again if they were modified since the last run
+    key = file.relative_to(folder).as_posix()
+    stat = file.stat()
+    entry = cache.get(key)
+    if entry is None or entry[:2] != (stat.st_mtime_ns, stat.st_size):
+        try:
+            entry = (stat.st_mtime_ns, stat.st_size, read_points(file))
+        except ValueError as e:
+            # not cached, s.t. the warning is shown again on the next run
+            util.warning(str(e), "Points of the filename will be used.")
+            cache.pop(key, None)
+            return None
+        cache[key] = entry
+    return entry[2]
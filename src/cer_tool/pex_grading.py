@@ -1,19 +1,36 @@
+import asyncio
+import concurrent.futures
 import json
+import os
 import shutil
+import socket
+import threading
+import uuid
 from pathlib import Path
 import math
-from typing import Tuple, List
+import time
+from typing import Tuple, List, Dict, Set
 
-from cer_tool import util, file_mgmt, config, grading_sheet
+from cer_tool import util, file_mgmt, config, grading_sheet, image_build, preflight, results_db, progress
+from cer_tool.job_queue import JobQueue
+from cer_tool.results_db import TestResult, StoredGrading
 
 class PexFeedback:
     test_output: str = ""
     additional_feedback: str = ""
     points: float = 0.0
+    test_results: List[TestResult] = []
+    runtime_seconds: float | None = None
+    notebook_hash: str | None = None
 
-    def __init__(self, points: str | float, test_output: str, additional_feedback: str) -> None:
+    def __init__(self, points: str | float, test_output: str, additional_feedback: str,
+                 test_results: List[TestResult] | None = None, runtime_seconds: float | None = None,
+                 notebook_hash: str | None = None) -> None:
         self.test_output = test_output.strip()
         self.additional_feedback = additional_feedback.strip()
+        self.test_results = test_results or []
+        self.runtime_seconds = runtime_seconds
+        self.notebook_hash = notebook_hash
         try:
             self.points = float(points)
         except ValueError:
@@ -42,23 +59,27 @@ class PexFeedback:
         self.points = other.points
         self.test_output = other.test_output
         self.additional_feedback = other.additional_feedback
+        self.test_results = other.test_results
+        self.runtime_seconds = other.runtime_seconds
+        self.notebook_hash = other.notebook_hash
 
 
     def as_html(self) -> str:
+        magic_comment = config.snapshot().pex.html_magic_comment
         html = ""
         html += f"<p><span style=\"text-decoration: underline;\">Ausgabe der automatischen Tests</span>:</p>"
-        html += f"<pre class=\"language-markup\"><code>{config.get("pex.html_magic_comment")}{self.test_output}{config.get("pex.html_magic_comment")}</code></pre>"
+        html += f"<pre class=\"language-markup\"><code>{magic_comment}{self.test_output}{magic_comment}</code></pre>"
 
         if self.additional_feedback:
             feedback_html = grading_sheet.encode_comment(self.additional_feedback.splitlines())
             html += f"<p><span style=\"text-decoration: underline;\">Zusätzliches Feedback</span>:</p>"
-            html += f"{config.get("pex.html_magic_comment")}{feedback_html}{config.get("pex.html_magic_comment")}"
+            html += f"{magic_comment}{feedback_html}{magic_comment}"
 
         return html
 
     @classmethod
     def from_html(cls, html: str, points: float):
-        html = html.split(config.get("pex.html_magic_comment"))
+        html = html.split(config.snapshot().pex.html_magic_comment)
         try:
             test_output = html[1].strip()
         except IndexError:
@@ -73,18 +94,43 @@ class PexFeedback:
 
         return cls(points, test_output, additional_feedback)
 
+    @classmethod
+    def from_stored(cls, stored: StoredGrading):
+        return cls(stored.points, stored.test_output, stored.additional_feedback,
+                   stored.test_results, stored.runtime_seconds, stored.notebook_hash)
+
+    def as_dict(self) -> dict:
+        return {
+            "points": self.points,
+            "test_output": self.test_output,
+            "additional_feedback": self.additional_feedback,
+            "test_results": [list(result) for result in self.test_results],
+            "runtime_seconds": self.runtime_seconds,
+            "notebook_hash": self.notebook_hash,
+        }
+
+    @classmethod
+    def from_dict(cls, d: dict):
+        return cls(d["points"], d["test_output"], d["additional_feedback"],
+                   [TestResult(*result) for result in d["test_results"]], d["runtime_seconds"], d["notebook_hash"])
+
+    def as_stored(self, course: str, exercise: str, group: List[str], group_ids: List[int]) -> StoredGrading:
+        return StoredGrading(course, exercise, ", ".join(group), group_ids, self.points, self.test_output,
+                             self.additional_feedback, self.test_results, self.runtime_seconds, self.notebook_hash)
+
 
     def as_editable_text(self, header: str) -> List[str]:
+        divider = config.snapshot().pex.text_divider
         text = ""
         if header:
             text += f"{header}\n"
-        text += f"# Lines starting with '#' are ignored. Do not remove lines starting with '{config.get("pex.text_divider")}'.\n"
+        text += f"# Lines starting with '#' are ignored. Do not remove lines starting with '{divider}'.\n"
         text += f"\n"
-        text += f"# Test Output:\n{config.get("pex.text_divider")}\n{self.test_output}\n{config.get("pex.text_divider")}\n"
+        text += f"# Test Output:\n{divider}\n{self.test_output}\n{divider}\n"
         text += f"\n"
-        text += f"# Additional Feedback:\n{config.get("pex.text_divider")}\n{self.additional_feedback}\n{config.get("pex.text_divider")}\n"
+        text += f"# Additional Feedback:\n{divider}\n{self.additional_feedback}\n{divider}\n"
         text += f"\n"
-        text += f"# Points:\n{config.get("pex.text_divider")}\n{self.points}\n{config.get("pex.text_divider")}\n"
+        text += f"# Points:\n{divider}\n{self.points}\n{divider}\n"
 
         return text.splitlines()
 
@@ -94,7 +140,7 @@ class PexFeedback:
         filtered_lines = filter(lambda l: len(l) > 0 and not l.startswith('#'), text)
         text = '\n'.join(filtered_lines)
 
-        text = text.split(config.get("pex.text_divider"))
+        text = text.split(config.snapshot().pex.text_divider)
 
         try:
             test_output = text[1].strip()
@@ -109,20 +155,49 @@ class PexFeedback:
 class PexGrader:
     pex_name: str = ""
     grading_package: Path | None = None
+    image_built: bool = False
+    # functions required by the tests, see preflight.expected_names()
+    expected_names: Set[str] = set()
 
-    def __init__(self, grading_package: Path) -> None:
+    def __init__(self, grading_package: Path, build_image: bool = True) -> None:
         try:
             self.pex_name = grading_package.stem.split("_")[1]
         except IndexError:
             util.error(f"Unexpected name of grading package '{grading_package.name}'. Expected something like 'sc_pexN_grading'.")
 
         self.grading_package = file_mgmt.unzip_if_not_folder(grading_package)
+        self.image_built = build_image
+
+        # also without an image, e.g. to check submissions before adding them to a job queue
+        solutions = file_mgmt.find_all_paths("*sol*.ipynb", self.grading_package / self.pex_name / "python")
+        if len(solutions) == 1:
+            self.expected_names = preflight.expected_names(self.grading_package, solutions[0])
+        if not build_image:
+            return
 
         util.info("Preparing Docker image ...", always_display=True)
-        util.run_command(f"docker build -t {self.pex_name}-docker --build-arg exercise={self.pex_name} {self.grading_package}")
+        image_build.build_image(self.grading_package, f"{self.pex_name}-docker", {"exercise": self.pex_name})
 
 
-    def grade(self, submission: Path) -> PexFeedback:
+    def grade(self, submission: Path, run_preflight: bool = True) -> PexFeedback:
+        return asyncio.run(self.grade_async(submission, run_preflight=run_preflight))
+
+    def check_submission(self, submission: Path, print_output: bool = True) -> PexFeedback | None:
+        """Feedback for submissions certain to fail, which do not need a container."""
+        reason = preflight.check(submission, self.expected_names)
+        if reason is None:
+            return None
+        if print_output:
+            util.info(f"Pre-flight check FAILED: {reason}. Regrade ('r') to run the tests anyway.",
+                      always_display=True, append_full_stop=False)
+        return PexFeedback(0, f"Tests were not run: {reason}.", "", [], None, file_mgmt.hash_file(submission))
+
+    async def grade_async(self, submission: Path, print_output: bool = True, interactive: bool = True,
+                          run_preflight: bool = True) -> PexFeedback:
+        # e.g. not when regrading, s.t. the tests can be run regardless of the pre-flight check
+        if run_preflight and (feedback := self.check_submission(submission, print_output)) is not None:
+            return feedback
+
         # create folder structure needed for docker container / grading scripts
         grading_folder = file_mgmt.create_temporary_folder()
         grading_source = grading_folder / Path(f"{self.pex_name}/group-{config.get("pex.docker_group_name")}")
@@ -131,99 +206,333 @@ class PexGrader:
         file_mgmt.create_folder(grading_source)
         file_mgmt.create_folder(grading_target)
         shutil.copy2(submission, grading_source / f"sc-{self.pex_name}.ipynb")
+        notebook_hash = file_mgmt.hash_file(submission)
 
         # initiate grading by starting the docker container
         util.info(f"Grading submission '{submission}'...")
-        success, stdout = util.run_potentially_failing_command("docker run --rm "
-                         f"--mount type=bind,source=\"{grading_folder.resolve()}\",target=/submissions "
-                         f"--mount type=bind,source=\"{grading_target.resolve()}\",target=/grading_schemes "
-                         f"--name {self.pex_name}-docker-group-{config.get("pex.docker_group_name")} "
-                         f"{self.pex_name}-docker {self.pex_name} {config.get("pex.docker_group_name")}")
+        start_time = time.perf_counter()
+        # unique container name, s.t. multiple gradings may run at the same time
+        container_name = f"{self.pex_name}-docker-group-{config.get("pex.docker_group_name")}-{uuid.uuid4().hex[:8]}"
+        try:
+            success, stdout = await util.run_command_async(["docker", "run", "--rm",
+                             "--mount", f"type=bind,source={grading_folder.resolve()},target=/submissions",
+                             "--mount", f"type=bind,source={grading_target.resolve()},target=/grading_schemes",
+                             "--name", container_name,
+                             f"{self.pex_name}-docker", self.pex_name, config.get("pex.docker_group_name")],
+                             on_cancel=["docker", "kill", container_name])
+        except asyncio.CancelledError:
+            file_mgmt.delete_folder(grading_folder)
+            raise
+        runtime_seconds = time.perf_counter() - start_time
+        progress.record("docker_runs", 1, runtime_seconds)
+        # workers of a queue have no other progress to report
+        progress.write_metrics()
 
         if success:
             # re-print stdout
-            util.info(stdout, always_display=True, append_full_stop=False)
+            if print_output:
+                util.info(stdout, always_display=True, append_full_stop=False)
 
             # parse feedback file
-            feedback_file = file_mgmt.find_single_path('*.json', grading_target)
+            try:
+                feedback_file = file_mgmt.find_single_path('*.json', grading_target, interactive=interactive)
+            except LookupError:
+                file_mgmt.delete_folder(grading_folder)
+                raise
             with open(feedback_file, 'r') as f:
                 d = json.load(f)
             grade_text, reached_points = _json_to_txt(d)
             reached_points = float(reached_points)
+            test_results = _json_to_test_results(d)
         else:
-            util.info(f"Automatic grading FAILED:\n\n{stdout}", always_display=True, append_full_stop=False)
+            if print_output:
+                util.info(f"Automatic grading FAILED:\n\n{stdout}", always_display=True, append_full_stop=False)
             grade_text = f"Failed to run tests:\n{stdout}\n(end of output)"
             reached_points = 0
+            test_results = []
 
         # cleanup created folder structure
         file_mgmt.delete_folder(grading_folder)
 
         # return a new Feedback object
-        return PexFeedback(reached_points, grade_text, "")
+        return PexFeedback(reached_points, grade_text, "", test_results, runtime_seconds, notebook_hash)
+
 
+    def solution(self) -> Path:
+        return file_mgmt.find_single_path("*sol*.ipynb", self.grading_package / self.pex_name / "python")
 
     def open_solution(self) -> None:
-        solution_path = file_mgmt.find_single_path("*sol*.ipynb", self.grading_package / self.pex_name / "python")
+        solution_path = self.solution()
         _notebook_auto_edit(solution_path)
-        file_mgmt.open_file(solution_path)
+        util.open_file(solution_path)
 
-    def cleanup(self) -> None:
-        util.info("Cleaning up Docker image ...", always_display=True)
-        util.run_command(f"docker rmi {self.pex_name}-docker")
+    def cleanup(self, remove_image: bool = True) -> None:
+        if self.image_built and remove_image:
+            util.info("Cleaning up Docker image ...", always_display=True)
+            util.run_command(["docker", "rmi", f"{self.pex_name}-docker"])
         file_mgmt.cleanup()
 
 
+class QueuedGrader:
+    """Grades submissions through a job queue processed by separate 'pex-worker' processes."""
+
+    def __init__(self, grading_package: Path, queue: JobQueue) -> None:
+        # the grading package is only needed for the solution
+        self.grader = PexGrader(grading_package, build_image=False)
+        self.pex_name = self.grader.pex_name
+        self.queue = queue
+        self.pending_jobs: Dict[Path, int] = {}
+
+    def submit(self, submission: Path) -> None:
+        # submissions failing the pre-flight check are not queued, the workers do not check them again
+        if submission not in self.pending_jobs and self.grader.check_submission(submission, print_output=False) is None:
+            self.pending_jobs[submission] = self.queue.submit(self.pex_name, submission)
+
+    def grade(self, submission: Path, run_preflight: bool = True) -> PexFeedback:
+        if run_preflight and (feedback := self.grader.check_submission(submission)) is not None:
+            return feedback
+
+        # use a job submitted in advance, if any, otherwise (e.g. when regrading) submit a new one
+        job_id = self.pending_jobs.pop(submission, None)
+        if job_id is None:
+            job_id = self.queue.submit(self.pex_name, submission)
+
+        util.info(f"Waiting for job {job_id} in queue '{self.queue.path}' ...", always_display=True)
+        try:
+            feedback = PexFeedback.from_dict(self.queue.wait_for_result(job_id))
+        except RuntimeError as e:
+            # like a failing container, s.t. the group can be regraded or graded manually
+            util.warning(f"Grading job {job_id} failed: {e}")
+            return PexFeedback(0, f"Failed to run tests:\n{e}\n(end of output)", "", [], None,
+                               file_mgmt.hash_file(submission))
+        util.info(feedback.test_output, always_display=True, append_full_stop=False)
+        return feedback
+
+    def solution(self) -> Path:
+        return self.grader.solution()
+
+    def open_solution(self) -> None:
+        self.grader.open_solution()
+
+    def cleanup(self) -> None:
+        for job_id in self.pending_jobs.values():
+            self.queue.cancel(job_id)
+        self.pending_jobs.clear()
+        self.grader.cleanup()
+
+
+class LookAheadGrader:
+    """Grades the submissions of upcoming groups in the background, while the current group is reviewed."""
+
+    def __init__(self, grader: PexGrader, look_ahead: int) -> None:
+        self.grader = grader
+        self.pex_name = grader.pex_name
+        self.look_ahead = look_ahead
+        self.scheduled: Dict[Path, concurrent.futures.Future] = {}
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+        self.thread.start()
+
+    def _start(self, submission: Path, background: bool, run_preflight: bool = True) -> concurrent.futures.Future:
+        # gradings in the background must not ask the user, while a group is reviewed in the foreground
+        return asyncio.run_coroutine_threadsafe(
+            self.grader.grade_async(submission, print_output=not background, interactive=not background,
+                                    run_preflight=run_preflight), self.loop)
+
+    def schedule(self, submissions: List[Path]) -> None:
+        # start the first submissions in the given order, cancel the gradings that are no longer needed
+        wanted = submissions[:self.look_ahead + 1]
+        for submission in list(self.scheduled):
+            if submission not in wanted:
+                self.scheduled.pop(submission).cancel()
+                util.info(f" LOOK-AHEAD: cancelled grading of '{submission}'")
+        for submission in wanted:
+            if submission not in self.scheduled:
+                self.scheduled[submission] = self._start(submission, background=True)
+                util.info(f" LOOK-AHEAD: started grading of '{submission}'")
+
+    def grade(self, submission: Path, run_preflight: bool = True) -> PexFeedback:
+        # use a grading started in advance, if any, otherwise (e.g. when regrading) start a new one
+        future = self.scheduled.pop(submission, None)
+        if future is None or future.cancelled() or not run_preflight:
+            if future is not None:
+                future.cancel()
+            return self._start(submission, background=False, run_preflight=run_preflight).result()
+
+        try:
+            feedback = future.result()
+        except LookupError as e:
+            # e.g. several feedback files, the user is asked when grading again
+            util.info(f" LOOK-AHEAD: grading of '{submission}' failed ({e}), grading again")
+            return self._start(submission, background=False).result()
+        util.info(feedback.test_output, always_display=True, append_full_stop=False)
+        return feedback
+
+    def solution(self) -> Path:
+        return self.grader.solution()
+
+    def open_solution(self) -> None:
+        self.grader.open_solution()
+
+    def cancel_all(self) -> None:
+        async def cancel_tasks():
+            tasks = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+            for task in tasks:
+                task.cancel()
+            # wait until running containers are stopped
+            await asyncio.gather(*tasks, return_exceptions=True)
+            # let the subprocess transports close before the loop may be stopped
+            await asyncio.sleep(0)
+
+        self.scheduled.clear()
+        asyncio.run_coroutine_threadsafe(cancel_tasks(), self.loop).result()
+
+    def cleanup(self) -> None:
+        self.cancel_all()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.loop.close()
+        self.grader.cleanup()
+
+
+def _sheet_has_feedback(group_ids: List[int], gs: grading_sheet.GradingSheet) -> bool:
+    return all(gs.get_points(id) is not None and gs.get_comment(id) is not None for id in group_ids)
+
+
+def record_max_points(grader: PexGrader | QueuedGrader | LookAheadGrader, course: str) -> None:
+    """Grades the solution once per grading sheet, its points are the maximum of each test in 'pex-report'."""
+    if results_db.has_max_points(course, grader.pex_name):
+        return
+    util.info("Running the automatic tests on the solution to determine the maximum points of each test ...",
+              always_display=True)
+    feedback = grader.grade(grader.solution(), run_preflight=False)
+    if not feedback.test_results:
+        util.warning("The tests could not be run on the solution.", "Fail rates of 'pex-report' will be unknown")
+        return
+    results_db.save_max_points(course, grader.pex_name, feedback.test_results)
+
+
+def has_feedback(group_ids: List[int], gs: grading_sheet.GradingSheet, exercise: str,
+                 graded_ids: Set[int] | None = None) -> bool:
+    # resume gradings that are missing in the grading sheet, but have been recorded before for the same grading sheet
+    if graded_ids is not None:
+        if group_ids[0] in graded_ids:
+            return True
+    elif results_db.load_grading(results_db.course_key(gs.path), exercise, group_ids[0]) is not None:
+        return True
+    return _sheet_has_feedback(group_ids, gs)
+
+
+def run_worker(grader: PexGrader, queue: JobQueue, poll_interval: float = 1.0) -> int:
+    worker_name = f"{socket.gethostname()}-{os.getpid()}"
+    processed = 0
+    util.info(f"Worker '{worker_name}' is waiting for jobs for {grader.pex_name} in queue '{queue.path}' "
+              "(press Ctrl-C to stop) ...", always_display=True)
+
+    while True:
+        job = queue.claim(grader.pex_name, worker_name)
+        if job is None:
+            time.sleep(poll_interval)
+            continue
+
+        if process_job(grader, queue, job):
+            processed += 1
+            util.info(f"Finished job {job[0]} ({processed} job/s processed).", always_display=True)
+
+
+def process_job(grader: PexGrader, queue: JobQueue, job: Tuple[int, str, bytes]) -> bool:
+    """Grades a claimed job, returns whether it was completed."""
+    job_id, notebook_name, notebook = job
+    job_folder = file_mgmt.create_temporary_folder()
+    submission = job_folder / notebook_name
+    submission.write_bytes(notebook)
+    try:
+        util.info(f"Running job {job_id} ...", always_display=True)
+        # checked by 'grade-pex' before submitting the job, nobody can answer questions of a worker
+        feedback = asyncio.run(grader.grade_async(submission, interactive=False, run_preflight=False))
+    except Exception as e:
+        # e.g. no or several feedback files, the job is retried by a limited number of workers
+        failed = queue.fail(job_id, f"{type(e).__name__}: {e}")
+        util.warning(f"Job {job_id} failed: {e}", "The job is not retried" if failed else "The job is retried")
+        return False
+    except BaseException:
+        # e.g. the worker is stopped, leave the job to another worker
+        queue.release(job_id)
+        raise
+    finally:
+        file_mgmt.delete_folder(job_folder)
+
+    queue.complete(job_id, feedback.as_dict())
+    return True
+
+
 
 def open_submission(path: Path) -> None:
     _notebook_auto_edit(path)
-    file_mgmt.open_file(path)
+    util.open_file(path)
 
 
-def grade_pex_group(group: List[str], group_ids: List[int], path_submissions: Path,
-                    grader: PexGrader, gs: grading_sheet.GradingSheet, console_header: str | None = None) -> int:
+def grade_pex_group(group: List[str], group_ids: List[int], submission: Path,
+                    grader: PexGrader | QueuedGrader | LookAheadGrader, gs: grading_sheet.GradingSheet,
+                    console_header: str | None = None) -> int:
     sample_id = group_ids[0]
     current_feedback = PexFeedback("", "", "")
-    submission = file_mgmt.find_pex_submission(sample_id, path_submissions)
-    graded = True
     finished = False
     updated_grades = 0
 
-    def grade():
+    def grade(run_preflight: bool = True):
         util.clear_console(console_header)
         util.info(f"Running automatic tests for group {group} ...", always_display=True)
-        new_feedback = grader.grade(submission)
-        current_feedback.set_points(new_feedback.points)
-        current_feedback.set_test_output(new_feedback.test_output)
+        new_feedback = grader.grade(submission, run_preflight)
+        new_feedback.set_additional_feedback(current_feedback.additional_feedback)
+        current_feedback.replace_with(new_feedback)
         util.wait_for_user()
 
     def edit_feedback():
         feedback_text = current_feedback.as_editable_text(f"# Editing feedback for group {group}:")
         file_mgmt.create_file(config.get("filenames.edit_feedback_file"), feedback_text)
-        file_mgmt.open_file(config.get("filenames.edit_feedback_file"))
+        util.open_file(config.get("filenames.edit_feedback_file"))
         util.wait_for_user("Please edit the feedback, save the file and press ENTER to continue ...")
 
         new_feedback = PexFeedback.from_editable_text(file_mgmt.read_file(config.get("filenames.edit_feedback_file")))
         file_mgmt.delete_file(config.get("filenames.edit_feedback_file"))
-        current_feedback.replace_with(new_feedback)
+        current_feedback.set_points(new_feedback.points)
+        current_feedback.set_test_output(new_feedback.test_output)
+        current_feedback.set_additional_feedback(new_feedback.additional_feedback)
 
 
-    for id in group_ids:
-        if gs.get_points(id) is None or gs.get_comment(id) is None:
-            graded = False
+    course = results_db.course_key(gs.path)
+    stored_grading = results_db.load_grading(course, grader.pex_name, sample_id)
+    in_sheet = _sheet_has_feedback(group_ids, gs)
+    graded = in_sheet or stored_grading is not None
 
     if graded:
         util.clear_console(console_header)
-        util.info(f"Group {group} already has a feedback in the grading scheme.", always_display=True)
+        source = "grading scheme" if in_sheet else "results database"
+        if in_sheet:
+            util.info(f"Group {group} already has a feedback in the grading scheme.", always_display=True)
+        else:
+            util.info(f"Group {group} has no feedback in the grading scheme, but in the results database.",
+                      always_display=True)
         match util.choose_option({"s", "l", "d"}, "s", "The following options are available:\n"
                                                        "  's': skip this group\n"
-                                                       "  'l': load feedback from grading scheme\n"
-                                                       "  'd': discard feedback from grading scheme and regrade\n"
+                                                      f"  'l': load feedback from {source}\n"
+                                                      f"  'd': discard feedback from {source} and regrade\n"
                                                        "What would you like to do?"):
             case "s":
                 return 0
 
             case "l":
-                loaded_feedback = PexFeedback.from_html(gs.get_comment(sample_id, decode=False), gs.get_points(sample_id))
+                if in_sheet:
+                    # the grading sheet may have been changed since, e.g. with 'edit-feedback' or the daemon
+                    loaded_feedback = PexFeedback.from_html(gs.get_comment(sample_id, decode=False), gs.get_points(sample_id))
+                    if stored_grading is not None:
+                        # the results of the tests are not part of the grading sheet
+                        loaded_feedback.test_results = stored_grading.test_results
+                        loaded_feedback.runtime_seconds = stored_grading.runtime_seconds
+                        loaded_feedback.notebook_hash = stored_grading.notebook_hash
+                else:
+                    loaded_feedback = PexFeedback.from_stored(stored_grading)
                 current_feedback.replace_with(loaded_feedback)
 
             case "d":
@@ -253,7 +562,8 @@ def grade_pex_group(group: List[str], group_ids: List[int], path_submissions: Pa
                 grader.open_solution()
 
             case "r":
-                grade()
+                # e.g. after the pre-flight check failed because of stray cells
+                grade(run_preflight=False)
 
             case "e":
                 edit_feedback()
@@ -264,15 +574,11 @@ def grade_pex_group(group: List[str], group_ids: List[int], path_submissions: Pa
                     util.wait_for_user()
                     continue
 
-                for id in group_ids:
-                    gs.set_points(id, current_feedback.points)
-                    gs.set_comment(id, current_feedback.as_html(), encode=False)
-
-                    feedback_footer = config.get("moodle.feedback_footer")
-                    feedback_footer_with_initials = list(
-                        map(lambda s: s.format(config.get("initials")), feedback_footer))
-                    gs.append_comment(id, feedback_footer_with_initials)
-                    updated_grades += 1
+                footer = list(config.snapshot().moodle.feedback_footer_with_initials)
+                gs.apply_updates({id: grading_sheet.Update(current_feedback.points, current_feedback.as_html(), footer)
+                                  for id in group_ids})
+                updated_grades += len(group_ids)
+                results_db.save_grading(current_feedback.as_stored(course, grader.pex_name, group, group_ids))
                 finished = True
 
             case _:
@@ -298,9 +604,17 @@ def _json_to_txt(d: dict) -> Tuple[str, str]:
     return grade_text, reached_pts
 
 
-def _notebook_auto_edit(notebook: Path) -> None:
-    find = config.get("pex.notebook_auto_edit.find")
-    replace = config.get("pex.notebook_auto_edit.replace")
+def _json_to_test_results(d: dict) -> List[TestResult]:
+    test_results = []
+    for fct in d['tests']:
+        for test_case in ['public', 'private']:
+            if test_case in d['tests'][fct]['points']:
+                pts = float(d['tests'][fct]['points'][test_case])
+                comment = d['tests'][fct][test_case]['comment'] or ""
+                test_results.append(TestResult(fct, test_case, pts, comment))
+    return test_results
 
-    for subst in zip(find, replace):
-        file_mgmt.replace_in_file(notebook, subst[0], subst[1])
\ No newline at end of file
+
+def _notebook_auto_edit(notebook: Path) -> None:
+    for find, replace in config.snapshot().pex.notebook_auto_edit:
+        file_mgmt.replace_in_file(notebook, find, replace)
\ No newline at end of file
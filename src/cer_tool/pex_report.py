@@ -0,0 +1,66 @@
+from pathlib import Path
+from typing import List
+
+from pandas.core.frame import DataFrame
+
+from cer_tool import util
+
+
+_TEST_KEYS: List[str] = ["exercise", "test_function", "test_case"]
+
+
+def test_statistics(test_results: DataFrame) -> DataFrame:
+    # maximum reached by the solution, see results_db.save_max_points(), without it the fail rate is unknown (NaN)
+    failed = test_results["points"] < test_results["max_points"]
+
+    stats = test_results.assign(failed=failed).groupby(_TEST_KEYS).agg(
+        groups=("grading_id", "nunique"),
+        failed=("failed", "sum"),
+        mean_points=("points", "mean"),
+        max_points=("max_points", "max"),
+    )
+    stats["failed"] = stats["failed"].where(stats["max_points"].notna())
+    stats["fail_rate"] = stats["failed"] / stats["groups"]
+    return stats.sort_values(["fail_rate", "failed"], ascending=False)
+
+
+def point_distribution(gradings: DataFrame) -> DataFrame:
+    distribution = gradings.groupby("exercise")["points"].describe()[["count", "mean", "std", "min", "50%", "max"]]
+    return distribution.astype({"count": int})
+
+
+def crashed_groups(gradings: DataFrame, test_results: DataFrame) -> DataFrame:
+    # gradings without any test results failed to run the tests at all
+    crashed = ~gradings["grading_id"].isin(test_results["grading_id"]) & (gradings["points"] == 0)
+    return gradings.loc[crashed, ["exercise", "group_name", "created"]]
+
+
+def create_report(gradings: DataFrame, test_results: DataFrame, max_tests: int = 10) -> str:
+    stats = test_statistics(test_results)
+    distribution = point_distribution(gradings)
+    crashed = crashed_groups(gradings, test_results)
+
+    report = f"PEX report for {len(gradings)} groups in {gradings['exercise'].nunique()} exercise/s\n"
+    report += f"\nMost frequently failed tests:\n{stats.head(max_tests).to_string(float_format='{:.2f}'.format)}\n"
+    report += f"\nPoint distribution:\n{distribution.to_string(float_format='{:.2f}'.format)}\n"
+    if crashed.empty:
+        report += "\nNo group failed to run the tests.\n"
+    else:
+        report += f"\nGroups failing to run the tests ({len(crashed)}):\n{crashed.to_string(index=False)}\n"
+
+    return report
+
+
+def export(gradings: DataFrame, test_results: DataFrame, output_path: str) -> None:
+    table = test_results.merge(gradings[["grading_id", "points", "runtime_seconds", "notebook_hash"]],
+                               on="grading_id", suffixes=("", "_total"))
+    path = Path(output_path)
+
+    if path.suffix == ".parquet":
+        try:
+            table.to_parquet(path, index=False)
+        except ImportError:
+            util.error("Exporting to parquet requires 'pyarrow' or 'fastparquet' to be installed")
+    else:
+        table.to_csv(path, index=False)
+    util.info(f" CREATE: file '{path}'")
\ No newline at end of file
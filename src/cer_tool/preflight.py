@@ -0,0 +1,96 @@
+import ast
+import json
+import re
+from pathlib import Path
+from typing import List, Set
+
+from cer_tool import util
+
+
+# IPython syntax, which is no valid Python, e.g. '%matplotlib tk', '!pip install ...' or 'np.sum?'
+_MAGIC_PATTERN = re.compile(r"^(\s*)([%!].*|[^#]*\?)$")
+
+
+def _code_cells(notebook: Path) -> List[str] | None:
+    # None for notebooks without cells, e.g. of nbformat 3, which stores them in worksheets
+    with open(notebook, "r", encoding="utf-8") as f:
+        content = json.load(f)
+    if "cells" not in content.keys():
+        return None
+    code_cells = filter(lambda c: c.get("cell_type") == "code", content["cells"])
+    return list(map(lambda c: "".join(c["source"]) if isinstance(c.get("source"), list) else c.get("source", ""),
+                    code_cells))
+
+
+def _defined_names(tree: ast.AST) -> Set[str]:
+    # everything a test could import from the notebook, wherever it is defined
+    names = set()
+    for node in ast.walk(tree):
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+            names.add(node.name)
+        elif isinstance(node, ast.Name) and isinstance(node.ctx, ast.Store):
+            names.add(node.id)
+        elif isinstance(node, (ast.Import, ast.ImportFrom)):
+            names.update((alias.asname or alias.name).split(".")[0] for alias in node.names)
+    return names
+
+
+def _parse(source: str) -> ast.Module:
+    # cell magics (e.g. '%%html') contain no Python code
+    if source.lstrip().startswith("%%"):
+        return ast.Module(body=[], type_ignores=[])
+
+    lines = source.splitlines()
+    while True:
+        try:
+            return ast.parse("\n".join(lines))
+        except SyntaxError as e:
+            # only lines Python fails on are replaced, as e.g. a line starting with '%' may continue an expression
+            line = lines[e.lineno - 1] if e.lineno and e.lineno <= len(lines) else ""
+            if not (match := _MAGIC_PATTERN.match(line)):
+                raise
+            lines[e.lineno - 1] = f"{match.group(1)}pass"
+
+
+def expected_names(grading_package: Path, solution: Path) -> Set[str]:
+    # functions of the solution, which are referenced by the tests of the grading package
+    try:
+        solution_names = {node.name for source in _code_cells(solution) for node in _parse(source).body
+                          if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef))}
+    except (OSError, ValueError, TypeError, AttributeError, SyntaxError):
+        util.warning(f"Solution '{solution}' could not be parsed.", "Submissions will not be checked for missing functions.")
+        return set()
+
+    referenced = set()
+    for file in grading_package.rglob("*.py"):
+        referenced.update(re.findall(r"[A-Za-z_]\w*", file.read_text(encoding="utf-8", errors="ignore")))
+    return solution_names & referenced
+
+
+def check(notebook: Path, expected: Set[str]) -> str | None:
+    """Returns the reason why the tests are certain to fail for the notebook, if any."""
+    if notebook.name.endswith("-checkpoint.ipynb"):
+        return f"'{notebook.name}' is a checkpoint file of Jupyter, not the submitted notebook"
+
+    try:
+        sources = _code_cells(notebook)
+    except (json.JSONDecodeError, UnicodeDecodeError, AttributeError, TypeError):
+        return f"'{notebook.name}' is no valid notebook file"
+
+    if sources is None:
+        # unknown format, left to the tests
+        return None
+    if not any(source.strip() for source in sources):
+        return "the notebook does not contain any code"
+
+    defined = set()
+    for i, source in enumerate(sources):
+        try:
+            defined |= _defined_names(_parse(source))
+        except (SyntaxError, ValueError) as e:
+            return f"syntax error in code cell {i + 1}, line {getattr(e, 'lineno', '?')}: {getattr(e, 'msg', e)}"
+
+    # single missing functions only fail their own tests
+    if expected and not expected & defined:
+        return f"none of the required functions is defined ({', '.join(sorted(expected))})"
+    return None
@@ -0,0 +1,176 @@
+import atexit
+import collections
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Deque, Dict
+
+from cer_tool import util, config
+
+
+# number of recent items used for the rolling rate and ETA
+_WINDOW: int = 10
+
+_lock = threading.Lock()
+
+
+class _Phase:
+    def __init__(self, total: int) -> None:
+        self.total = total
+        self.done = 0
+        self.started = time.monotonic()
+        # completion times of the most recent items, including the start of the phase
+        self.recent: Deque[float] = collections.deque([self.started], maxlen=_WINDOW + 1)
+
+
+class _Measure:
+    def __init__(self, started: float) -> None:
+        self.amount = 0.0
+        # summed over all records, records of several threads may overlap
+        self.seconds = 0.0
+        self.count = 0
+        # wall-clock span of all records
+        self.first_started = started
+        self.last_finished = started
+
+
+# phase name → progress, e.g. "grade-pex" → groups
+_phases: Dict[str, _Phase] = {}
+# measure name → amount and time spent, e.g. "extracted_bytes" → bytes
+_measures: Dict[str, _Measure] = {}
+# metrics file written by this process, removed on exit
+_written: Path | None = None
+# set if the metrics file cannot be written, s.t. the warning is only shown once
+_failed: bool = False
+
+
+def start(phase: str, total: int) -> None:
+    with _lock:
+        _phases[phase] = _Phase(total)
+    write_metrics()
+
+
+def advance(phase: str, count: int = 1) -> None:
+    with _lock:
+        state = _phases[phase]
+        state.done += count
+        state.recent.append(time.monotonic())
+    write_metrics()
+
+
+def record(measure: str, amount: float, seconds: float) -> None:
+    # thread-safe, e.g. called by the thread compressing feedback files
+    finished = time.monotonic()
+    with _lock:
+        state = _measures.setdefault(measure, _Measure(finished - seconds))
+        state.amount += amount
+        state.seconds += seconds
+        state.count += 1
+        state.first_started = min(state.first_started, finished - seconds)
+        state.last_finished = max(state.last_finished, finished)
+
+
+def rate_per_minute(phase: str) -> float | None:
+    state = _phases.get(phase)
+    if state is None or len(state.recent) < 2:
+        return None
+    # items between the oldest and the newest entry of the window
+    elapsed = state.recent[-1] - state.recent[0]
+    return (len(state.recent) - 1) / elapsed * 60 if elapsed > 0 else None
+
+
+def eta_seconds(phase: str) -> float | None:
+    state = _phases.get(phase)
+    rate = rate_per_minute(phase)
+    if state is None or rate is None:
+        return None
+    return max(0, state.total - state.done) / rate * 60
+
+
+def throughput(measure: str) -> float | None:
+    # amount per wall-clock second, s.t. records of parallel threads are not counted as sequential
+    state = _measures.get(measure)
+    elapsed = state.last_finished - state.first_started if state is not None else 0
+    return state.amount / elapsed if elapsed > 0 else None
+
+
+def mean_seconds(measure: str) -> float | None:
+    state = _measures.get(measure)
+    return state.seconds / state.count if state is not None and state.count > 0 else None
+
+
+def _format_duration(seconds: float) -> str:
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}:{minutes:02d}:{seconds:02d}" if hours else f"{minutes}:{seconds:02d}"
+
+
+def summary(phase: str, unit: str) -> str:
+    state = _phases[phase]
+    parts = [f"{state.done / state.total * 100 if state.total else 100:.0f} % done"]
+    if (rate := rate_per_minute(phase)) is not None:
+        parts.append(f"{rate:.1f} {unit}/min")
+    if (eta := eta_seconds(phase)) is not None and state.done < state.total:
+        parts.append(f"ETA {_format_duration(eta)}")
+    return ", ".join(parts)
+
+
+def _metrics_path() -> Path | None:
+    directory = config.snapshot().metrics.textfile_directory
+    # one file per process, as several workers may run at the same time
+    return Path(directory) / f"cer_tool_{os.getpid()}.prom" if directory else None
+
+
+def write_metrics() -> None:
+    # never raises, as it is called between gradings, whose results must not be lost because of the monitoring
+    global _written, _failed
+
+    path = _metrics_path()
+    if path is None or _failed:
+        return
+
+    pid = os.getpid()
+    lines = []
+
+    def metric(name: str, kind: str, description: str, values: Dict[str, float | None]) -> None:
+        lines.extend([f"# HELP cer_tool_{name} {description}", f"# TYPE cer_tool_{name} {kind}"])
+        lines.extend(f"cer_tool_{name}{{{labels}}} {value}" for labels, value in values.items() if value is not None)
+
+    with _lock:
+        phases = {f'phase="{phase}",pid="{pid}"': phase for phase in _phases}
+        metric("items_done", "gauge", "Items processed in the phase.",
+               {labels: _phases[phase].done for labels, phase in phases.items()})
+        metric("items_total", "gauge", "Items to process in the phase.",
+               {labels: _phases[phase].total for labels, phase in phases.items()})
+        metric("items_per_minute", "gauge", "Recent throughput of the phase.",
+               {labels: rate_per_minute(phase) for labels, phase in phases.items()})
+        metric("eta_seconds", "gauge", "Estimated time until the phase is finished.",
+               {labels: eta_seconds(phase) for labels, phase in phases.items()})
+        for measure, state in sorted(_measures.items()):
+            labels = f'pid="{pid}"'
+            metric(f"{measure}_total", "counter", f"Total {measure.replace('_', ' ')}.", {labels: state.amount})
+            metric(f"{measure}_seconds_total", "counter", f"Seconds spent on {measure.replace('_', ' ')}.",
+                   {labels: state.seconds})
+        metric("last_update_timestamp_seconds", "gauge", "Time of the last update.", {f'pid="{pid}"': time.time()})
+
+        # write atomically, s.t. the collector never reads a partial file
+        # under the lock, as the look-ahead grading of 'grade-pex' writes from another thread
+        tmp_path = path.with_name(f".{path.name}.tmp")
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path.write_text("\n".join(lines) + "\n", encoding="utf-8")
+            os.replace(tmp_path, path)
+        except OSError as e:
+            _failed = True
+            util.warning(f"Could not write metrics to '{path}': {e}", "No metrics will be written by this process.")
+            return
+        _written = path
+
+
+def _remove_metrics() -> None:
+    if _written is not None:
+        _written.unlink(missing_ok=True)
+
+
+atexit.register(_remove_metrics)
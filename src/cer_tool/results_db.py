@@ -0,0 +1,179 @@
+import sqlite3
+from datetime import datetime
+from os import PathLike
+from pathlib import Path
+from typing import List, NamedTuple, Set, Tuple
+
+import pandas as pd
+from pandas.core.frame import DataFrame
+from platformdirs import user_data_path
+
+
+_DB_PATH: Path = user_data_path("cer-tool", ensure_exists=True) / "results.sqlite3"
+
+_SCHEMA: str = """
+CREATE TABLE IF NOT EXISTS gradings (
+    grading_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    course TEXT,
+    exercise TEXT NOT NULL,
+    group_name TEXT NOT NULL,
+    points REAL NOT NULL,
+    test_output TEXT NOT NULL,
+    additional_feedback TEXT NOT NULL,
+    runtime_seconds REAL,
+    notebook_hash TEXT,
+    created TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS grading_members (
+    grading_id INTEGER NOT NULL REFERENCES gradings(grading_id) ON DELETE CASCADE,
+    moodle_id INTEGER NOT NULL,
+    PRIMARY KEY (grading_id, moodle_id)
+);
+CREATE TABLE IF NOT EXISTS test_results (
+    grading_id INTEGER NOT NULL REFERENCES gradings(grading_id) ON DELETE CASCADE,
+    test_function TEXT NOT NULL,
+    test_case TEXT NOT NULL,
+    points REAL NOT NULL,
+    comment TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS max_points (
+    course TEXT NOT NULL,
+    exercise TEXT NOT NULL,
+    test_function TEXT NOT NULL,
+    test_case TEXT NOT NULL,
+    max_points REAL NOT NULL,
+    PRIMARY KEY (course, exercise, test_function, test_case)
+);
+CREATE INDEX IF NOT EXISTS idx_gradings_exercise ON gradings(exercise);
+CREATE INDEX IF NOT EXISTS idx_gradings_course_exercise ON gradings(course, exercise);
+CREATE INDEX IF NOT EXISTS idx_grading_members_moodle_id ON grading_members(moodle_id);
+"""
+
+
+class TestResult(NamedTuple):
+    test_function: str
+    test_case: str
+    points: float
+    comment: str
+
+
+class StoredGrading(NamedTuple):
+    # see course_key()
+    course: str
+    exercise: str
+    group_name: str
+    member_ids: List[int]
+    points: float
+    test_output: str
+    additional_feedback: str
+    test_results: List[TestResult]
+    runtime_seconds: float | None
+    notebook_hash: str | None
+
+
+def _connect() -> sqlite3.Connection:
+    connection = sqlite3.connect(_DB_PATH)
+    connection.execute("PRAGMA foreign_keys = ON")
+    # stores created before the course was recorded (no columns if not created yet), their gradings are not loaded again
+    columns = [row[1] for row in connection.execute("PRAGMA table_info(gradings)")]
+    if columns and "course" not in columns:
+        connection.execute("ALTER TABLE gradings ADD COLUMN course TEXT")
+    connection.executescript(_SCHEMA)
+    return connection
+
+
+def course_key(grading_sheet: str | PathLike[str]) -> str:
+    """Moodle ids and exercise names are reused every semester, gradings are stored per grading sheet."""
+    return str(Path(grading_sheet).resolve())
+
+
+def save_grading(grading: StoredGrading) -> None:
+    with _connect() as connection:
+        cursor = connection.execute(
+            "INSERT INTO gradings (course, exercise, group_name, points, test_output, additional_feedback, "
+            "runtime_seconds, notebook_hash, created) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (grading.course, grading.exercise, grading.group_name, grading.points, grading.test_output,
+             grading.additional_feedback, grading.runtime_seconds, grading.notebook_hash,
+             datetime.now().isoformat(timespec="seconds")))
+        grading_id = cursor.lastrowid
+        connection.executemany("INSERT INTO grading_members (grading_id, moodle_id) VALUES (?, ?)",
+                               [(grading_id, id) for id in grading.member_ids])
+        connection.executemany("INSERT INTO test_results (grading_id, test_function, test_case, points, comment) "
+                               "VALUES (?, ?, ?, ?, ?)",
+                               [(grading_id, *result) for result in grading.test_results])
+    connection.close()
+
+
+def load_grading(course: str, exercise: str, id: int) -> StoredGrading | None:
+    connection = _connect()
+    row = connection.execute(
+        "SELECT g.grading_id, g.group_name, g.points, g.test_output, g.additional_feedback, "
+        "g.runtime_seconds, g.notebook_hash FROM gradings g "
+        "JOIN grading_members m ON g.grading_id = m.grading_id "
+        "WHERE g.course = ? AND g.exercise = ? AND m.moodle_id = ? ORDER BY g.grading_id DESC LIMIT 1",
+        (course, exercise, id)).fetchone()
+    if row is None:
+        connection.close()
+        return None
+
+    grading_id, group_name, points, test_output, additional_feedback, runtime_seconds, notebook_hash = row
+    member_ids = [r[0] for r in connection.execute(
+        "SELECT moodle_id FROM grading_members WHERE grading_id = ? ORDER BY moodle_id", (grading_id,))]
+    test_results = [TestResult(*r) for r in connection.execute(
+        "SELECT test_function, test_case, points, comment FROM test_results WHERE grading_id = ?",
+        (grading_id,))]
+    connection.close()
+
+    return StoredGrading(course, exercise, group_name, member_ids, points, test_output, additional_feedback,
+                         test_results, runtime_seconds, notebook_hash)
+
+
+def load_graded_ids(course: str, exercise: str) -> Set[int]:
+    connection = _connect()
+    ids = {row[0] for row in connection.execute(
+        "SELECT DISTINCT m.moodle_id FROM grading_members m JOIN gradings g ON g.grading_id = m.grading_id "
+        "WHERE g.course = ? AND g.exercise = ?", (course, exercise))}
+    connection.close()
+    return ids
+
+
+def save_max_points(course: str, exercise: str, solution_results: List[TestResult]) -> None:
+    # the points the solution reaches in each test, the grading scripts do not report a maximum per test
+    with _connect() as connection:
+        connection.executemany("INSERT OR REPLACE INTO max_points VALUES (?, ?, ?, ?, ?)",
+                               [(course, exercise, result.test_function, result.test_case, result.points)
+                                for result in solution_results])
+    connection.close()
+
+
+def has_max_points(course: str, exercise: str) -> bool:
+    connection = _connect()
+    row = connection.execute("SELECT 1 FROM max_points WHERE course = ? AND exercise = ?", (course, exercise)).fetchone()
+    connection.close()
+    return row is not None
+
+
+def load_frames(exercises: List[str] | None = None) -> Tuple[DataFrame, DataFrame]:
+    # only consider the most recent grading of each group
+    # groups of different courses may have the same name
+    latest = "SELECT MAX(grading_id) FROM gradings GROUP BY course, exercise, group_name"
+    params: List[str] = []
+    if exercises:
+        latest = (f"SELECT MAX(grading_id) FROM gradings WHERE exercise IN ({', '.join('?' * len(exercises))}) "
+                  "GROUP BY course, exercise, group_name")
+        params = exercises
+
+    connection = _connect()
+    gradings = pd.read_sql_query(
+        "SELECT grading_id, exercise, group_name, points, runtime_seconds, notebook_hash, created "
+        f"FROM gradings WHERE grading_id IN ({latest})", connection, params=params)
+    test_results = pd.read_sql_query(
+        "SELECT t.grading_id, g.exercise, g.group_name, t.test_function, t.test_case, t.points, t.comment, m.max_points "
+        "FROM test_results t JOIN gradings g ON t.grading_id = g.grading_id "
+        "LEFT JOIN max_points m ON m.course = g.course AND m.exercise = g.exercise "
+        "AND m.test_function = t.test_function AND m.test_case = t.test_case "
+        f"WHERE t.grading_id IN ({latest})",
+        connection, params=params)
+    connection.close()
+
+    return gradings, test_results
@@ -0,0 +1,127 @@
+import hashlib
+import sqlite3
+from datetime import datetime
+from os import PathLike
+from pathlib import Path
+from typing import Dict, List
+
+from platformdirs import user_data_path
+
+from cer_tool import util, file_mgmt
+from cer_tool.grading_sheet import GradingSheet
+
+
+_DB_PATH: Path = user_data_path("cer-tool", ensure_exists=True) / "roster.sqlite3"
+
+_SCHEMA: str = """
+CREATE TABLE IF NOT EXISTS rosters (
+    groups_file TEXT PRIMARY KEY,
+    participants_hash TEXT NOT NULL,
+    updated TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS members (
+    groups_file TEXT NOT NULL REFERENCES rosters(groups_file) ON DELETE CASCADE,
+    name TEXT NOT NULL,
+    moodle_id INTEGER NOT NULL,
+    PRIMARY KEY (groups_file, name)
+);
+"""
+
+
+def _connect() -> sqlite3.Connection:
+    connection = sqlite3.connect(_DB_PATH)
+    connection.execute("PRAGMA foreign_keys = ON")
+    connection.executescript(_SCHEMA)
+    return connection
+
+
+def _key(connection: sqlite3.Connection, groups_file: str | PathLike[str]) -> str:
+    # the groups file of a tutorial is reused for all exercises of the course
+    key = str(Path(groups_file).resolve())
+    if connection.execute("SELECT 1 FROM rosters WHERE groups_file = ?", (key,)).fetchone() is not None:
+        return key
+
+    # e.g. copied or moved for the next exercise: the roster knowing most of the names belongs to the same tutorial
+    names = [name for group in file_mgmt.parse_groups_file(groups_file) for name in group]
+    if not names:
+        return key
+    row = connection.execute(
+        f"SELECT groups_file, COUNT(*) AS known FROM members WHERE name IN ({', '.join('?' * len(names))}) "
+        "GROUP BY groups_file ORDER BY known DESC LIMIT 1", names).fetchone()
+    if row is None or row[1] * 2 < len(names):
+        util.info(f"No Moodle ids remembered for the groups file '{key}'.", always_display=True)
+        return key
+
+    connection.execute("INSERT INTO rosters SELECT ?, participants_hash, ? FROM rosters WHERE groups_file = ?",
+                       (key, datetime.now().isoformat(timespec="seconds"), row[0]))
+    connection.execute("INSERT INTO members SELECT ?, name, moodle_id FROM members WHERE groups_file = ?", (key, row[0]))
+    connection.commit()
+    util.info(f"Using the Moodle ids remembered for the groups file '{row[0]}' ({row[1]} of {len(names)} names).",
+              always_display=True)
+    return key
+
+
+def participants_hash(gs: GradingSheet) -> str:
+    participants = sorted(f"{row}:{name}" for row, name in gs.data["Vollständiger Name"].items())
+    return hashlib.sha256("\n".join(participants).encode()).hexdigest()
+
+
+def load(groups_file: str | PathLike[str]) -> Dict[str, int]:
+    connection = _connect()
+    ids = dict(connection.execute("SELECT name, moodle_id FROM members WHERE groups_file = ?",
+                                  (_key(connection, groups_file),)).fetchall())
+    connection.close()
+    return ids
+
+
+def save(groups_file: str | PathLike[str], ids: Dict[str, int], participants: str | None = None) -> None:
+    connection = _connect()
+    key = _key(connection, groups_file)
+    known = dict(connection.execute("SELECT name, moodle_id FROM members WHERE groups_file = ?", (key,)).fetchall())
+    row = connection.execute("SELECT participants_hash FROM rosters WHERE groups_file = ?", (key,)).fetchone()
+    if participants is None:
+        # resolved without a grading sheet, e.g. by 'prepare': the next grading sheet has to confirm changed ids
+        unchanged = row is not None and all(known.get(name) == id for name, id in ids.items())
+        participants = row[0] if unchanged else ""
+    else:
+        # validated against a grading sheet, ids no longer valid are dropped
+        connection.execute("DELETE FROM members WHERE groups_file = ?", (key,))
+
+    if row is None:
+        connection.execute("INSERT INTO rosters VALUES (?, ?, ?)",
+                           (key, participants, datetime.now().isoformat(timespec="seconds")))
+    else:
+        # 'INSERT OR REPLACE' would delete the members of the roster
+        connection.execute("UPDATE rosters SET participants_hash = ?, updated = ? WHERE groups_file = ?",
+                           (participants, datetime.now().isoformat(timespec="seconds"), key))
+    connection.executemany("INSERT OR REPLACE INTO members VALUES (?, ?, ?)",
+                           [(key, name, id) for name, id in ids.items()])
+    connection.commit()
+    connection.close()
+
+
+def resolve(groups_file: str | PathLike[str], names: List[str], gs: GradingSheet) -> Dict[str, int]:
+    """Moodle ids of the given names, only names unknown for the groups file are matched against the grading sheet."""
+    current = participants_hash(gs)
+    connection = _connect()
+    key = _key(connection, groups_file)
+    row = connection.execute("SELECT participants_hash FROM rosters WHERE groups_file = ?", (key,)).fetchone()
+    known = dict(connection.execute("SELECT name, moodle_id FROM members WHERE groups_file = ?", (key,)).fetchall())
+    connection.close()
+    validated = row is not None and row[0] == current
+
+    if not validated:
+        # the participants changed, e.g. a student left the course: keep the ids still matching their names
+        valid = {name: id for name, id in known.items()
+                 if id in [int(participant[0]) for participant in gs.find_participants(name)]}
+        for name in known.keys() - valid.keys():
+            util.info(f" ROSTER: id {known[name]} of '{name}' is no longer valid")
+        known = valid
+
+    # only unknown names are matched, which may require choosing between several participants
+    ids = {name: known[name] if name in known else gs.select_participant(name) for name in names}
+
+    if not validated or ids.keys() - known.keys():
+        save(groups_file, known | ids, current)
+        util.info(f" ROSTER: saved ids of {len(known | ids)} students for '{key}'")
+    return ids
@@ -0,0 +1,115 @@
+import itertools
+import os
+import shutil
+import tempfile
+import threading
+import zipfile
+from os import PathLike
+from pathlib import Path
+from typing import Dict, List
+
+from cer_tool import util, config
+
+
+# increasing number for folder names, s.t. names are never reused within one run
+_counter = itertools.count()
+# per-process folder inside the fast scratch location, created on first use
+_root: Path | None = None
+# bytes expected to be written into each folder inside the fast scratch location
+_reserved: Dict[Path, int] = {}
+# folders are reserved by the threads of 'prepare' and the look-ahead grading of 'grade-pex'
+_lock = threading.Lock()
+
+
+def _fast_location() -> Path | None:
+    location = config.snapshot().scratch.location
+    if location == "cwd":
+        return None
+
+    if location in ("", "auto"):
+        candidates: List[str | None] = [os.environ.get("XDG_RUNTIME_DIR"), "/dev/shm"]
+    else:
+        candidates = [location]
+
+    for candidate in filter(None, candidates):
+        if Path(candidate).is_dir() and os.access(candidate, os.W_OK):
+            return Path(candidate)
+
+    if location not in ("", "auto"):
+        util.warning(f"Scratch location '{location}' is not a writable folder.",
+                     "Temporary folders will be created in the current working directory.")
+    return None
+
+
+def _base_folder(expected_bytes: int) -> Path:
+    global _root
+
+    location = _fast_location()
+    if location is None:
+        return Path(".")
+
+    # fall back to disk if the budget or the available space (e.g. of a tmpfs) would be exceeded
+    if not _fits(location, expected_bytes):
+        util.info(f" SCRATCH: {expected_bytes} bytes exceed the budget of '{location}', using the working directory")
+        return Path(".")
+
+    if _root is None or not _root.exists():
+        _root = Path(tempfile.mkdtemp(prefix="cer-tool-", dir=location))
+    return _root
+
+
+def _fits(location: Path, expected_bytes: int) -> bool:
+    required = sum(_reserved.values()) + expected_bytes
+    return required <= config.snapshot().scratch.budget_bytes and expected_bytes < shutil.disk_usage(location).free
+
+
+def new_folder(expected_bytes: int = 0) -> Path:
+    tmp_folder = config.snapshot().filenames.tmp_folder
+    with _lock:
+        base = _base_folder(expected_bytes)
+        path = base / tmp_folder.format(next(_counter))
+        while path.exists():
+            path = base / tmp_folder.format(next(_counter))
+
+        if base != Path("."):
+            _reserved[path.resolve()] = expected_bytes
+    return path
+
+
+def reserve(path: str | PathLike[str], expected_bytes: int) -> None:
+    """Adds bytes written into a folder inside a reserved one, e.g. by archives nested in an extracted archive."""
+    path = Path(path).resolve()
+    with _lock:
+        folder = next((folder for folder in _reserved if folder == path or folder in path.parents), None)
+        if folder is None:
+            # not inside the fast scratch location
+            return
+        # the files are written regardless, but later folders are created on disk once the budget is used up
+        if not _fits(folder.parent, expected_bytes):
+            util.info(f" SCRATCH: {expected_bytes} bytes extracted into '{path}' exceed the budget")
+        _reserved[folder] += expected_bytes
+
+
+def release(path: str | PathLike[str]) -> None:
+    with _lock:
+        _reserved.pop(Path(path).resolve(), None)
+
+
+def estimate_extracted_size(archive: str | PathLike[str]) -> int:
+    archive = Path(archive)
+    if zipfile.is_zipfile(archive):
+        with zipfile.ZipFile(archive) as zip:
+            return sum(info.file_size for info in zip.infolist())
+    # no cheap way to read the uncompressed size, assume a typical compression ratio
+    return archive.stat().st_size * 3
+
+
+def cleanup() -> None:
+    global _root
+
+    if _root is not None and _root.exists():
+        shutil.rmtree(_root, ignore_errors=True)
+        util.info(f" DELETE: '{_root}'")
+    _root = None
+    with _lock:
+        _reserved.clear()
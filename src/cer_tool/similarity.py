@@ -0,0 +1,213 @@
+import json
+import re
+import sqlite3
+import zlib
+from collections import defaultdict
+from datetime import datetime
+from os import PathLike
+from pathlib import Path
+from typing import List, Tuple, Set, Dict
+
+import numpy as np
+from platformdirs import user_data_path
+
+from cer_tool import util, config, file_mgmt
+
+
+_DB_PATH: Path = user_data_path("cer-tool", ensure_exists=True) / "similarity.sqlite3"
+
+_SCHEMA: str = """
+CREATE TABLE IF NOT EXISTS signatures (
+    notebook_hash TEXT NOT NULL,
+    template_hash TEXT NOT NULL,
+    signature BLOB NOT NULL,
+    PRIMARY KEY (notebook_hash, template_hash)
+);
+CREATE TABLE IF NOT EXISTS notebooks (
+    exercise TEXT NOT NULL,
+    label TEXT NOT NULL,
+    notebook_hash TEXT NOT NULL,
+    indexed TEXT NOT NULL,
+    PRIMARY KEY (exercise, label, notebook_hash)
+);
+"""
+
+# number of tokens per shingle
+_SHINGLE_SIZE: int = 5
+# signature length = bands * rows per band, the similarity threshold of LSH is about (1 / bands) ** (1 / rows)
+_BANDS: int = 16
+_ROWS_PER_BAND: int = 8
+_NUM_PERMUTATIONS: int = _BANDS * _ROWS_PER_BAND
+
+# universal hashing h(x) = (a * x + b) mod p with fixed parameters, s.t. cached signatures stay comparable
+_PRIME: int = (1 << 31) - 1
+_rng = np.random.default_rng(20240401)
+_A: np.ndarray = _rng.integers(1, _PRIME, _NUM_PERMUTATIONS, dtype=np.uint64)
+_B: np.ndarray = _rng.integers(0, _PRIME, _NUM_PERMUTATIONS, dtype=np.uint64)
+
+_TOKEN_PATTERN = re.compile(r"[A-Za-z_]\w*|\d+(?:\.\d*)?|\S")
+_COMMENT_PATTERN = re.compile(r"#.*$", re.MULTILINE)
+
+
+def _connect() -> sqlite3.Connection:
+    connection = sqlite3.connect(_DB_PATH)
+    connection.executescript(_SCHEMA)
+    return connection
+
+
+def _read_code(notebook: Path) -> str:
+    try:
+        with open(notebook, "r", encoding="utf-8") as f:
+            cells = json.load(f).get("cells", [])
+    except (json.JSONDecodeError, UnicodeDecodeError):
+        util.warning(f"Notebook '{notebook}' could not be parsed.", "Notebook will be treated as empty.")
+        return ""
+
+    code_cells = filter(lambda c: c.get("cell_type") == "code", cells)
+    sources = map(lambda c: "".join(c["source"]) if isinstance(c.get("source"), list) else c.get("source", ""),
+                  code_cells)
+    return "\n".join(sources)
+
+
+def shingles(notebook: Path) -> Set[int]:
+    code = _COMMENT_PATTERN.sub("", _read_code(notebook))
+    tokens = _TOKEN_PATTERN.findall(code)
+    return {zlib.crc32(" ".join(tokens[i:i + _SHINGLE_SIZE]).encode())
+            for i in range(max(0, len(tokens) - _SHINGLE_SIZE + 1))}
+
+
+def minhash(shingle_set: Set[int]) -> np.ndarray:
+    x = np.fromiter(shingle_set, dtype=np.uint64, count=len(shingle_set))
+    # (permutations × shingles) matrix of hash values, reduced to the minimum per permutation
+    hashes = (np.outer(_A, x) + _B[:, None]) % _PRIME
+    return hashes.min(axis=1).astype(np.uint32)
+
+
+def find_notebooks(path: str | PathLike[str]) -> List[Tuple[str, Path]]:
+    # one entry per submission folder, labelled by the folder name, i.e. "<name>_<id>_..."
+    submission_keyword = config.get("moodle.submission_keyword")
+    notebooks = []
+    for submission_folder in sorted(file_mgmt.find_all_paths(f"*{submission_keyword}", path)):
+        label = "_".join(submission_folder.name.split("_")[:2])
+        for notebook in sorted(submission_folder.rglob("*.ipynb")):
+            if notebook.name.endswith("-checkpoint.ipynb") or notebook.name.startswith("._"):
+                continue
+            notebooks.append((label, notebook))
+    return notebooks
+
+
+def update_index(exercise: str, notebooks: List[Tuple[str, Path]], template: Path | None = None) -> int:
+    template_hash = file_mgmt.hash_file(template) if template else ""
+    ignored_shingles = shingles(template) if template else set()
+
+    connection = _connect()
+    known = {row[0] for row in connection.execute("SELECT notebook_hash FROM signatures WHERE template_hash = ?",
+                                                  (template_hash,))}
+    new_signatures = 0
+    # notebooks indexed for a label before, e.g. of a submission that was changed since the last download
+    hashes_by_label: Dict[str, Set[str]] = defaultdict(set)
+    for label, notebook in notebooks:
+        notebook_hash = file_mgmt.hash_file(notebook)
+        if notebook_hash not in known:
+            shingle_set = shingles(notebook) - ignored_shingles
+            if not shingle_set:
+                util.warning(f"Notebook '{notebook}' does not contain any (non-template) code.",
+                             "Notebook will not be compared.")
+                continue
+            connection.execute("INSERT INTO signatures VALUES (?, ?, ?)",
+                               (notebook_hash, template_hash, minhash(shingle_set).tobytes()))
+            known.add(notebook_hash)
+            new_signatures += 1
+            util.info(f" SIMILARITY: indexed '{notebook}'")
+
+        connection.execute("INSERT OR IGNORE INTO notebooks VALUES (?, ?, ?, ?)",
+                           (exercise, label, notebook_hash, datetime.now().isoformat(timespec="seconds")))
+        hashes_by_label[label].add(notebook_hash)
+
+    # only the latest version of each submission is compared, otherwise it would be similar to itself
+    for label, hashes in hashes_by_label.items():
+        connection.execute(f"DELETE FROM notebooks WHERE exercise = ? AND label = ? AND notebook_hash NOT IN "
+                           f"({', '.join('?' * len(hashes))})", (exercise, label, *hashes))
+
+    connection.commit()
+    connection.close()
+    return new_signatures
+
+
+def _group_of(label: str, groups: List[List[str]], ids: Dict[str, int]) -> int | None:
+    name, id = label.split("_")[:2]
+    for i, group in enumerate(groups):
+        if any(member == name or str(ids.get(member)) == id for member in group):
+            return i
+    return None
+
+
+def find_clusters(exercise: str, threshold: float, template: Path | None = None,
+                  groups: List[List[str]] | None = None, ids: Dict[str, int] | None = None
+                  ) -> List[Tuple[float, List[str]]]:
+    """Clusters of similar notebooks submitted by more than one group, see _group_of() for the given groups."""
+    template_hash = file_mgmt.hash_file(template) if template else ""
+
+    connection = _connect()
+    rows = connection.execute(
+        "SELECT s.notebook_hash, s.signature FROM signatures s WHERE s.template_hash = ? AND s.notebook_hash IN "
+        "(SELECT notebook_hash FROM notebooks WHERE exercise = ?)", (template_hash, exercise)).fetchall()
+    labels: Dict[str, Set[str]] = defaultdict(set)
+    for label, notebook_hash in connection.execute("SELECT label, notebook_hash FROM notebooks WHERE exercise = ?",
+                                                   (exercise,)):
+        labels[notebook_hash].add(label)
+    connection.close()
+
+    if not rows:
+        return []
+
+    # members of the same group submit the same notebook, students without a group form a group of their own
+    group_by_label = {label: index if groups and (index := _group_of(label, groups, ids or {})) is not None else label
+                      for label_set in labels.values() for label in label_set}
+
+    def group_count(cluster_labels: Set[str]) -> int:
+        return len({group_by_label[label] for label in cluster_labels})
+
+    hashes = [row[0] for row in rows]
+    signatures = np.stack([np.frombuffer(row[1], dtype=np.uint32) for row in rows])
+
+    # LSH: notebooks sharing at least one identical band become candidates
+    candidates: Set[Tuple[int, int]] = set()
+    for band in range(_BANDS):
+        buckets: Dict[bytes, List[int]] = defaultdict(list)
+        band_values = signatures[:, band * _ROWS_PER_BAND:(band + 1) * _ROWS_PER_BAND]
+        for i, key in enumerate(map(np.ndarray.tobytes, band_values)):
+            buckets[key].append(i)
+        for bucket in filter(lambda b: len(b) > 1, buckets.values()):
+            candidates.update((i, j) for k, i in enumerate(bucket) for j in bucket[k + 1:])
+
+    # verify candidates with the estimated jaccard similarity and merge them into clusters (union-find)
+    parent = list(range(len(hashes)))
+    # byte-identical notebooks of several students share a single signature
+    max_similarity = [1.0 if group_count(labels[h]) > 1 else 0.0 for h in hashes]
+
+    def find(i: int) -> int:
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    for i, j in candidates:
+        similarity = float(np.mean(signatures[i] == signatures[j]))
+        if similarity >= threshold:
+            root_i, root_j = find(i), find(j)
+            parent[root_j] = root_i
+            if group_count(labels[hashes[i]] | labels[hashes[j]]) > 1:
+                max_similarity[i] = max(max_similarity[i], similarity)
+                max_similarity[j] = max(max_similarity[j], similarity)
+
+    clusters: Dict[int, List[int]] = defaultdict(list)
+    for i in range(len(hashes)):
+        clusters[find(i)].append(i)
+
+    result = []
+    for members in clusters.values():
+        member_labels = {label for i in members for label in labels[hashes[i]]}
+        if group_count(member_labels) > 1:
+            result.append((max(max_similarity[i] for i in members), sorted(member_labels)))
+    return sorted(result, reverse=True)
@@ -0,0 +1,91 @@
+import shutil
+import tarfile
+import zipfile
+from fnmatch import fnmatch
+from pathlib import Path, PurePosixPath
+from typing import List, NamedTuple, Tuple
+
+from cer_tool import util, config
+
+
+class GuardedFile(NamedTuple):
+    # where the file is or would have been extracted to
+    path: Path
+    size: int
+    reason: str
+    # archive still containing the file, if it was not extracted
+    archive: Path | None = None
+    member: str | None = None
+
+
+def check(relative_path: str, size: int, keep_patterns: Tuple[str, ...] = ()) -> str | None:
+    if any(fnmatch(relative_path, pattern) for pattern in keep_patterns):
+        return None
+    cfg = config.snapshot().upload_guard
+    if any(fnmatch(relative_path, pattern) for pattern in cfg.skip_patterns):
+        return "irrelevant"
+    # case-insensitive, e.g. 'Scan.PDF'
+    if size > cfg.max_file_bytes and not any(fnmatch(relative_path.lower(), pattern.lower())
+                                             for pattern in cfg.size_exempt_patterns):
+        return "oversized"
+    return None
+
+
+def extract_archive(path: Path, target: Path, guarded: List[GuardedFile], keep_patterns: Tuple[str, ...] = ()) -> bool:
+    # extract only the members passing the guard, based on the sizes stored in the archive
+    if zipfile.is_zipfile(path):
+        with zipfile.ZipFile(path) as archive:
+            members = [(info.filename, info.file_size, info.is_dir()) for info in archive.infolist()]
+            allowed = _filter_members(path, target, members, guarded, keep_patterns)
+            archive.extractall(target, allowed)
+        return True
+    elif tarfile.is_tarfile(path):
+        with tarfile.open(path) as archive:
+            infos = archive.getmembers()
+            members = [(info.name, info.size, info.isdir()) for info in infos]
+            allowed = set(_filter_members(path, target, members, guarded, keep_patterns))
+            archive.extractall(target, [info for info in infos if info.name in allowed], filter="data")
+        return True
+    # other formats (e.g. 7z) are checked when their files are copied
+    return False
+
+
+def _filter_members(archive: Path, target: Path, members: List[Tuple[str, int, bool]], guarded: List[GuardedFile],
+                    keep_patterns: Tuple[str, ...]) -> List[str]:
+    archive_suffixes = [suffix for _, suffixes, _ in shutil.get_unpack_formats() for suffix in suffixes]
+    allowed = []
+    for name, size, is_dir in members:
+        # nested archives are extracted anyway, their content is checked file by file
+        checked_size = 0 if any(name.endswith(suffix) for suffix in archive_suffixes) else size
+        reason = None if is_dir else check(PurePosixPath(name).as_posix(), checked_size, keep_patterns)
+        if reason is None:
+            allowed.append(name)
+        else:
+            guarded.append(GuardedFile(target / name, size, reason, archive, name))
+            # the submission folder must exist, even if all of its files were held back
+            (target / name).parent.mkdir(parents=True, exist_ok=True)
+    return allowed
+
+
+def quarantine(file: GuardedFile, target: Path) -> None:
+    target.parent.mkdir(parents=True, exist_ok=True)
+    if file.archive is None:
+        shutil.copy(file.path, target)
+    elif zipfile.is_zipfile(file.archive):
+        with zipfile.ZipFile(file.archive) as archive, archive.open(file.member) as source, open(target, "wb") as f:
+            shutil.copyfileobj(source, f)
+    else:
+        with tarfile.open(file.archive) as archive, archive.extractfile(file.member) as source, open(target, "wb") as f:
+            shutil.copyfileobj(source, f)
+    util.info(f" QUARANTINE: '{file.path.name}' → '{target}'")
+
+
+def report(guarded: List[GuardedFile], consequence: str) -> None:
+    if not guarded:
+        return
+    total = sum(map(lambda f: f.size, guarded))
+    util.warning(f"{len(guarded)} file/s ({total / 1e6:.1f} MB) were held back by the upload guard", consequence)
+    for file in sorted(guarded, key=lambda f: f.path):
+        util.info(f"   {file.reason:>10}: {file.path} ({file.size / 1e6:.1f} MB)", always_display=True,
+                  append_full_stop=False)
+
@@ -1,7 +1,15 @@
+import asyncio
+import codecs
+import contextlib
 import os
+import platform
+import shlex
 import subprocess
 import sys
-from typing import List, Set, Any, Tuple
+import threading
+from os import PathLike
+from pathlib import Path
+from typing import Dict, List, Set, Any, Tuple
 
 from cer_tool.flags import flags
 
@@ -90,6 +98,18 @@ def choose_index(list: List[Any], title: str = "", message: str = "Select an opt
     return chosen
 
 
+def open_file(path: str | PathLike[str]) -> None:
+    path = Path(path)
+    # taken from: https://stackoverflow.com/questions/434597/open-document-with-default-os-application-in-python-both-in-windows-and-mac-os
+    # and https://stackoverflow.com/questions/5772873/python-spawn-off-a-child-subprocess-detach-and-exit
+    if platform.system() == 'Darwin':  # macOS
+        subprocess.Popen(('open', path), start_new_session=True)
+    elif platform.system() == 'Windows':  # Windows
+        subprocess.Popen(('start', '', path), creationflags=subprocess.DETACHED_PROCESS, shell=True)
+    else:  # linux variants
+        subprocess.Popen(('xdg-open', path), start_new_session=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
 def wait_for_user(message="Press ENTER to continue..."):
     input(message)
 
@@ -107,17 +127,79 @@ def index_to_ascii(index: int, zero_based: bool = True) -> str:
         return chr(ord('a') + index)
 
 
-def run_command(command: str, show_output=True):
-    if flags["verbose"] or show_output:
-        result = subprocess.run(command, shell=True)
-        if result.returncode != 0:
-            error(f"Command '{command}' exited unsuccessfully. See the above output for details.")
-    else:
-        result = subprocess.run(command, capture_output=True, text=True, shell=True)
-        if result.returncode != 0:
-            error(f"Command '{command}' exited unsuccessfully:\n{result.stderr}")
+# limits the number of commands (e.g. docker containers) running at the same time in the whole process, i.e. in the
+# event loop of the look-ahead grading as well as in 'asyncio.run' of the main thread
+max_concurrent_commands: int = os.cpu_count() or 1
+_command_slots: threading.BoundedSemaphore = threading.BoundedSemaphore(max_concurrent_commands)
+
+
+def set_max_concurrent_commands(limit: int) -> None:
+    global max_concurrent_commands, _command_slots
+    max_concurrent_commands = max(1, limit)
+    _command_slots = threading.BoundedSemaphore(max_concurrent_commands)
+
+
+@contextlib.asynccontextmanager
+async def _command_slot():
+    # polled instead of waiting in another thread, s.t. a command cancelled while waiting never takes a slot
+    slots = _command_slots
+    while not slots.acquire(blocking=False):
+        await asyncio.sleep(0.05)
+    try:
+        yield
+    finally:
+        slots.release()
+
+
+async def _terminate_process(process: asyncio.subprocess.Process, on_cancel: List[str] | None) -> None:
+    # e.g. stop a docker container, which does not stop when its client process is terminated
+    if on_cancel:
+        cancel_process = await asyncio.create_subprocess_exec(*on_cancel, stdout=asyncio.subprocess.DEVNULL,
+                                                              stderr=asyncio.subprocess.DEVNULL)
+        await cancel_process.wait()
+
+    if process.returncode is None:
+        process.terminate()
+        try:
+            await asyncio.wait_for(process.wait(), timeout=5)
+        except asyncio.TimeoutError:
+            process.kill()
+            await process.wait()
+
+
+async def run_command_async(command: List[str], show_output: bool = False,
+                            on_cancel: List[str] | None = None, env: Dict[str, str] | None = None) -> Tuple[bool, str]:
+    async with _command_slot():
+        process = await asyncio.create_subprocess_exec(*command, stdout=asyncio.subprocess.PIPE,
+                                                       stderr=asyncio.subprocess.STDOUT, env=env)
+        output = []
+        # characters may be split between chunks
+        decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        try:
+            # stream output in chunks while the command is running, lines of any length may be printed
+            while chunk := await process.stdout.read(2 ** 16):
+                text = decoder.decode(chunk)
+                output.append(text)
+                if show_output:
+                    print(text, end="", flush=True)
+            output.append(decoder.decode(b"", final=True))
+            return_code = await process.wait()
+        except asyncio.CancelledError:
+            await _terminate_process(process, on_cancel)
+            raise
+
+    return return_code == 0, "".join(output)
+
+
+def run_command(command: List[str], show_output=True) -> None:
+    show_output = flags["verbose"] or show_output
+    success, output = asyncio.run(run_command_async(command, show_output))
+    if not success:
+        if show_output:
+            error(f"Command '{shlex.join(command)}' exited unsuccessfully. See the above output for details.")
+        else:
+            error(f"Command '{shlex.join(command)}' exited unsuccessfully:\n{output}")
 
 
-def run_potentially_failing_command(command: str) -> Tuple[bool, str]:
-    result = subprocess.run(command, shell=True, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
-    return result.returncode == 0, result.stdout
\ No newline at end of file
+def run_potentially_failing_command(command: List[str], on_cancel: List[str] | None = None) -> Tuple[bool, str]:
+    return asyncio.run(run_command_async(command, on_cancel=on_cancel))
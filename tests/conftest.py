@@ -0,0 +1,35 @@
+import os
+import tempfile
+
+import pytest
+
+
+# the configuration is created in the user config directory when 'cer_tool.config' is imported
+_user_dirs = tempfile.mkdtemp(prefix="cer-tool-tests-")
+os.environ["XDG_CONFIG_HOME"] = os.path.join(_user_dirs, "config")
+os.environ["XDG_DATA_HOME"] = os.path.join(_user_dirs, "data")
+
+from cer_tool import config
+# not saved, the configuration is only verified in memory
+config.set("initials", "CT")
+
+
+@pytest.fixture
+def results_db(tmp_path, monkeypatch):
+    from cer_tool import results_db
+    monkeypatch.setattr(results_db, "_DB_PATH", tmp_path / "results.sqlite3")
+    return results_db
+
+
+@pytest.fixture
+def config_override(request, monkeypatch):
+    """Replaces settings in the configuration snapshot for one test, e.g. ``config_override("scratch",
+    budget_bytes=10_000)``. Indirect parametrisation with ``{section: {key: value}}`` is applied right away."""
+    def override(section: str, **values):
+        snapshot = config.snapshot()
+        snapshot = snapshot._replace(**{section: getattr(snapshot, section)._replace(**values)})
+        monkeypatch.setattr(config, "snapshot", lambda: snapshot)
+
+    for section, values in getattr(request, "param", {}).items():
+        override(section, **values)
+    return override
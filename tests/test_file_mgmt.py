@@ -0,0 +1,98 @@
+import zipfile
+
+import pytest
+
+from cer_tool import file_mgmt
+
+
+@pytest.fixture
+def export(tmp_path):
+    path = tmp_path / "export"
+    folder = path / "Ada Lovelace_12345_assignsubmission_file"
+    folder.mkdir(parents=True)
+    with zipfile.ZipFile(folder / "submission.zip", "w") as zip:
+        zip.writestr("sheet.pdf", "%PDF-1.4 sheet")
+    yield path
+    file_mgmt.cleanup()
+
+
+def test_members_with_the_same_folder_are_extracted_once(export, tmp_path):
+    out = tmp_path / "out"
+
+    extracted, unchanged, _ = file_mgmt.extract_theoretical_submissions([["Ada Lovelace"], ["Ada"]], export, str(out),
+                                                                     jobs=2)
+
+    assert extracted == ["12345"]
+    assert [file.name for file in out.glob("*.pdf")] == ["Submission_Gr1a_Ada Lovelace_12345_File 1-1_ --- pts.pdf"]
+
+
+def test_feedback_of_superseded_revisions_is_ignored(tmp_path):
+    (tmp_path / "__CER_TOOL_PREPARED__.json").write_text('{"12345": {"fingerprint": "abc", "revision": 2}}')
+    for name in ["Submission_Gr1a_Ada_12345_File 1-1_5pts.pdf", "Submission_Gr1a_Ada_12345_File v2-1_7pts.pdf",
+                 "Submission_Gr1b_Bob_67890_File 1-1_3pts.pdf"]:
+        (tmp_path / name).write_bytes(b"%PDF-1.4")
+
+    # annotated for Bob, but also uploaded in the first version of Ada's submission
+    duplicates = {"Submission_Gr1a_Ada_12345_File 1-2_ --- pts.pdf": "Submission_Gr1b_Bob_67890_File 1-1_ --- pts.pdf"}
+
+    feedback = file_mgmt.find_all_feedback_files(tmp_path, duplicates)
+
+    assert feedback.groupby("student_id")["points"].sum().to_dict() == {"12345": 7.0, "67890": 3.0}
+
+
+def _add_submission(export, folder_name, content):
+    folder = export / folder_name
+    folder.mkdir(parents=True)
+    (folder / "sheet.pdf").write_text(content)
+
+
+def test_identical_files_are_shared_within_a_group_only(export, tmp_path, monkeypatch, capsys):
+    _add_submission(export, "Bob Baker_23456_assignsubmission_file", "%PDF-1.4 sheet")
+    _add_submission(export, "Carl Clark_34567_assignsubmission_file", "%PDF-1.4 sheet")
+    questions = []
+    monkeypatch.setattr(file_mgmt.util, "choose_option", lambda *args: questions.append(args) or "n")
+    out = tmp_path / "out"
+
+    file_mgmt.extract_theoretical_submissions([["Ada Lovelace", "Bob Baker"], ["Carl Clark"]], export, str(out))
+
+    assert file_mgmt.load_duplicates(out) == {
+        "Submission_Gr1b_Bob Baker_23456_File 1_ --- pts.pdf": "Submission_Gr1a_Ada Lovelace_12345_File 1-1_ --- pts.pdf"}
+    assert (out / "Submission_Gr2a_Carl Clark_34567_File 1_ --- pts.pdf").exists()
+    assert len(questions) == 1
+    assert "of Carl Clark is identical to 'Submission_Gr1a_Ada Lovelace" in capsys.readouterr().err.replace("\n", "")
+
+
+def test_confirmed_duplicates_of_other_groups_are_shared(export, tmp_path, monkeypatch):
+    _add_submission(export, "Carl Clark_34567_assignsubmission_file", "%PDF-1.4 sheet")
+    monkeypatch.setattr(file_mgmt.util, "choose_option", lambda *args: "y")
+    out = tmp_path / "out"
+
+    file_mgmt.extract_theoretical_submissions([["Ada Lovelace"], ["Carl Clark"]], export, str(out))
+
+    assert list(file_mgmt.load_duplicates(out)) == ["Submission_Gr2a_Carl Clark_34567_File 1_ --- pts.pdf"]
+    assert not (out / "Submission_Gr2a_Carl Clark_34567_File 1_ --- pts.pdf").exists()
+
+
+def test_feedback_of_duplicates_is_fanned_out(tmp_path):
+    (tmp_path / "Submission_Gr1a_Ada_12345_File 1-1_5pts.pdf").write_bytes(b"%PDF-1.4")
+    duplicates = {"Submission_Gr1b_Bob_23456_File 1-1_ --- pts.pdf": "Submission_Gr1a_Ada_12345_File 1-1_ --- pts.pdf"}
+
+    feedback = file_mgmt.find_all_feedback_files(tmp_path, duplicates, "Blatt 1")
+
+    assert feedback.groupby("student_id")["points"].sum().to_dict() == {"12345": 5.0, "23456": 5.0}
+    bob = feedback[feedback["student_id"] == "23456"].iloc[0]
+    assert bob["path"].name == "Submission_Gr1a_Ada_12345_File 1-1_5pts.pdf"
+    assert bob["filename"].startswith("Bob_23456_")
+
+
+def test_students_whose_files_were_all_held_back_are_named(export, tmp_path):
+    folder = export / "Bob Baker_23456_assignsubmission_file"
+    folder.mkdir()
+    (folder / "video.mp4").write_bytes(b"x")
+    guarded = []
+    file_mgmt.extract_all_within(export, guarded=guarded)
+
+    _, _, held_back = file_mgmt.extract_theoretical_submissions([["Ada Lovelace", "Bob Baker"]], export,
+                                                                str(tmp_path / "out"), guarded=guarded)
+
+    assert held_back == ["Bob Baker (id: 23456)"]
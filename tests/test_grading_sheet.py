@@ -0,0 +1,110 @@
+import pandas as pd
+import pytest
+
+from cer_tool import grading_sheet
+from cer_tool.grading_sheet import GradingSheet, Update
+
+
+@pytest.fixture
+def sheet_path(tmp_path):
+    path = tmp_path / "Bewertungen.csv"
+    path.write_text('"Identifier","Vollständiger Name","Bewertung","Feedback als Kommentar"\n'
+                    '"Teilnehmer/in1","Anna A","",""\n'
+                    '"Teilnehmer/in2","Bert B","",""\n'
+                    '"Teilnehmer/in3","Carl C","",""\n', encoding="utf-8")
+    return path
+
+
+def _read(path):
+    return pd.read_csv(path, index_col=0, dtype=str).fillna("")
+
+
+def test_concurrent_sheets_keep_each_others_changes(sheet_path):
+    first = GradingSheet(sheet_path)
+    second = GradingSheet(sheet_path)
+
+    first.set_points(1, 5.0)
+    first.save()
+    second.set_comment(2, ["Gut"])
+    second.save()
+    first.set_points(3, 2.5)
+    first.save()
+
+    saved = _read(sheet_path)
+    assert saved.loc["Teilnehmer/in1", "Bewertung"] == "5,0"
+    assert saved.loc["Teilnehmer/in2", "Feedback als Kommentar"] == "<p>Gut</p>"
+    assert saved.loc["Teilnehmer/in3", "Bewertung"] == "2,5"
+    assert not list(sheet_path.parent.glob(".*"))
+
+
+def test_filtered_sheet_drops_own_earlier_changes(sheet_path):
+    gs = GradingSheet(sheet_path)
+    gs.set_points(1, 5.0)
+    gs.save()
+
+    gs.filter([2])
+    gs.save()
+
+    assert list(_read(sheet_path).index) == ["Teilnehmer/in2"]
+
+
+def test_filtered_save_with_column_added_by_others(sheet_path):
+    gs = GradingSheet(sheet_path)
+    gs.filter([1])
+    other = _read(sheet_path)
+    other["Zuletzt geändert"] = ["", "heute", ""]
+    other.to_csv(sheet_path)
+
+    gs.apply_updates({1: Update(4.0, ["Fein"], ["-- CT"])})
+    gs.save()
+
+    saved = _read(sheet_path)
+    assert list(saved.index) == ["Teilnehmer/in1", "Teilnehmer/in2"]
+    assert saved.loc["Teilnehmer/in1", "Feedback als Kommentar"] == "<p>Fein</p><p>-- CT</p>"
+
+
+def test_apply_updates(sheet_path):
+    gs = GradingSheet(sheet_path)
+    gs.set_comment(3, ["Alt"])
+
+    gs.apply_updates({
+        1: Update(9.5, ["Sehr gut", "Weiter so"]),
+        2: Update(comment="<p>HTML</p>", append=["-- CT"]),
+        3: Update(append=["-- CT"]),
+    })
+    gs.save()
+
+    saved = _read(sheet_path)
+    assert list(saved["Bewertung"]) == ["9,5", "", ""]
+    assert list(saved["Feedback als Kommentar"]) == ["<p>Sehr gut</p><p>Weiter so</p>", "<p>HTML</p><p>-- CT</p>",
+                                                     "<p>Alt</p><p>-- CT</p>"]
+
+
+def test_apply_updates_with_unknown_ids_changes_nothing(sheet_path):
+    gs = GradingSheet(sheet_path)
+
+    with pytest.raises(SystemExit):
+        gs.apply_updates({1: Update(5.0), 42: Update(1.0)})
+
+    assert gs.get_points(1) is None
+    assert not gs.changed
+
+
+def test_locked_sheet_is_reported_on_windows(sheet_path, monkeypatch, capsys):
+    class Msvcrt:
+        LK_LOCK, LK_UNLCK = 1, 0
+
+        @staticmethod
+        def locking(fileno, mode, size):
+            raise OSError("still locked")
+
+    monkeypatch.setattr(grading_sheet.platform, "system", lambda: "Windows")
+    monkeypatch.setattr(grading_sheet, "msvcrt", Msvcrt, raising=False)
+    monkeypatch.setattr(grading_sheet, "_LOCK_ATTEMPTS", 3)
+
+    with pytest.raises(SystemExit):
+        GradingSheet(sheet_path)
+
+    err = capsys.readouterr().err
+    assert err.count("is locked by another command") == 1
+    assert "still locked after 30 seconds" in err and ".lock'" in err
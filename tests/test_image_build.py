@@ -0,0 +1,98 @@
+import os
+
+import pytest
+
+from cer_tool import file_mgmt, image_build, util
+
+
+@pytest.mark.parametrize("instruction, expected", [
+    ("RUN pip install --no-cache-dir -r requirements.txt",
+     "RUN --mount=type=cache,target=/root/.cache/pip pip install -r requirements.txt"),
+    ("RUN apt-get update", "RUN apt-get update"),
+    ("RUN apt-get install -y gcc",
+     "RUN --mount=type=cache,target=/var/cache/apt,sharing=locked "
+     "rm -f /etc/apt/apt.conf.d/docker-clean; apt-get install -y gcc"),
+    ('RUN ["pip", "install", "numpy"]', 'RUN ["pip", "install", "numpy"]'),
+    ("COPY requirements.txt .", "COPY requirements.txt ."),
+])
+def test_with_cache_mounts(instruction, expected):
+    assert image_build._with_cache_mounts(instruction) == expected
+
+
+def test_apt_package_lists_are_not_hidden():
+    # lists written into the layer of 'apt-get update' must stay visible to a later 'apt-get install'
+    assert "/var/lib/apt" not in image_build._with_cache_mounts("RUN apt-get install -y gcc")
+
+
+@pytest.mark.parametrize("instruction, expected", [
+    ("COPY requirements.txt /app/", ["requirements.txt"]),
+    ("COPY --chown=1000:1000 a.py b.py /app/", ["a.py", "b.py"]),
+    ('COPY ["tests dir", "/app/tests"]', ["tests dir"]),
+    ("COPY ${exercise}/python /app/", ["pex1/python"]),
+    ("COPY --from=builder /venv /venv", []),
+    ("ADD https://example.org/data.csv /app/", []),
+    ("COPY $unknown /app/", None),
+])
+def test_copy_sources(instruction, expected):
+    assert image_build._copy_sources(instruction, {"exercise": "pex1"}) == expected
+
+
+def test_stage_context(tmp_path):
+    package = tmp_path / "sc_pex1_grading"
+    (package / "pex1" / "python").mkdir(parents=True)
+    (package / "pex1" / "python" / "sc_pex1_sol.ipynb").write_text("{}")
+    (package / "requirements.txt").write_text("numpy\n")
+    (package / "Dockerfile").write_text("# syntax=docker/dockerfile:1\n"
+                                        "FROM python:3.12\n"
+                                        "ARG exercise\n"
+                                        "COPY requirements.txt /app/\n"
+                                        "RUN pip install \\\n    -r /app/requirements.txt\n")
+
+    context = image_build.stage_context(package, {"exercise": "pex1"})
+    try:
+        assert sorted(path.name for path in context.iterdir()) == ["Dockerfile", "requirements.txt"]
+        assert (context / "Dockerfile").read_text().splitlines() == [
+            "# syntax=docker/dockerfile:1",
+            "FROM python:3.12",
+            "ARG exercise",
+            "COPY requirements.txt /app/",
+            "RUN --mount=type=cache,target=/root/.cache/pip pip install -r /app/requirements.txt",
+        ]
+    finally:
+        file_mgmt.cleanup()
+
+
+def test_failed_buildkit_build_is_retried_with_the_package(tmp_path, monkeypatch):
+    (tmp_path / "Dockerfile").write_text("FROM python:3.12\n")
+    commands = []
+
+    async def run_command_async(command, show_output=False, on_cancel=None, env=None):
+        commands.append((command, env["DOCKER_BUILDKIT"]))
+        return False, "ERROR: BuildKit is enabled but the buildx component is missing or broken."
+
+    monkeypatch.setattr(util, "run_command_async", run_command_async)
+    monkeypatch.setattr(util, "run_command", lambda command, show_output=True: commands.append((command, None)))
+
+    image_build.build_image(tmp_path, "pex1-docker", {"exercise": "pex1"})
+
+    assert len(commands) == 2 and commands[0][1] == "1"
+    assert commands[1] == (["docker", "build", "-t", "pex1-docker", "--build-arg", "exercise=pex1", str(tmp_path)], None)
+    assert "DOCKER_BUILDKIT" not in os.environ
+    file_mgmt.cleanup()
+
+
+def test_failed_build_is_not_repeated(tmp_path, monkeypatch):
+    (tmp_path / "Dockerfile").write_text("FROM python:3.12\nRUN pip install not-a-package\n")
+    commands = []
+
+    async def run_command_async(command, show_output=False, on_cancel=None, env=None):
+        commands.append(command)
+        return False, "ERROR: No matching distribution found for not-a-package"
+
+    monkeypatch.setattr(util, "run_command_async", run_command_async)
+    monkeypatch.setattr(util, "run_command", lambda command, show_output=True: commands.append(command))
+
+    with pytest.raises(SystemExit):
+        image_build.build_image(tmp_path, "pex1-docker", {"exercise": "pex1"})
+    assert len(commands) == 1
+    file_mgmt.cleanup()
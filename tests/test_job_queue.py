@@ -0,0 +1,98 @@
+import multiprocessing
+import time
+
+import pytest
+
+from cer_tool import job_queue, pex_grading
+from cer_tool.job_queue import JobQueue
+
+
+@pytest.fixture
+def queue(tmp_path):
+    return JobQueue(tmp_path / "jobs.sqlite3")
+
+
+@pytest.fixture
+def notebook(tmp_path):
+    path = tmp_path / "sc-pex1.ipynb"
+    path.write_text('{"cells": []}')
+    return path
+
+
+def _claim_all(path, worker):
+    queue = JobQueue(path)
+    claimed = []
+    while (job := queue.claim("pex1", worker)) is not None:
+        claimed.append(job[0])
+    return claimed
+
+
+def test_claim_and_complete(queue, notebook):
+    job_id = queue.submit("pex1", notebook)
+
+    assert queue.claim("pex2", "worker") is None
+    assert queue.claim("pex1", "worker") == (job_id, "sc-pex1.ipynb", b'{"cells": []}')
+    assert queue.claim("pex1", "other worker") is None
+    assert queue.status(job_id)[:2] == ("running", "worker")
+
+    queue.complete(job_id, {"points": 3})
+    assert queue.wait_for_result(job_id) == {"points": 3}
+
+
+def test_released_job_is_claimed_again(queue, notebook):
+    job_id = queue.submit("pex1", notebook)
+    queue.claim("pex1", "stopped worker")
+
+    queue.release(job_id)
+
+    assert queue.status(job_id)[0] == "pending"
+    assert queue.claim("pex1", "worker")[0] == job_id
+
+
+def test_stale_job_is_claimed_again_until_attempts_are_used_up(queue, notebook, monkeypatch):
+    job_id = queue.submit("pex1", notebook)
+    queue.claim("pex1", "killed worker")
+    monkeypatch.setattr(job_queue, "_STALE_AFTER_SECONDS", -1)
+
+    for attempt in range(2, job_queue._MAX_ATTEMPTS + 1):
+        assert queue.claim("pex1", f"worker {attempt}")[0] == job_id
+    assert queue.claim("pex1", "last worker") is None
+
+    with pytest.raises(RuntimeError, match="abandoned by worker worker 3 after 3 attempt/s"):
+        queue.wait_for_result(job_id)
+
+
+def test_failed_job_is_retried_a_limited_number_of_times(queue, notebook):
+    job_id = queue.submit("pex1", notebook)
+
+    for _ in range(job_queue._MAX_ATTEMPTS - 1):
+        queue.claim("pex1", "worker")
+        assert not queue.fail(job_id, "LookupError: 0 results found for '*.json'")
+    queue.claim("pex1", "worker")
+    assert queue.fail(job_id, "LookupError: 0 results found for '*.json'")
+
+    assert queue.claim("pex1", "worker") is None
+    with pytest.raises(RuntimeError, match="0 results found"):
+        queue.wait_for_result(job_id)
+
+
+def test_workers_in_several_processes_claim_each_job_once(queue, notebook):
+    job_ids = [queue.submit("pex1", notebook) for _ in range(40)]
+
+    with multiprocessing.Pool(4) as pool:
+        claimed = pool.starmap(_claim_all, [(queue.path, f"worker {i}") for i in range(4)])
+
+    assert sorted(job_id for worker_jobs in claimed for job_id in worker_jobs) == job_ids
+
+
+def test_failing_grading_does_not_stop_the_worker(queue, notebook):
+    class Grader:
+        async def grade_async(self, submission, print_output=True, interactive=True, run_preflight=True):
+            assert not interactive
+            raise LookupError("2 results found for '*.json'")
+
+    job_id = queue.submit("pex1", notebook)
+
+    assert not pex_grading.process_job(Grader(), queue, queue.claim("pex1", "worker"))
+    assert queue.status(job_id)[0] == "pending"
+    assert "2 results found" in queue.error(job_id)
@@ -0,0 +1,65 @@
+import pytest
+
+from cer_tool import pdf_optimizer, util
+
+
+@pytest.fixture(autouse=True)
+def settings(config_override):
+    config_override("pdf_optimization", min_file_bytes=1_000, min_saving_ratio=0.2)
+
+
+@pytest.fixture
+def ghostscript(monkeypatch):
+    # writes an optimized file of the given size instead of running ghostscript
+    commands = []
+
+    def run(optimized_size):
+        def run_potentially_failing_command(command, on_cancel=None):
+            commands.append(command)
+            target = command[-2].removeprefix("-sOutputFile=")
+            with open(target, "wb") as f:
+                f.write(b"x" * optimized_size)
+            return True, ""
+        monkeypatch.setattr(util, "run_potentially_failing_command", run_potentially_failing_command)
+        return commands
+    return run
+
+
+@pytest.fixture
+def source(tmp_path):
+    path = tmp_path / "annotated.pdf"
+    path.write_bytes(b"x" * 10_000)
+    return path
+
+
+def test_small_files_are_not_optimized(tmp_path, ghostscript):
+    small = tmp_path / "small.pdf"
+    small.write_bytes(b"x" * 999)
+    commands = ghostscript(100)
+
+    assert pdf_optimizer.optimize(small, tmp_path / "optimized.pdf") == small
+    assert commands == []
+
+
+def test_original_is_kept_if_not_sufficiently_smaller(source, tmp_path, ghostscript):
+    ghostscript(8_500)
+
+    assert pdf_optimizer.optimize(source, tmp_path / "optimized.pdf") == source
+    assert not (tmp_path / "optimized.pdf").exists()
+
+
+def test_optimized_file_is_used_if_sufficiently_smaller(source, tmp_path, ghostscript):
+    ghostscript(7_000)
+
+    assert pdf_optimizer.optimize(source, tmp_path / "optimized.pdf") == tmp_path / "optimized.pdf"
+
+
+def test_original_is_used_if_ghostscript_fails(source, tmp_path, monkeypatch):
+    def missing_ghostscript(command, on_cancel=None):
+        raise FileNotFoundError(f"No such file or directory: '{command[0]}'")
+    monkeypatch.setattr(util, "run_potentially_failing_command", missing_ghostscript)
+
+    assert pdf_optimizer.optimize(source, tmp_path / "optimized.pdf") == source
+
+    monkeypatch.setattr(util, "run_potentially_failing_command", lambda command, on_cancel=None: (False, "damaged"))
+    assert pdf_optimizer.optimize(source, tmp_path / "optimized.pdf") == source
@@ -0,0 +1,50 @@
+import pytest
+
+from cer_tool import pdf_points
+
+pypdf = pytest.importorskip("pypdf")
+from pypdf.annotations import FreeText
+
+
+@pytest.fixture(autouse=True)
+def enabled(config_override):
+    config_override("pdf_points", enabled=True)
+
+
+def _pdf(path, annotation: str | None = None):
+    writer = pypdf.PdfWriter()
+    writer.add_blank_page(200, 200)
+    if annotation is not None:
+        writer.add_annotation(0, FreeText(text=annotation, rect=(10, 10, 100, 50)))
+    with open(path, "wb") as f:
+        writer.write(f)
+    return path
+
+
+def test_points_of_an_annotation_are_cached(tmp_path, monkeypatch):
+    pdf = _pdf(tmp_path / "feedback.pdf", "Punkte: 9,5")
+    cache = {}
+
+    assert pdf_points.cached_points(pdf, tmp_path, cache) == 9.5
+    monkeypatch.setattr(pdf_points, "read_points", lambda path: pytest.fail("read again"))
+    assert pdf_points.cached_points(pdf, tmp_path, cache) == 9.5
+
+
+def test_unreadable_pdfs_are_not_cached(tmp_path, capsys):
+    pdf = tmp_path / "broken.pdf"
+    pdf.write_bytes(b"%PDF-1.4 broken")
+    cache = {}
+
+    assert pdf_points.cached_points(pdf, tmp_path, cache) is None
+    assert pdf_points.cached_points(pdf, tmp_path, cache) is None
+
+    assert cache == {}
+    assert capsys.readouterr().err.count("Could not read points from 'broken.pdf'") == 2
+
+
+def test_pdfs_without_points_are_cached(tmp_path):
+    pdf = _pdf(tmp_path / "feedback.pdf")
+    cache = {}
+
+    assert pdf_points.cached_points(pdf, tmp_path, cache) is None
+    assert cache["feedback.pdf"][2] is None
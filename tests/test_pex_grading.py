@@ -0,0 +1,117 @@
+from pathlib import Path
+
+import pytest
+
+from cer_tool import file_mgmt, grading_sheet, pex_grading, util
+
+
+class _FakeGrader:
+    pex_name = "pex1"
+
+    def __init__(self):
+        self.calls = []
+
+    async def grade_async(self, submission: Path, print_output: bool = True, interactive: bool = True,
+                          run_preflight: bool = True):
+        self.calls.append(interactive if run_preflight else "without pre-flight check")
+        if not interactive:
+            raise LookupError("2 results found for '*.json'")
+        return pex_grading.PexFeedback(3, "output", "")
+
+    def cleanup(self):
+        pass
+
+
+def test_find_single_path_does_not_ask_when_not_interactive(tmp_path):
+    (tmp_path / "a.json").touch()
+    (tmp_path / "b.json").touch()
+
+    with pytest.raises(LookupError):
+        file_mgmt.find_single_path("*.json", tmp_path, interactive=False)
+    with pytest.raises(LookupError):
+        file_mgmt.find_single_path("*.txt", tmp_path, interactive=False)
+
+
+def test_look_ahead_grades_again_in_foreground_after_failure(tmp_path):
+    grader = _FakeGrader()
+    look_ahead = pex_grading.LookAheadGrader(grader, 1)
+    try:
+        look_ahead.schedule([tmp_path / "a.ipynb"])
+        feedback = look_ahead.grade(tmp_path / "a.ipynb")
+    finally:
+        look_ahead.cleanup()
+
+    assert feedback.points == 3
+    assert grader.calls == [False, True]
+
+
+def test_look_ahead_regrades_without_pre_flight_check(tmp_path):
+    grader = _FakeGrader()
+    look_ahead = pex_grading.LookAheadGrader(grader, 1)
+    try:
+        feedback = look_ahead.grade(tmp_path / "a.ipynb", run_preflight=False)
+    finally:
+        look_ahead.cleanup()
+
+    assert feedback.points == 3
+    assert grader.calls == ["without pre-flight check"]
+
+
+@pytest.fixture
+def sheet(tmp_path):
+    path = tmp_path / "Bewertungen.csv"
+    path.write_text('"Identifier","Vollständiger Name","Bewertung","Feedback als Kommentar"\n'
+                    '"Teilnehmer/in1","Anna A","",""\n', encoding="utf-8")
+    return grading_sheet.GradingSheet(path)
+
+
+def _stored(results_db, course, output):
+    return pex_grading.PexFeedback(2, output, "", [results_db.TestResult("add", "public", 2.0, "")],
+                                   1.5, "hash").as_stored(course, "pex1", ["Anna A"], [1])
+
+
+def test_gradings_of_other_courses_are_ignored(results_db, sheet, tmp_path):
+    results_db.save_grading(_stored(results_db, results_db.course_key(tmp_path / "last-semester.csv"), "old"))
+
+    assert not pex_grading.has_feedback([1], sheet, "pex1")
+    assert results_db.load_graded_ids(results_db.course_key(sheet.path), "pex1") == set()
+
+    results_db.save_grading(_stored(results_db, results_db.course_key(sheet.path), "new"))
+    assert pex_grading.has_feedback([1], sheet, "pex1")
+
+
+def test_loading_prefers_the_grading_sheet(results_db, sheet, monkeypatch):
+    results_db.save_grading(_stored(results_db, results_db.course_key(sheet.path), "graded"))
+    # e.g. changed with 'edit-feedback' after grading
+    sheet.set_points(1, 3.0)
+    sheet.set_comment(1, pex_grading.PexFeedback(3, "edited", "").as_html(), encode=False)
+    answers = iter(["l", "f"])
+    monkeypatch.setattr(util, "choose_option", lambda *args: next(answers))
+    monkeypatch.setattr(util, "clear_console", lambda *args: None)
+
+    pex_grading.grade_pex_group(["Anna A"], [1], sheet.path, _FakeGrader(), sheet)
+
+    stored = results_db.load_grading(results_db.course_key(sheet.path), "pex1", 1)
+    assert (stored.points, stored.test_output) == (3.0, "edited")
+    assert stored.test_results == [results_db.TestResult("add", "public", 2.0, "")]
+    assert sheet.get_points(1) == 3.0
+
+
+def test_max_points_are_recorded_once_from_the_solution(results_db, tmp_path):
+    class Grader:
+        pex_name = "pex1"
+        graded = []
+
+        def solution(self):
+            return tmp_path / "sc_pex1_sol.ipynb"
+
+        def grade(self, submission, run_preflight=True):
+            self.graded.append(submission)
+            return pex_grading.PexFeedback(3, "output", "", [results_db.TestResult("add", "public", 3.0, "")])
+
+    pex_grading.record_max_points(Grader(), "course.csv")
+    pex_grading.record_max_points(Grader(), "course.csv")
+
+    assert Grader.graded == [tmp_path / "sc_pex1_sol.ipynb"]
+    assert results_db.has_max_points("course.csv", "pex1")
+    assert not results_db.has_max_points("other-course.csv", "pex1")
@@ -0,0 +1,55 @@
+from argparse import Namespace
+
+import pandas as pd
+
+from cer_tool import command_handlers, pex_report
+
+
+def _test_results(rows):
+    return pd.DataFrame(rows, columns=["grading_id", "exercise", "test_function", "test_case", "points", "max_points"])
+
+
+def test_statistics_uses_max_points_of_the_solution():
+    stats = pex_report.test_statistics(_test_results([
+        (1, "pex1", "add", "public", 2.0, 2.0),
+        (2, "pex1", "add", "public", 1.0, 2.0),
+        # failed by every group
+        (1, "pex1", "mul", "public", 0.0, 3.0),
+        (2, "pex1", "mul", "public", 0.0, 3.0),
+    ]))
+
+    assert list(stats.index.get_level_values("test_function")) == ["mul", "add"]
+    assert stats.loc[("pex1", "mul", "public"), "fail_rate"] == 1.0
+    assert stats.loc[("pex1", "add", "public"), "fail_rate"] == 0.5
+    assert stats.loc[("pex1", "mul", "public"), "max_points"] == 3.0
+
+
+def test_statistics_without_max_points_are_unknown():
+    stats = pex_report.test_statistics(_test_results([
+        (1, "pex1", "add", "public", 0.0, None),
+        (2, "pex1", "add", "public", 0.0, None),
+        (1, "pex1", "mul", "public", 1.0, 2.0),
+        (2, "pex1", "mul", "public", 2.0, 2.0),
+    ]))
+
+    # failed by every group, which is not the same as failed by none
+    assert pd.isna(stats.loc[("pex1", "add", "public"), "fail_rate"])
+    assert pd.isna(stats.loc[("pex1", "add", "public"), "failed"])
+    assert list(stats.index.get_level_values("test_function")) == ["mul", "add"]
+
+
+def test_pex_report_command(results_db, tmp_path, capsys):
+    results_db.save_max_points("course.csv", "pex1", [results_db.TestResult("add", "public", 2.0, "")])
+    for name, ids, points in [("Ada", [1], 3.0), ("Bob", [2, 3], 1.0)]:
+        results_db.save_grading(results_db.StoredGrading("course.csv", "pex1", name, ids, points, "output", "", [
+            results_db.TestResult("add", "public", points - 1, ""),
+            results_db.TestResult("mul", "private", 1.0, "wrong"),
+        ], 1.5, "hash"))
+    out = tmp_path / "results.csv"
+
+    command_handlers.pex_report(Namespace(exercise=["pex1"], out=str(out)))
+
+    assert "Most frequently failed tests" in capsys.readouterr().out
+    exported = pd.read_csv(out)
+    assert len(exported) == 4
+    assert set(exported["max_points"].dropna()) == {2.0}
@@ -0,0 +1,50 @@
+import json
+
+import pytest
+
+from cer_tool import preflight
+
+
+def _notebook(path, *sources, **content):
+    content.setdefault("cells", [{"cell_type": "code", "source": source} for source in sources])
+    path.write_text(json.dumps(content), encoding="utf-8")
+    return path
+
+
+@pytest.mark.parametrize("sources, reason", [
+    (["import numpy as np\n", "def add(a, b):\n    return a + b\n"], None),
+    # IPython syntax is no syntax error
+    (["%matplotlib inline\n!pip install numpy\nnp.sum?\n", "def add(a, b):\n    return a + b\n"], None),
+    (["%%html\n<b>not python</b>\n", "add = lambda a, b: a + b\n"], None),
+    (["def mul(a, b):\n    return a * b\n"], "none of the required functions is defined (add)"),
+    (["   \n"], "the notebook does not contain any code"),
+    (["def add(a, b)\n    return a + b\n"], "syntax error in code cell 1, line 1"),
+])
+def test_check(tmp_path, sources, reason):
+    result = preflight.check(_notebook(tmp_path / "sc-pex1.ipynb", *sources), {"add"})
+
+    assert result == reason if reason is None else result.startswith(reason)
+
+
+def test_check_without_cells_is_left_to_the_tests(tmp_path):
+    # nbformat 3 stores the cells in worksheets
+    notebook = tmp_path / "sc-pex1.ipynb"
+    notebook.write_text(json.dumps({"nbformat": 3, "worksheets": [{"cells": []}]}), encoding="utf-8")
+
+    assert preflight.check(notebook, {"add"}) is None
+
+
+def test_check_invalid_files(tmp_path):
+    (tmp_path / "broken.ipynb").write_text("{", encoding="utf-8")
+
+    assert preflight.check(tmp_path / "broken.ipynb", set()) == "'broken.ipynb' is no valid notebook file"
+    assert preflight.check(_notebook(tmp_path / "sc-pex1-checkpoint.ipynb", "x = 1"), set()).startswith(
+        "'sc-pex1-checkpoint.ipynb' is a checkpoint file")
+
+
+def test_expected_names_are_referenced_by_the_tests(tmp_path):
+    solution = _notebook(tmp_path / "sc_pex1_sol.ipynb", "def add(a, b):\n    return a + b\n\ndef helper():\n    pass\n")
+    (tmp_path / "tests").mkdir()
+    (tmp_path / "tests" / "test_add.py").write_text("from notebook import add\n", encoding="utf-8")
+
+    assert preflight.expected_names(tmp_path, solution) == {"add"}
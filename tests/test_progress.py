@@ -0,0 +1,67 @@
+import threading
+import time
+
+import pytest
+
+from cer_tool import progress
+
+
+@pytest.fixture(autouse=True)
+def fresh_state(monkeypatch):
+    monkeypatch.setattr(progress, "_phases", {})
+    monkeypatch.setattr(progress, "_measures", {})
+
+
+def test_throughput_of_parallel_records_uses_wall_clock_time():
+    def extract():
+        time.sleep(0.2)
+        progress.record("extracted_bytes", 1e6, 0.2)
+
+    threads = [threading.Thread(target=extract) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    # four threads extracting 1 MB in 0.2 s each at the same time, not one after another
+    assert progress.throughput("extracted_bytes") > 10e6
+    assert progress.mean_seconds("extracted_bytes") == pytest.approx(0.2)
+
+
+def test_metrics_are_written_from_several_threads(tmp_path, config_override):
+    config_override("metrics", textfile_directory=str(tmp_path))
+    progress.start("grade-pex", 100)
+
+    def grade():
+        for _ in range(50):
+            progress.record("docker_runs", 1, 0.01)
+            progress.write_metrics()
+
+    thread = threading.Thread(target=grade)
+    thread.start()
+    for _ in range(50):
+        progress.advance("grade-pex")
+    thread.join()
+
+    metrics = next(tmp_path.glob("cer_tool_*.prom")).read_text(encoding="utf-8")
+    assert 'cer_tool_items_done{phase="grade-pex"' in metrics
+    assert "cer_tool_docker_runs_total" in metrics
+
+
+def test_metrics_folder_is_created(tmp_path, config_override):
+    config_override("metrics", textfile_directory=str(tmp_path / "node-exporter" / "textfiles"))
+
+    progress.start("grade-pex", 3)
+
+    assert list((tmp_path / "node-exporter" / "textfiles").glob("cer_tool_*.prom"))
+
+
+def test_unwritable_metrics_do_not_stop_the_grading(tmp_path, monkeypatch, config_override, capsys):
+    monkeypatch.setattr(progress, "_failed", False)
+    (tmp_path / "file").touch()
+    config_override("metrics", textfile_directory=str(tmp_path / "file" / "textfiles"))
+
+    progress.start("grade-pex", 3)
+    progress.advance("grade-pex")
+
+    assert capsys.readouterr().err.count("Could not write metrics") == 1
@@ -0,0 +1,69 @@
+import pytest
+
+from cer_tool import roster
+from cer_tool.grading_sheet import GradingSheet
+
+
+@pytest.fixture(autouse=True)
+def roster_db(tmp_path, monkeypatch):
+    monkeypatch.setattr(roster, "_DB_PATH", tmp_path / "roster.sqlite3")
+
+
+def _sheet(path, participants):
+    path.write_text('"Identifier","Vollständiger Name","Bewertung","Feedback als Kommentar"\n'
+                    + "".join(f'"Teilnehmer/in{id}","{name}","",""\n' for id, name in participants.items()),
+                    encoding="utf-8")
+    return GradingSheet(path)
+
+
+def _no_prompt(gs):
+    def select_participant(name):
+        raise AssertionError(f"asked for '{name}'")
+    gs.select_participant = select_participant
+    return gs
+
+
+@pytest.fixture
+def groups_file(tmp_path):
+    path = tmp_path / "groups.txt"
+    path.write_text("Anna, Bert\nCarl\n", encoding="utf-8")
+    return path
+
+
+def test_resolved_ids_are_remembered(tmp_path, groups_file):
+    participants = {1: "Anna A", 2: "Bert B", 3: "Carl C"}
+    assert roster.resolve(groups_file, ["Anna", "Bert", "Carl"], _sheet(tmp_path / "gs.csv", participants)) == \
+           {"Anna": 1, "Bert": 2, "Carl": 3}
+
+    gs = _no_prompt(_sheet(tmp_path / "gs.csv", participants))
+    assert roster.resolve(groups_file, ["Anna", "Carl"], gs) == {"Anna": 1, "Carl": 3}
+    assert roster.load(groups_file) == {"Anna": 1, "Bert": 2, "Carl": 3}
+
+
+def test_ids_are_revalidated_when_the_participants_change(tmp_path, groups_file):
+    roster.resolve(groups_file, ["Anna", "Bert", "Carl"], _sheet(tmp_path / "gs.csv", {1: "Anna A", 2: "Bert B", 3: "Carl C"}))
+
+    # Anna re-enrolled with a new id, a new student joined
+    gs = _sheet(tmp_path / "gs.csv", {7: "Anna A", 2: "Bert B", 3: "Carl C", 4: "Dora D"})
+    ids = roster.resolve(groups_file, ["Anna", "Bert", "Carl"], gs)
+
+    assert ids == {"Anna": 7, "Bert": 2, "Carl": 3}
+    assert roster.load(groups_file) == {"Anna": 7, "Bert": 2, "Carl": 3}
+    # validated against the current participants, s.t. they are not checked again
+    assert roster.resolve(groups_file, ["Anna"], _no_prompt(gs)) == {"Anna": 7}
+
+
+def test_copied_groups_file_reuses_the_remembered_ids(tmp_path, groups_file, capsys):
+    participants = {1: "Anna A", 2: "Bert B", 3: "Carl C"}
+    roster.resolve(groups_file, ["Anna", "Bert", "Carl"], _sheet(tmp_path / "gs.csv", participants))
+    copy = tmp_path / "pex2" / "groups.txt"
+    copy.parent.mkdir()
+    copy.write_text("Anna, Bert\nCarl, Dora\n", encoding="utf-8")
+
+    assert roster.load(copy) == {"Anna": 1, "Bert": 2, "Carl": 3}
+    assert f"Using the Moodle ids remembered for the groups file '{groups_file}'" in capsys.readouterr().out
+
+    unrelated = tmp_path / "other.txt"
+    unrelated.write_text("Emil, Fritz\n", encoding="utf-8")
+    assert roster.load(unrelated) == {}
+    assert "No Moodle ids remembered" in capsys.readouterr().out
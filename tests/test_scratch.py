@@ -0,0 +1,48 @@
+import zipfile
+from pathlib import Path
+
+import pytest
+
+from cer_tool import file_mgmt, scratch
+
+
+@pytest.fixture
+def fast_location(tmp_path, monkeypatch, config_override):
+    location = tmp_path / "shm"
+    location.mkdir()
+    monkeypatch.setattr(scratch, "_fast_location", lambda: location)
+    # folders created by earlier tests are in the real scratch location
+    monkeypatch.setattr(scratch, "_root", None)
+    monkeypatch.setattr(scratch, "_reserved", {})
+    config_override("scratch", budget_bytes=10_000)
+    yield location
+    scratch.cleanup()
+
+
+def _zip(path: Path, files: dict) -> Path:
+    with zipfile.ZipFile(path, "w") as zip:
+        for name, content in files.items():
+            zip.writestr(name, content)
+    return path
+
+
+def test_nested_extraction_is_reserved(fast_location, tmp_path):
+    inner = _zip(tmp_path / "inner.zip", {"a.txt": "a" * 6_000})
+    outer = _zip(tmp_path / "outer.zip", {"inner.zip": inner.read_bytes()})
+
+    folder = file_mgmt.unzip_if_not_folder(outer)
+    reserved = scratch._reserved[folder.resolve()]
+    file_mgmt.extract_all_within(folder)
+
+    assert folder.is_relative_to(fast_location)
+    assert scratch._reserved[folder.resolve()] == reserved + 6_000
+    # the budget is used up by the nested archive
+    assert not scratch.new_folder(1_000).resolve().is_relative_to(fast_location)
+
+
+def test_reserve_outside_scratch_is_ignored(fast_location, tmp_path):
+    folder = scratch.new_folder(100)
+
+    scratch.reserve(tmp_path / "elsewhere", 5_000)
+
+    assert scratch._reserved == {folder.resolve(): 100}
@@ -0,0 +1,37 @@
+import json
+
+import pytest
+
+from cer_tool import similarity
+
+
+@pytest.fixture(autouse=True)
+def index(tmp_path, monkeypatch):
+    monkeypatch.setattr(similarity, "_DB_PATH", tmp_path / "similarity.sqlite3")
+
+
+def _notebook(path, code):
+    path.write_text(json.dumps({"cells": [{"cell_type": "code", "source": code}]}), encoding="utf-8")
+    return path
+
+
+_CODE = "def add(a, b):\n    result = a + b\n    return result\n\ndef mul(a, b):\n    return a * b\n"
+
+
+def test_resubmission_is_not_similar_to_itself(tmp_path):
+    similarity.update_index("pex1", [("Ada_1", _notebook(tmp_path / "old.ipynb", _CODE))])
+    similarity.update_index("pex1", [("Ada_1", _notebook(tmp_path / "new.ipynb", _CODE + "print(add(1, 2))\n"))])
+
+    assert similarity.find_clusters("pex1", 0.5) == []
+
+
+def test_notebooks_shared_within_a_group_are_not_reported(tmp_path):
+    similarity.update_index("pex1", [("Ada_1", _notebook(tmp_path / "ada.ipynb", _CODE)),
+                                     ("Bob_2", _notebook(tmp_path / "bob.ipynb", _CODE)),
+                                     ("Carl_3", _notebook(tmp_path / "carl.ipynb", _CODE + "print(mul(2, 3))\n"))])
+
+    assert similarity.find_clusters("pex1", 0.5)[0][1] == ["Ada_1", "Bob_2", "Carl_3"]
+    # Carl is only known by the id remembered for the groups file
+    clusters = similarity.find_clusters("pex1", 0.5, groups=[["Ada", "Bob"], ["Carl C"]], ids={"Carl C": 3})
+    assert len(clusters) == 1 and clusters[0][0] < 1.0
+    assert similarity.find_clusters("pex1", 0.5, groups=[["Ada", "Bob", "Carl"]]) == []
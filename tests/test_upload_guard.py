@@ -0,0 +1,71 @@
+import tarfile
+import zipfile
+
+import pytest
+
+from cer_tool import upload_guard
+
+
+@pytest.fixture(autouse=True)
+def small_limit(config_override):
+    config_override("upload_guard", max_file_bytes=100)
+
+
+_MEMBERS = {
+    "sub/sheet.pdf": b"x" * 10,
+    "__MACOSX/sub/._sheet.pdf": b"x" * 10,
+    "sub/video.bin": b"x" * 1_000,
+    "sub/nested.zip": b"x" * 1_000,
+    "sub/notebook.ipynb": b"x" * 1_000,
+}
+
+
+def _extracted(target):
+    return sorted(path.relative_to(target).as_posix() for path in target.rglob("*") if path.is_file())
+
+
+def test_zip_members_are_filtered(tmp_path):
+    archive = tmp_path / "upload.zip"
+    with zipfile.ZipFile(archive, "w") as zip:
+        for name, content in _MEMBERS.items():
+            zip.writestr(name, content)
+    guarded = []
+
+    assert upload_guard.extract_archive(archive, tmp_path / "upload", guarded, keep_patterns=("*.ipynb",))
+
+    assert _extracted(tmp_path / "upload") == ["sub/nested.zip", "sub/notebook.ipynb", "sub/sheet.pdf"]
+    assert {(file.member, file.reason) for file in guarded} == {("__MACOSX/sub/._sheet.pdf", "irrelevant"),
+                                                                ("sub/video.bin", "oversized")}
+
+    oversized = next(file for file in guarded if file.reason == "oversized")
+    upload_guard.quarantine(oversized, tmp_path / "quarantine" / "video.bin")
+    assert (tmp_path / "quarantine" / "video.bin").read_bytes() == _MEMBERS["sub/video.bin"]
+
+
+def test_tar_members_are_filtered(tmp_path):
+    source = tmp_path / "source"
+    for name, content in _MEMBERS.items():
+        (source / name).parent.mkdir(parents=True, exist_ok=True)
+        (source / name).write_bytes(content)
+    archive = tmp_path / "upload.tar.gz"
+    with tarfile.open(archive, "w:gz") as tar:
+        tar.add(source / "sub", "sub")
+    guarded = []
+
+    assert upload_guard.extract_archive(archive, tmp_path / "upload", guarded)
+
+    assert _extracted(tmp_path / "upload") == ["sub/nested.zip", "sub/sheet.pdf"]
+    assert sorted(file.member for file in guarded) == ["sub/notebook.ipynb", "sub/video.bin"]
+
+
+def test_other_formats_are_not_handled(tmp_path):
+    archive = tmp_path / "upload.7z"
+    archive.write_bytes(b"7z")
+
+    assert not upload_guard.extract_archive(archive, tmp_path / "upload", [])
+
+
+def test_submitted_documents_are_not_held_back_for_their_size():
+    assert upload_guard.check("sub/Scan.PDF", 1_000) is None
+    assert upload_guard.check("sub/scan.png", 1_000) == "oversized"
+    assert upload_guard.check("__MACOSX/sub/._scan.pdf", 1_000) == "irrelevant"
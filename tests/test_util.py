@@ -0,0 +1,43 @@
+import asyncio
+import sys
+import threading
+import time
+
+import pytest
+
+from cer_tool import util
+
+
+_SLEEP = [sys.executable, "-c", "import time; time.sleep(0.3)"]
+
+
+@pytest.fixture
+def one_slot():
+    util.set_max_concurrent_commands(1)
+    yield
+    util.set_max_concurrent_commands(util.os.cpu_count() or 1)
+
+
+def test_command_limit_applies_to_all_event_loops(one_slot):
+    # e.g. the look-ahead grading in its own thread and a build in the main thread
+    thread = threading.Thread(target=lambda: asyncio.run(util.run_command_async(_SLEEP)))
+    started = time.perf_counter()
+    thread.start()
+    asyncio.run(util.run_command_async(_SLEEP))
+    thread.join()
+
+    assert time.perf_counter() - started >= 0.6
+
+
+def test_cancelled_command_does_not_keep_its_slot(one_slot):
+    async def cancel_waiting_command():
+        running = asyncio.create_task(util.run_command_async(_SLEEP))
+        await asyncio.sleep(0.1)
+        waiting = asyncio.create_task(util.run_command_async(_SLEEP))
+        await asyncio.sleep(0.1)
+        waiting.cancel()
+        await asyncio.gather(running, waiting, return_exceptions=True)
+
+    asyncio.run(cancel_waiting_command())
+
+    assert util._command_slots.acquire(blocking=False)